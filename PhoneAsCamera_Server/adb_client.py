@@ -0,0 +1,265 @@
+"""
+Клиент сервера ADB по его сокетному протоколу (localhost:5037) - без запуска adb.exe на каждую команду.
+
+Запрос: длина текста в 4 hex-цифрах + текст службы, например "000Chost:version".
+Ответ: 'OKAY' или 'FAIL' + длина (4 hex) + сообщение об ошибке; данные (список
+устройств, версия) приходят так же - длина в 4 hex-цифрах и текст.
+
+Сервер ADB закрывает соединение после каждого запроса host:*, поэтому держать
+открытым можно только host:track-devices: DeviceTracker получает по нему
+список устройств при каждом изменении (подключение, отключение, авторизация),
+и AdbClient.devices() отвечает из этого кеша без обращения к серверу.
+Если сервер ADB не запущен, AdbClient запускает его через start_server
+(для настоящего ADB - "adb start-server", см. adb_tools) и повторяет запрос.
+Для проверки без adb и телефона - fake_adb_server.py.
+"""
+import socket
+import threading
+
+ADB_HOST = '127.0.0.1'
+ADB_PORT = 5037
+ADB_TIMEOUT = 2.0
+# Пауза перед повторным подключением отслеживания устройств после ошибки (секунды).
+TRACK_RETRY_INTERVAL = 1.0
+
+
+class AdbError(Exception):
+    """Сервер ADB ответил FAIL или недоступен."""
+
+
+def parse_devices(text):
+    """Ответ host:devices ("serial\\tstate\\n...") -> {serial: state}."""
+    devices = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            devices[parts[0]] = parts[1]
+    return devices
+
+
+def _encode_request(service):
+    data = service.encode('utf-8')
+    return f"{len(data):04x}".encode('ascii') + data
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("Сервер ADB закрыл соединение")
+        data += chunk
+    return bytes(data)
+
+
+def _read_string(sock):
+    """Строка ответа: длина в 4 hex-цифрах + текст."""
+    length = _recv_exact(sock, 4)
+    try:
+        size = int(length, 16)
+    except ValueError:
+        raise AdbError(f"Некорректный ответ сервера ADB: {length!r}")
+    return _recv_exact(sock, size).decode('utf-8', 'replace')
+
+
+def _read_status(sock):
+    status = _recv_exact(sock, 4)
+    if status == b'OKAY':
+        return
+    if status == b'FAIL':
+        raise AdbError(_read_string(sock))
+    raise AdbError(f"Некорректный ответ сервера ADB: {status!r}")
+
+
+class AdbClient:
+    """
+    Запросы к серверу ADB. Версия сервера кешируется, список устройств берется
+    из DeviceTracker, если отслеживание запущено (track_devices()).
+    start_server() - запуск сервера ADB, если он не отвечает (None - не запускать).
+    Методы потокобезопасны.
+    """
+
+    def __init__(self, host=ADB_HOST, port=ADB_PORT, timeout=ADB_TIMEOUT, start_server=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.start_server = start_server
+        self.tracker = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _connect(self, start=True):
+        timeout = self.timeout
+        try:
+            return socket.create_connection((self.host, self.port), timeout)
+        except ConnectionRefusedError:
+            if not (start and self.start_server):
+                raise AdbError(f"Сервер ADB не запущен ({self.host}:{self.port})")
+        with self._lock:
+            # Сервер мог запустить другой поток, пока этот ждал блокировку.
+            try:
+                return socket.create_connection((self.host, self.port), timeout)
+            except ConnectionRefusedError:
+                print("[*] Сервер ADB не запущен, запуск...")
+                ok, error = self.start_server()
+                if not ok:
+                    raise AdbError(f"Не удалось запустить сервер ADB: {error}")
+        try:
+            return socket.create_connection((self.host, self.port), timeout)
+        except OSError as e:
+            raise AdbError(f"Нет связи с сервером ADB: {e}")
+
+    def _open(self, service, start=True):
+        """
+        Отправляет запрос и возвращает сокет после OKAY (закрывает его вызывающий).
+        start=False - не запускать сервер ADB, если он не отвечает.
+        """
+        try:
+            sock = self._connect(start)
+        except OSError as e:
+            raise AdbError(f"Нет связи с сервером ADB: {e}")
+        try:
+            sock.sendall(_encode_request(service))
+            _read_status(sock)
+        except OSError as e:
+            sock.close()
+            raise AdbError(f"Ошибка связи с сервером ADB: {e}")
+        except AdbError:
+            sock.close()
+            raise
+        return sock
+
+    def _query(self, service):
+        """Запрос со строкой в ответе (host:version, host:devices)."""
+        sock = self._open(service)
+        try:
+            return _read_string(sock)
+        except OSError as e:
+            raise AdbError(f"Ошибка связи с сервером ADB: {e}")
+        finally:
+            sock.close()
+
+    def _command(self, service):
+        """Запрос forward/killforward: первый OKAY - устройство найдено, второй - результат."""
+        sock = self._open(service)
+        try:
+            _read_status(sock)
+        except OSError as e:
+            raise AdbError(f"Ошибка связи с сервером ADB: {e}")
+        finally:
+            sock.close()
+
+    @staticmethod
+    def _prefix(serial):
+        return f"host-serial:{serial}" if serial else "host"
+
+    def version(self):
+        """Версия протокола сервера ADB (число); кешируется."""
+        if self._version is None:
+            self._version = int(self._query('host:version'), 16)
+        return self._version
+
+    def devices(self):
+        """{serial: state} - state 'device', 'unauthorized', 'offline' и т. п."""
+        tracker = self.tracker
+        if tracker is not None and tracker.devices is not None:
+            return dict(tracker.devices)
+        return parse_devices(self._query('host:devices'))
+
+    def forward(self, local, remote, serial=None, rebind=True):
+        """Проброс порта, например forward('tcp:8888', 'tcp:8888', serial)."""
+        mode = 'forward' if rebind else 'forward:norebind'
+        self._command(f"{self._prefix(serial)}:{mode}:{local};{remote}")
+
+    def kill_forward(self, local, serial=None):
+        self._command(f"{self._prefix(serial)}:killforward:{local}")
+
+    def track_devices(self, callback=None):
+        """
+        Запускает отслеживание устройств (один раз на клиент); callback(devices)
+        вызывается из потока отслеживания при каждом изменении списка.
+        """
+        with self._lock:
+            if self.tracker is None:
+                self.tracker = DeviceTracker(self)
+                self.tracker.start()
+        if callback:
+            self.tracker.add_callback(callback)
+        return self.tracker
+
+    def close(self):
+        if self.tracker:
+            self.tracker.stop()
+            self.tracker = None
+
+
+class DeviceTracker:
+    """
+    Постоянное соединение host:track-devices: сервер ADB присылает полный список
+    устройств сразу и затем при каждом изменении. devices - последний список
+    ({serial: state}) или None, пока связи с сервером нет.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.devices = None
+        self._callbacks = []
+        self._sock = None
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='adb-track-devices', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wait_ready(self, timeout=None):
+        """Ждет первый список устройств; True - если он получен."""
+        return self._ready.wait(timeout)
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+        if self.devices is not None:
+            callback(dict(self.devices))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Сервер ADB запускают явные запросы, отслеживание только ждет его.
+                # Таймаут только на подключение: обновления приходят когда угодно.
+                self._sock = self.client._open('host:track-devices', start=False)
+                self._sock.settimeout(None)
+                while not self._stop.is_set():
+                    self._update(parse_devices(_read_string(self._sock)))
+            except (AdbError, OSError) as e:
+                if self._stop.is_set():
+                    break
+                if self.devices is not None:
+                    print(f"[!] Отслеживание устройств ADB прервано: {e}")
+                self.devices = None
+                self._ready.set()
+            finally:
+                if self._sock:
+                    self._sock.close()
+                    self._sock = None
+            self._stop.wait(TRACK_RETRY_INTERVAL)
+
+    def _update(self, devices):
+        changed = devices != self.devices
+        self.devices = devices
+        self._ready.set()
+        if changed:
+            for callback in list(self._callbacks):
+                try:
+                    callback(dict(devices))
+                except Exception as e:
+                    print(f"[!] Ошибка обработчика списка устройств: {e}")
+
+    def stop(self):
+        self._stop.set()
+        sock = self._sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join(timeout=1.0)
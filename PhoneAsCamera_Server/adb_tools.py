@@ -0,0 +1,229 @@
+import sys
+import time
+import os
+import subprocess
+import threading
+
+from adb_client import AdbClient, AdbError
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+ADB_FOLDER = os.path.join(script_dir, 'adb_files')
+ADB_PATH = os.path.join(ADB_FOLDER, 'adb.exe')
+
+def run_adb_command(args):
+    """
+    Выполняет команду ADB из папки adb_files (новым процессом; для запросов к серверу
+    ADB используется adb_client - здесь остается только запуск самого сервера).
+    Возвращает кортеж: (success: bool, stdout: str, stderr: str)
+    """
+    if not os.path.exists(ADB_PATH):
+        return False, "", f"Ошибка: Файл adb.exe не найден по пути '{ADB_PATH}'"
+
+    command = [ADB_PATH] + args
+    print(f"[*] Выполнение ADB: {' '.join(command)}")
+
+    try:
+        startupinfo = None
+        if sys.platform == "win32":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+
+        process = subprocess.run(
+            command,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            check=False,
+            startupinfo=startupinfo
+        )
+
+        print(f"    Код возврата: {process.returncode}")
+        if process.stdout: 
+            print(f"    Stdout: {process.stdout.strip()}")
+        if process.stderr: 
+            print(f"    Stderr: {process.stderr.strip()}")
+
+        success = process.returncode == 0
+        is_daemon_msg = "daemon started successfully" in process.stderr.lower()
+        if is_daemon_msg and not process.stdout.strip() and args != ['start-server']:
+             print("[*] ADB демон только что стартовал, ждем секунду...")
+             time.sleep(1)
+             return run_adb_command(args)
+
+        if args == ['devices']:
+            success = success and process.stdout.strip() != ""
+        elif "error" in process.stderr.lower() and not is_daemon_msg:
+             success = False
+
+
+        return success, process.stdout.strip(), process.stderr.strip()
+
+    except FileNotFoundError:
+        return False, "", f"Ошибка: Команда '{ADB_PATH}' не найдена. Убедитесь, что ADB находится в папке adb_files."
+    except Exception as e:
+        return False, "", f"Неожиданная ошибка при выполнении ADB: {e}"
+
+
+def _start_adb_server():
+    """Запуск сервера ADB для AdbClient (единственный вызов adb.exe); возвращает (success, error)."""
+    success, _, stderr = run_adb_command(['start-server'])
+    return success, stderr
+
+
+_client = None
+
+
+def adb_client():
+    """
+    Общий клиент сервера ADB (см. adb_client.py): запросы идут напрямую в сокет
+    сервера, а список устройств обновляется отслеживанием track-devices.
+    """
+    global _client
+    if _client is None:
+        _client = AdbClient(start_server=_start_adb_server)
+    return _client
+
+
+def track_devices(callback=None):
+    """Запускает отслеживание подключения/отключения устройств; callback(devices) - при изменениях."""
+    return adb_client().track_devices(callback)
+
+
+def list_devices():
+    """
+    Возвращает (devices, unauthorized, error): серийные номера готовых устройств,
+    неавторизованных устройств и текст ошибки ADB (пустой, если ошибки нет).
+    """
+    client = adb_client()
+    try:
+        client.version()
+        states = client.devices()
+    except AdbError as e:
+        return [], [], str(e)
+    devices = [serial for serial, state in states.items() if state == 'device']
+    unauthorized = [serial for serial, state in states.items() if state == 'unauthorized']
+    return devices, unauthorized, ""
+
+
+def setup_forward(local_port, remote_port=None, serial=None):
+    """
+    Настраивает adb forward tcp:local_port -> tcp:remote_port.
+    Если порт занят старым пробросом, удаляет его и пробует снова.
+    Возвращает (success, error).
+    """
+    remote_port = remote_port or local_port
+    client = adb_client()
+    try:
+        try:
+            client.forward(f'tcp:{local_port}', f'tcp:{remote_port}', serial)
+        except AdbError as e:
+            if "cannot bind listener" not in str(e) and "already in use" not in str(e):
+                raise
+            print("[*] Порт занят, пытаемся удалить старый форвардинг...")
+            remove_forward(local_port, serial)
+            client.forward(f'tcp:{local_port}', f'tcp:{remote_port}', serial)
+    except AdbError as e:
+        return False, str(e)
+    print(f"[*] ADB Forward tcp:{local_port} -> tcp:{remote_port} настроен.")
+    return True, ""
+
+
+def remove_forward(local_port, serial=None):
+    """Удаляет adb forward для локального порта; возвращает (success, error)."""
+    try:
+        adb_client().kill_forward(f'tcp:{local_port}', serial)
+    except AdbError as e:
+        return False, str(e)
+    return True, ""
+
+
+class AdbPreflight:
+    """
+    Проверка ADB перед подключением по USB, выполняемая заранее и в фоне.
+
+    start() запускает в отдельном потоке то, что раньше делалось по кнопке "Подключиться":
+    запуск сервера ADB и список устройств. Результат кешируется и дальше обновляется
+    отслеживанием устройств (track-devices), поэтому devices() при подключении не ходит
+    в ADB. Проброс порта после ensure_forward() тоже запоминается и сбрасывается при любом
+    изменении списка устройств: после переподключения кабеля или перезапуска сервера ADB
+    adb forward теряется. Методы блокируют и вызываются не из потока GUI.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        # (devices, unauthorized, error), как у list_devices(), или None - проверки еще не было.
+        self._devices = None
+        # (local_port, remote_port, serial) настроенного проброса или None.
+        self._forward = None
+        # Номер изменения списка устройств: проброс, настроенный до изменения, не запоминается.
+        self._generation = 0
+        self._tracking = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.refresh, name='adb-preflight', daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Проверяет ADB заново (запуская сервер при необходимости); возвращает (devices, unauthorized, error)."""
+        result = list_devices()
+        with self._lock:
+            self._devices = result
+        if not result[2] and not self._tracking:
+            self._tracking = True
+            track_devices(self._on_devices)
+        self._ready.set()
+        return result
+
+    def devices(self, timeout=None):
+        """
+        (devices, unauthorized, error) из кеша; ждет фоновую проверку, если она еще идет.
+        После ошибки (например, сервер ADB не запустился) проверка повторяется.
+        """
+        self.start()
+        self._ready.wait(timeout)
+        with self._lock:
+            result = self._devices
+        if result is None or result[2]:
+            result = self.refresh()
+        return result
+
+    def _on_devices(self, states):
+        devices = [serial for serial, state in states.items() if state == 'device']
+        unauthorized = [serial for serial, state in states.items() if state == 'unauthorized']
+        with self._lock:
+            self._devices = (devices, unauthorized, "")
+            self._generation += 1
+            if self._forward is not None:
+                print("[*] Список устройств ADB изменился: проброс порта будет настроен заново.")
+            self._forward = None
+
+    def ensure_forward(self, local_port, remote_port=None, serial=None):
+        """setup_forward(), если этот проброс еще не настроен после последнего изменения устройств; (success, error)."""
+        forward = (local_port, remote_port or local_port, serial)
+        tracker = adb_client().tracker
+        # Без отслеживания (или пока связи с сервером ADB нет - он мог перезапуститься) кешу не верим:
+        # запрос заодно запустит сервер.
+        tracked = tracker is not None and tracker.devices is not None
+        with self._lock:
+            if tracked and self._forward == forward:
+                return True, ""
+            generation = self._generation
+        success, error = setup_forward(*forward)
+        if success:
+            with self._lock:
+                if self._generation == generation:
+                    self._forward = forward
+        return success, error
+
+    def remove_forward(self):
+        """Удаляет проброс, настроенный через ensure_forward() (если он есть)."""
+        with self._lock:
+            forward, self._forward = self._forward, None
+        if forward is None:
+            return True, ""
+        return remove_forward(forward[0], forward[2])
@@ -0,0 +1,193 @@
+"""
+Бенчмарк выделений памяти в горячем цикле (tracemalloc): прием -> декодирование -> преобразование ->
+формат камеры -> превью, теми же классами и с теми же пулами буферов, что StreamEngine
+(см. buffer_pool.py), но по одному кадру за раз в одном потоке.
+
+Для каждого кадра после разогрева измеряется, на сколько пик памяти за время обработки кадра
+превысил ее уровень перед кадром (tracemalloc) - сколько памяти кадр выделил заново.
+Последние кадры держатся живыми столько же, сколько в очередях движка и в буфере сглаживания.
+Для сравнения тот же цикл прогоняется без пулов (новый массив на каждый результат, как раньше).
+С пулами в установившемся режиме кадр не выделяет памяти под данные, а промахов пулов нет;
+исключение - декодер opencv: cv2.imdecode не принимает dst (без выделений декодирует turbojpeg).
+
+Запуск из папки PhoneAsCamera_Server:
+    python bench_alloc.py [--frames 120] [--warmup 20] [--scenarios jpeg-720p,nv21-1080p] [--decoder opencv]
+"""
+import argparse
+import collections
+import socket
+import threading
+import time
+import tracemalloc
+
+import cv2
+
+import h264
+from buffer_pool import BufferPool, FramePool, copy_frame
+from decoders import BGR, NV12, Nv21Decoder, create_decoder, frame_size, nv12_to, to_nv12
+from frame_reader import FrameReader
+from phone_simulator import DEFAULT_QUALITY, bgr_to_nv21, synthetic_image
+from preview import PreviewPublisher
+from protocol import CODEC_H264, CODEC_JPEG, CODEC_NV21, FRAME_HEADER_V2
+from stream_engine import StreamConfig, frame_buffers
+from transform import FrameTransform
+
+# Сценарии: кодек кадров телефона, разрешение, формат вирт. камеры, размер вывода (None - как у кадра).
+SCENARIOS = {
+    'jpeg-720p': (CODEC_JPEG, (1280, 720), BGR, None),
+    'jpeg-1080p-to-720p': (CODEC_JPEG, (1920, 1080), BGR, (1280, 720)),
+    'jpeg-720p-nv12': (CODEC_JPEG, (1280, 720), NV12, None),
+    'nv21-1080p': (CODEC_NV21, (1920, 1080), NV12, None),
+    'nv21-1080p-bgr': (CODEC_NV21, (1920, 1080), BGR, None),
+    'h264-720p': (CODEC_H264, (1280, 720), NV12, None),
+}
+# Разных кадров JPEG/NV21 в цикле (H.264 кодируется весь: P-кадры зависят от предыдущих).
+DISTINCT_FRAMES = 8
+PREVIEW_SIZE = (480, 270)
+
+
+def _encode_frames(codec, resolution, count):
+    width, height = resolution
+    images = [synthetic_image(width, height, i) for i in range(count if codec == CODEC_H264 else DISTINCT_FRAMES)]
+    if codec == CODEC_JPEG:
+        return [cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, DEFAULT_QUALITY])[1].tobytes()
+                for image in images]
+    if codec == CODEC_NV21:
+        return [bgr_to_nv21(image) for image in images]
+    encoder = h264.H264Encoder(width, height, 30)
+    return [encoder.encode(image, keyframe=i == 0) for i, image in enumerate(images)]
+
+
+def _sender(sock, payloads, total, codec, width, height):
+    try:
+        for i in range(total):
+            data = payloads[i % len(payloads)]
+            sock.sendall(FRAME_HEADER_V2.pack(FRAME_HEADER_V2.size, len(data), i, 0, codec, 0, width, height))
+            sock.sendall(data)
+    except OSError:
+        pass
+
+
+def run(name, frames, warmup, pooled, decoder_backend='auto'):
+    """Прогоняет сценарий; возвращает словарь с выделениями на кадр и статистикой пулов."""
+    codec, resolution, camera_format, output_resolution = SCENARIOS[name]
+    width, height = resolution
+    total = frames + warmup
+    payloads = _encode_frames(codec, resolution, total)
+
+    config = StreamConfig()
+    buffers, decode_buffers = frame_buffers(config)
+    decode_pool = FramePool(decode_buffers) if pooled else None
+    convert_pool = FramePool(buffers) if pooled else None
+    preview_pool = FramePool(1) if pooled else None
+    transform = FrameTransform(buffers=buffers)
+    if not pooled:
+        transform.pool = None
+    camera_size = output_resolution or resolution
+    decode_size = transform.source_size(output_resolution) if output_resolution else None
+    if codec == CODEC_JPEG:
+        decoder = create_decoder(decoder_backend, BGR, decode_size, decode_pool)
+    elif codec == CODEC_NV21:
+        decoder = Nv21Decoder(camera_format, decode_size, decode_pool)
+    else:
+        decoder = h264.H264Decoder(camera_format, pool=decode_pool)
+    preview = PreviewPublisher(max_fps=1e6)
+    preview.set_target_size(*PREVIEW_SIZE)
+
+    reader_sock, writer_sock = socket.socketpair()
+    reader = FrameReader(reader_sock)
+    reader.set_protocol(2)
+    if not pooled:
+        reader.pool = BufferPool(max_free=0)
+    sender = threading.Thread(target=_sender, args=(writer_sock, payloads, total, codec, width, height), daemon=True)
+    # Кадры, которые в движке еще ждут в очереди вывода и буфере сглаживания или повторяются в камере.
+    alive = collections.deque(maxlen=decode_buffers - 1)
+    allocated = []
+    started = None
+    tracemalloc.start()
+    sender.start()
+    try:
+        for i in range(total):
+            if i == warmup:
+                pool_stats = [pool.stats() for pool in (decode_pool, convert_pool, transform.pool) if pool]
+                started = time.perf_counter()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            payload = reader.read_frame()
+            if codec == CODEC_JPEG:
+                frame = decoder.decode(payload.view)
+            elif codec == CODEC_NV21:
+                frame = decoder.decode(payload.view, width, height)
+            else:
+                frame = decoder.decode(payload.view, payload.info.sequence)
+            reader.release(payload)
+            frame = transform.apply(frame, *camera_size)
+            if frame.ndim == 2 and camera_format != NV12:
+                frame = nv12_to(frame, camera_format, convert_pool)
+            elif frame.ndim == 3 and camera_format == NV12:
+                frame = to_nv12(frame, BGR, convert_pool)
+            preview.publish(nv12_to(frame, BGR, preview_pool) if frame.ndim == 2 else copy_frame(preview_pool, frame))
+            alive.append(frame)
+            if i >= warmup:
+                allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        elapsed = time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+        writer_sock.close()
+        reader_sock.close()
+        sender.join()
+
+    misses = 0
+    if pooled:
+        pools = [pool.stats() for pool in (decode_pool, convert_pool, transform.pool) if pool]
+        misses = sum(after['misses'] - before['misses'] for after, before in zip(pools, pool_stats))
+    receive = reader.pool.stats()
+    out_width, out_height = frame_size(alive[-1])
+    return {
+        'scenario': name,
+        'pooled': pooled,
+        'decoder': getattr(decoder, 'name', '-'),
+        'frame_mb': alive[-1].nbytes / 2 ** 20,
+        'output': f"{out_width}x{out_height} {camera_format}",
+        'allocated_kb': {'mean': sum(allocated) / len(allocated) / 1024, 'max': max(allocated) / 1024},
+        'pool_misses': misses,
+        'receive_misses': receive['misses'],
+        'frame_ms': elapsed / frames * 1000,
+    }
+
+
+def print_results(results):
+    print(f"{'Сценарий':<20} | {'Пулы':>4} | {'Декодер':>9} | {'Вывод':>16} | {'Кадр, МБ':>8} | "
+          f"{'Выделено за кадр, КБ (ср./макс.)':>32} | {'Промахи':>7} | {'мс/кадр':>7}")
+    for r in results:
+        allocated = r['allocated_kb']
+        misses = f"{r['pool_misses']}" if r['pooled'] else '-'
+        print(f"{r['scenario']:<20} | {'да' if r['pooled'] else 'нет':>4} | {r['decoder']:>9} | "
+              f"{r['output']:>16} | {r['frame_mb']:>8.2f} | {allocated['mean']:>15.1f} {allocated['max']:>16.1f} | "
+              f"{misses:>7} | {r['frame_ms']:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выделения памяти на кадр в горячем цикле клиента (tracemalloc)")
+    parser.add_argument('--frames', type=int, default=120, help="кадров в замере (после разогрева)")
+    parser.add_argument('--warmup', type=int, default=20, help="кадров разогрева (пулы заполняются)")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"сценарии через запятую: {', '.join(SCENARIOS)}")
+    parser.add_argument('--decoder', default='auto', help="декодер JPEG: auto, opencv или turbojpeg")
+    args = parser.parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+    results = []
+    for name in names:
+        if SCENARIOS[name][0] == CODEC_H264 and not h264.is_available():
+            print(f"[!] {name}: пропущен - нет PyAV (pip install av)")
+            continue
+        for pooled in (False, True):
+            results.append(run(name, args.frames, max(1, args.warmup), pooled, args.decoder))
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
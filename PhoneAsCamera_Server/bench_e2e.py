@@ -0,0 +1,358 @@
+"""
+Сквозной бенчмарк клиента: симулятор телефона -> StreamEngine -> пустая вирт. камера.
+
+Симулятор работает в отдельном процессе, поэтому CPU и память в отчете относятся
+только к клиенту. Для каждого сценария выводятся FPS приема и вывода, пропущенные
+кадры, задержка "отправка кадра -> cam.send" (p50/p95/p99), неравномерность вывода
+(p95 отклонения интервала между cam.send от такта камеры), объем принятых данных,
+загрузка CPU, память и время от запуска движка до первого кадра в камере. Сценарии *-nv21 сравнивают несжатые кадры (режим USB) с JPEG,
+сценарий 720p30-reconnect разрывает соединение дважды и измеряет время восстановления,
+сценарии *-udp передают кадры датаграммами UDP (*-udp-loss - с потерями и перестановками
+датаграмм в симуляторе) и выводят статистику сборки кадров.
+
+Запуск из папки PhoneAsCamera_Server:
+    python bench_e2e.py
+    python bench_e2e.py --duration 10 --scenarios 720p30,1080p30-latest --json results.json
+    python bench_e2e.py --replay session.pacr
+    python bench_e2e.py --scenarios 720p30-jitter --trace traces
+С --replay записанный поток (см. recording.py) прогоняется через декодирование и вывод
+так быстро, как возможно и без темпа камеры - детерминированный вход для профилирования.
+С --trace каждый сценарий пишет трассировку кадров traces/<сценарий>.json (см. tracing.py).
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+
+from phone_simulator import PhoneSimulator, MARKER_CYCLE, read_frame_marker
+from protocol import CODEC_NV21
+from recording import ReplaySource
+from stream_engine import StreamEngine, StreamConfig, EngineListener
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Сценарии: параметры симулятора и переопределения StreamConfig.
+# Адаптация качества по умолчанию выключена, а кодек - JPEG (симулятор слушает локальный
+# адрес, и 'auto' выбрал бы NV21), чтобы сценарии были сравнимы между версиями. Переподключение
+# и повтор кадров включены только в сценарии *-reconnect: в остальных конец потока - конец сценария.
+# 'clients' - на сколько соединений симулятор делит кадры сценария (разрывы связи между ними).
+SCENARIOS = {
+    '720p30': ({'resolution': (1280, 720), 'fps': 30}, {}),
+    '1080p30': ({'resolution': (1920, 1080), 'fps': 30}, {}),
+    '1080p30-latest': ({'resolution': (1920, 1080), 'fps': 30}, {'latest_only': True}),
+    '1080p60': ({'resolution': (1920, 1080), 'fps': 60}, {'target_fps': 60}),
+    '1080p30-to-720p': ({'resolution': (1920, 1080), 'fps': 30}, {'output_resolution': (1280, 720)}),
+    '720p30-jitter': ({'resolution': (1280, 720), 'fps': 30, 'jitter': 0.015}, {}),
+    '720p30-jitter-direct': ({'resolution': (1280, 720), 'fps': 30, 'jitter': 0.015}, {'output_clock': False}),
+    '720p30-stalls': ({'resolution': (1280, 720), 'fps': 30,
+                       'stall_every': 60, 'stall_duration': 0.4}, {}),
+    '720p30-v1': ({'resolution': (1280, 720), 'fps': 30, 'protocol': 1}, {}),
+    '720p30-nv21': ({'resolution': (1280, 720), 'fps': 30, 'codec': CODEC_NV21}, {'transport_codec': 'nv21'}),
+    '1080p30-nv21': ({'resolution': (1920, 1080), 'fps': 30, 'codec': CODEC_NV21},
+                     {'transport_codec': 'nv21'}),
+    '720p30-h264': ({'resolution': (1280, 720), 'fps': 30}, {'transport_codec': 'h264'}),
+    '720p30-h264-loss': ({'resolution': (1280, 720), 'fps': 30, 'skip_every': 60}, {'transport_codec': 'h264'}),
+    '720p30-adaptive': ({'resolution': (1280, 720), 'fps': 30, 'bandwidth': 512 * 1024},
+                        {'adaptive_quality': True}),
+    '720p30-udp': ({'resolution': (1280, 720), 'fps': 30}, {'udp_transport': True}),
+    '720p30-udp-loss': ({'resolution': (1280, 720), 'fps': 30, 'udp_loss': 0.005, 'udp_reorder': 0.02},
+                        {'udp_transport': True}),
+    '720p30-h264-udp-loss': ({'resolution': (1280, 720), 'fps': 30, 'udp_loss': 0.005, 'udp_reorder': 0.02},
+                             {'transport_codec': 'h264', 'udp_transport': True}),
+    '720p30-reconnect': ({'resolution': (1280, 720), 'fps': 30, 'clients': 3},
+                         {'reconnect': True, 'hold_after': 0.25}),
+}
+# Сколько ждать после завершения симулятора, прежде чем остановить переподключающийся движок.
+RECONNECT_DRAIN = 0.5
+DEFAULT_DURATION = 5.0
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _memory_mb():
+    """Текущий RSS процесса (psutil) или пиковый (resource), в МБ; None - если недоступно."""
+    if psutil:
+        return psutil.Process().memory_info().rss / 1048576
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1048576 if sys.platform == 'darwin' else peak / 1024
+    return None
+
+
+class NullCamera:
+    """Вирт. камера-заглушка: ничего не выводит, но соблюдает темп и измеряет задержку."""
+
+    device = 'null'
+
+    def __init__(self, width, height, fps, pixel_format=None, backend=None, device=None, sent_times=None,
+                 pacing=True):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.sent_times = sent_times
+        self.pacing = pacing
+        self.latencies = []
+        self.unmarked = 0
+        self.repeated = 0
+        self.intervals = []
+        self.frames = 0
+        self._last_marker = None
+        self.first_send = None
+        self.last_send = None
+        self._next_frame = None
+
+    def send(self, frame):
+        now = time.perf_counter()
+        self.frames += 1
+        if self.first_send is None:
+            self.first_send = now
+        else:
+            self.intervals.append(now - self.last_send)
+        self.last_send = now
+        marker = read_frame_marker(frame)
+        if marker is None or self.sent_times is None:
+            self.unmarked += 1
+        elif marker == self._last_marker:
+            # Повтор последнего кадра, пока связи нет (hold_after) - задержку не учитываем.
+            self.repeated += 1
+        else:
+            self._last_marker = marker
+            self.latencies.append(now - self.sent_times[marker])
+
+    def sleep_until_next_frame(self):
+        if not self.pacing:
+            return
+        now = time.perf_counter()
+        if self._next_frame is None or now - self._next_frame > 1.0 / self.fps:
+            self._next_frame = now
+        self._next_frame += 1.0 / self.fps
+        delay = self._next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+def _run_simulator(options, sent_times, ready):
+    """Точка входа процесса симулятора."""
+    options = dict(options)
+    clients = options.pop('clients', 1)
+    simulator = PhoneSimulator(port=0, sent_times=sent_times, seed=0, **options)
+    ready.put(simulator.prepare())
+    simulator.serve_forever(max_clients=clients)
+
+
+def run_scenario(name, duration, decoder=None, trace_dir=None):
+    """Запускает один сценарий и возвращает словарь с результатами."""
+    simulator_options, overrides = SCENARIOS[name]
+    clients = simulator_options.get('clients', 1)
+    frames = int(simulator_options['fps'] * duration) // clients * clients
+    simulator_options = dict(simulator_options, frames=frames // clients)
+    overrides = dict({'adaptive_quality': False, 'transport_codec': 'jpeg', 'reconnect': False,
+                      'hold_after': None}, **overrides)
+    if decoder:
+        overrides = dict(overrides, decoder_backend=decoder)
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+        overrides = dict(overrides, trace_file=os.path.join(trace_dir, f"{name}.json"))
+
+    sent_times = multiprocessing.Array('d', MARKER_CYCLE, lock=False)
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_simulator, args=(simulator_options, sent_times, ready),
+                                      daemon=True)
+    process.start()
+    port = ready.get(timeout=60)
+
+    cameras = []
+
+    def camera_factory(width, height, fps, pixel_format=None, backend=None, device=None):
+        camera = NullCamera(width, height, fps, pixel_format, backend, device, sent_times)
+        cameras.append(camera)
+        return camera
+
+    engine = StreamEngine('127.0.0.1', port, StreamConfig(**overrides), EngineListener(),
+                          camera_factory=camera_factory)
+    if overrides['reconnect']:
+        # Движок переподключался бы бесконечно: останавливаем его, когда симулятор отдал все кадры.
+        def stop_after_simulator():
+            wait([process.sentinel])
+            time.sleep(RECONNECT_DRAIN)
+            engine.stop()
+
+        threading.Thread(target=stop_after_simulator, daemon=True).start()
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    asyncio.run(engine.run())
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+    process.join(timeout=5)
+
+    stats = engine.stats()
+    camera = cameras[0] if cameras else NullCamera(0, 0, 1)
+    output_span = (camera.last_send - camera.first_send) if camera.frames > 1 else 0
+    latencies_ms = [latency * 1000 for latency in camera.latencies]
+    period = 1.0 / camera.fps if camera.fps else 0.0
+    deviations_ms = [abs(interval - period) * 1000 for interval in camera.intervals]
+    return {
+        'scenario': name,
+        'sent': frames,
+        'received': stats.get('received', 0),
+        'output': camera.frames,
+        'dropped': stats.get('dropped', 0),
+        'decode_failed': stats.get('decode_failed', 0),
+        'receive_fps': stats.get('received', 0) / wall if wall else 0.0,
+        'mb_per_second': stats.get('total_bytes', 0) / 1048576 / wall if wall else 0.0,
+        'output_fps': (camera.frames - 1) / output_span if output_span else 0.0,
+        'latency_ms': {'p50': _percentile(latencies_ms, 0.50), 'p95': _percentile(latencies_ms, 0.95),
+                       'p99': _percentile(latencies_ms, 0.99), 'unmarked': camera.unmarked},
+        'output_jitter_ms': _percentile(deviations_ms, 0.95),
+        'repeated': camera.repeated,
+        'outages': stats.get('outages', 0),
+        'reconnect_ms': stats.get('reconnect_ms', {}),
+        'cpu_percent': cpu / wall * 100 if wall else 0.0,
+        'memory_mb': _memory_mb(),
+        'capture_latency_ms': stats.get('capture_latency_ms', {}),
+        'lost_frames': stats.get('lost_frames', 0),
+        'protocol': stats.get('protocol'),
+        'codec': stats.get('codec'),
+        'stages_ms': stats.get('stages_ms', {}),
+        'first_frame_ms': stats.get('first_frame_ms'),
+        'udp': stats.get('udp'),
+    }
+
+
+def run_replay(path, decoder=None):
+    """Прогоняет запись через конвейер без темпа; возвращает словарь с результатами."""
+    overrides = {'output_queue_policy': 'block', 'receive_queue_policy': 'block', 'output_clock': False}
+    if decoder:
+        overrides['decoder_backend'] = decoder
+    source = ReplaySource(path, realtime=False)
+    frames = len(source)
+    cameras = []
+
+    def camera_factory(width, height, fps, pixel_format=None, backend=None, device=None):
+        camera = NullCamera(width, height, fps, pacing=False)
+        cameras.append(camera)
+        return camera
+
+    engine = StreamEngine(path, config=StreamConfig(**overrides), camera_factory=camera_factory,
+                          frame_source=source)
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        asyncio.run(engine.run())
+    finally:
+        source.close()
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+    stats = engine.stats()
+    output = cameras[0].frames if cameras else 0
+    return {
+        'scenario': 'replay',
+        'frames': frames,
+        'output': output,
+        'output_fps': output / wall if wall else 0.0,
+        'cpu_percent': cpu / wall * 100 if wall else 0.0,
+        'memory_mb': _memory_mb(),
+        'stages_ms': stats.get('stages_ms', {}),
+    }
+
+
+def print_replay(result):
+    decode = result['stages_ms'].get('decode', {})
+    print(f"Кадров: {result['output']}/{result['frames']}, {result['output_fps']:.1f} к/с, "
+          f"CPU {result['cpu_percent']:.0f}%")
+    if decode.get('count'):
+        print(f"Декодирование, мс: p50 {decode['p50']:.2f}, p95 {decode['p95']:.2f}, p99 {decode['p99']:.2f}")
+
+
+def print_results(results):
+    print(f"{'Сценарий':<20} | {'Прием':>7} | {'МБ/с':>6} | {'Вывод':>7} | {'Неравн.':>7} | {'Пропущ.':>7} | "
+          f"{'Задержка p50/p95/p99, мс':>24} | {'CPU':>5} | {'Память':>8} | {'1-й кадр':>8}")
+    for r in results:
+        latency = r['latency_ms']
+        memory = f"{r['memory_mb']:.0f} МБ" if r['memory_mb'] is not None else "-"
+        first_frame = f"{r['first_frame_ms']:.0f} мс" if r.get('first_frame_ms') is not None else "-"
+        print(f"{r['scenario']:<20} | {r['receive_fps']:>5.1f}/с | {r['mb_per_second']:>6.1f} | "
+              f"{r['output_fps']:>5.1f}/с | {r['output_jitter_ms']:>4.1f} мс | "
+              f"{r['dropped']:>7} | {latency['p50']:>7.1f} {latency['p95']:>7.1f} {latency['p99']:>7.1f}  | "
+              f"{r['cpu_percent']:>4.0f}% | {memory:>8} | {first_frame:>8}")
+    for r in results:
+        reconnect = r['reconnect_ms']
+        if r['outages']:
+            restored = f"{reconnect['p50']:.0f}/{reconnect['max']:.0f} мс" if reconnect.get('count') else "-"
+            print(f"[*] {r['scenario']}: разрывов связи {r['outages']}, восстановление p50/max {restored}, "
+                  f"повторов кадра {r['repeated']}")
+        udp = r.get('udp')
+        if udp:
+            print(f"[*] {r['scenario']}: UDP - собрано кадров {udp['frames']}, выброшено недособранных "
+                  f"{udp['incomplete_frames']} и без фрагментов {udp['missing_frames']}, фрагментов принято "
+                  f"{udp['fragments']}, потеряно {udp['lost_fragments']}, опоздало {udp['late_fragments']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк клиента на симуляторе телефона")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help=f"длительность каждого сценария, секунды (по умолчанию {DEFAULT_DURATION})")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help="сценарии через запятую: " + ', '.join(SCENARIOS))
+    parser.add_argument('--decoder', default=None, choices=('auto', 'opencv', 'turbojpeg'), help="декодер JPEG")
+    parser.add_argument('--json', help="сохранить результаты в JSON (для сравнения между версиями)")
+    parser.add_argument('--replay', metavar='FILE', help="вместо сценариев прогнать запись потока")
+    parser.add_argument('--trace', metavar='DIR', help="сохранить трассировку каждого сценария в папку")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        result = run_replay(args.replay, args.decoder)
+        print()
+        print_replay(result)
+        results = [result]
+    else:
+        results = run_scenarios(parser, args)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'cpu_count': os.cpu_count(), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"[*] Результаты сохранены в {args.json}")
+    return 0
+
+
+def run_scenarios(parser, args):
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+    if not psutil and not resource:
+        print("[!] psutil не установлен - память не измеряется.")
+
+    results = []
+    for name in names:
+        print(f"[*] Сценарий {name} ({args.duration:.0f} с)...")
+        results.append(run_scenario(name, args.duration, args.decoder, args.trace))
+    print()
+    print_results(results)
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Микробенчмарк чтения кадров: старый способ (buf += chunk) против FrameReader (recv_into).
+
+Запуск из папки PhoneAsCamera_Server:
+    python bench_frame_reader.py [--frames 200] [--sizes 200,500,1000,2000]
+Размеры кадров задаются в килобайтах. Передача идет через локальную пару сокетов.
+"""
+import argparse
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from frame_reader import FrameReader
+
+
+def legacy_receive_all(sock, count):
+    """Копия прежнего WebcamWorker._receive_all_internal (квадратичное склеивание bytes)."""
+    buf = b''
+    while len(buf) < count:
+        chunk = sock.recv(count - len(buf))
+        if not chunk:
+            raise ConnectionAbortedError("Сокет закрыт удаленно")
+        buf += chunk
+    return buf
+
+
+def legacy_read_frame(sock):
+    size = struct.unpack('>I', legacy_receive_all(sock, 4))[0]
+    return np.frombuffer(legacy_receive_all(sock, size), dtype=np.uint8)
+
+
+def _sender(sock, message, frames):
+    try:
+        for _ in range(frames):
+            sock.sendall(message)
+    except OSError:
+        pass
+
+
+def _run(read_frames, frame_size, frames):
+    """Передает frames кадров размера frame_size и возвращает время чтения в секундах."""
+    payload = np.random.default_rng(0).integers(0, 256, frame_size, dtype=np.uint8).tobytes()
+    message = struct.pack('>I', frame_size) + payload
+    reader_sock, writer_sock = socket.socketpair()
+    sender = threading.Thread(target=_sender, args=(writer_sock, message, frames), daemon=True)
+    try:
+        sender.start()
+        started = time.perf_counter()
+        read_frames(reader_sock, frames)
+        return time.perf_counter() - started
+    finally:
+        writer_sock.close()
+        reader_sock.close()
+        sender.join()
+
+
+def read_legacy(sock, frames):
+    for _ in range(frames):
+        legacy_read_frame(sock)
+
+
+def read_zero_copy(sock, frames):
+    reader = FrameReader(sock)
+    for _ in range(frames):
+        payload = reader.read_frame()
+        np.frombuffer(payload.view, dtype=np.uint8)
+        reader.release(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение старого и нового чтения кадров")
+    parser.add_argument('--frames', type=int, default=200, help="кадров на каждый размер")
+    parser.add_argument('--sizes', default='200,500,1000,2000', help="размеры кадров в КБ через запятую")
+    args = parser.parse_args()
+
+    print(f"{'Кадр':>8} | {'buf += chunk':>14} | {'recv_into':>14} | {'Ускорение':>9}")
+    for size_kb in (int(s) for s in args.sizes.split(',')):
+        frame_size = size_kb * 1024
+        legacy = _run(read_legacy, frame_size, args.frames)
+        zero_copy = _run(read_zero_copy, frame_size, args.frames)
+        print(f"{size_kb:>5} КБ | {args.frames / legacy:>9.0f} к/с | {args.frames / zero_copy:>9.0f} к/с"
+              f" | {legacy / zero_copy:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Пулы буферов кадров: в установившемся режиме горячий цикл (прием -> декодирование ->
+преобразование -> вывод) не выделяет память под кадры - декодеры и преобразования пишут
+в заранее выделенные буферы через dst=.
+
+BufferPool - bytearray под принятые данные: acquire(size) и явный release(buffer) после
+декодирования (FrameReader).
+
+FramePool - массивы кадров uint8 по форме: acquire(shape) выдает буферы одной формы по кругу.
+Декодированный кадр живет неопределенно долго (ждет в очереди вывода и в буфере сглаживания,
+повторяется в камере), поэтому явного возврата нет: буфер переиспользуется через buffers выдач
+той же формы, и размер кольца задается глубиной очередей после стадии, которая пишет в пул.
+
+Счетчики обоих пулов: hits - буфер взят из пула, misses - выделен новый. После первых кадров
+каждого размера misses не растет (см. stats() и bench_alloc.py).
+"""
+import threading
+
+import numpy as np
+
+# Начальная емкость bytearray и шаг роста (кадр 1080p JPEG обычно 200 КБ - 2 МБ).
+INITIAL_BUFFER_SIZE = 256 * 1024
+MAX_FREE_BUFFERS = 8
+# Сколько разных форм кадра хранит FramePool (смена разрешения или ориентации телефона):
+# кольца самых старых форм освобождаются.
+MAX_FRAME_SHAPES = 4
+
+
+class BufferPool:
+    """
+    Свободные bytearray для приема кадров. acquire() отдает буфер не меньше size байт
+    (или выделяет новый - емкость растет степенями двойки), release() возвращает его в пул.
+    Потокобезопасен: буферы возвращаются из потоков декодирования.
+    """
+
+    def __init__(self, max_free=MAX_FREE_BUFFERS, initial_size=INITIAL_BUFFER_SIZE):
+        self.max_free = max_free
+        self.initial_size = initial_size
+        self.hits = 0
+        self.misses = 0
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if len(buf) >= size:
+                    self.hits += 1
+                    return self._free.pop(i)
+            if self._free:
+                # Слишком маленький буфер больше не нужен - заменим его большим.
+                self._free.pop()
+            self.misses += 1
+        capacity = self.initial_size
+        while capacity < size:
+            capacity *= 2
+        return bytearray(capacity)
+
+    def release(self, buffer):
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buffer)
+
+    def stats(self):
+        with self._lock:
+            free_bytes = sum(len(buf) for buf in self._free)
+            return {'hits': self.hits, 'misses': self.misses, 'free': len(self._free),
+                    'free_mb': round(free_bytes / 2 ** 20, 1)}
+
+
+class FramePool:
+    """
+    Кольца из buffers массивов uint8 на каждую форму кадра. Массив, который вернул acquire(),
+    не выдается снова, пока не выданы следующие buffers - 1 массивов той же формы.
+    Потокобезопасен (декодирование идет в нескольких потоках).
+    """
+
+    def __init__(self, buffers, max_shapes=MAX_FRAME_SHAPES):
+        self.buffers = max(1, buffers)
+        self.max_shapes = max_shapes
+        self.hits = 0
+        self.misses = 0
+        # Форма -> [список буферов, индекс следующего]; буферы кольца выделяются при первом проходе.
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        with self._lock:
+            ring = self._rings.get(shape)
+            if ring is None:
+                if len(self._rings) >= self.max_shapes:
+                    del self._rings[next(iter(self._rings))]
+                ring = self._rings[shape] = [[], 0]
+            buffers, index = ring
+            ring[1] = (index + 1) % self.buffers
+            if index < len(buffers):
+                self.hits += 1
+                return buffers[index]
+            self.misses += 1
+            buffer = np.empty(shape, dtype=np.uint8)
+            buffers.append(buffer)
+            return buffer
+
+    def stats(self):
+        with self._lock:
+            allocated = sum(buffer.nbytes for buffers, _ in self._rings.values() for buffer in buffers)
+            return {'hits': self.hits, 'misses': self.misses, 'shapes': len(self._rings),
+                    'allocated_mb': round(allocated / 2 ** 20, 1)}
+
+
+def acquire(pool, shape):
+    """Буфер из pool или новый массив, если пула нет (pool = None)."""
+    if pool is None:
+        return np.empty(shape, dtype=np.uint8)
+    return pool.acquire(shape)
+
+
+def copy_frame(pool, frame):
+    """Копия кадра в буфере из pool (или в новом массиве, если пула нет)."""
+    buffer = acquire(pool, frame.shape)
+    np.copyto(buffer, frame)
+    return buffer
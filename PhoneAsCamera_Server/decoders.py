@@ -0,0 +1,303 @@
+import inspect
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from buffer_pool import acquire
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJPF_RGB
+except ImportError:
+    TurboJPEG = None
+
+BGR = 'BGR'
+RGB = 'RGB'
+# Y + чередующиеся U/V: формат вирт. камеры для несжатых кадров без преобразования цвета.
+NV12 = 'NV12'
+# Доступные коэффициенты уменьшения при декодировании (DCT scaling в libjpeg).
+SCALE_DENOMINATORS = (1, 2, 4)
+
+_OPENCV_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+_NV21_CONVERSIONS = {BGR: cv2.COLOR_YUV2BGR_NV21, RGB: cv2.COLOR_YUV2RGB_NV21}
+_NV12_CONVERSIONS = {BGR: cv2.COLOR_YUV2BGR_NV12, RGB: cv2.COLOR_YUV2RGB_NV12}
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_benchmark_cache = {}
+
+
+def jpeg_size(data):
+    """
+    Возвращает (width, height) из заголовка JPEG без декодирования
+    или None, если маркер SOF не найден.
+    """
+    view = memoryview(data)
+    length = len(view)
+    pos = 2
+    while pos + 9 < length:
+        if view[pos] != 0xFF:
+            return None
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height = (view[pos + 5] << 8) | view[pos + 6]
+            width = (view[pos + 7] << 8) | view[pos + 8]
+            return width, height
+        pos += 2 + ((view[pos + 2] << 8) | view[pos + 3])
+    return None
+
+
+def choose_scale(width, height, output_size):
+    """Наибольший знаменатель DCT-масштаба, при котором кадр не меньше output_size."""
+    if not output_size:
+        return 1
+    out_width, out_height = output_size
+    best = 1
+    for denom in SCALE_DENOMINATORS:
+        if width // denom >= out_width and height // denom >= out_height:
+            best = denom
+    return best
+
+
+class OpenCVDecoder:
+    """
+    Декодер на cv2.imdecode. Декодирует сразу в формат вывода: BGR - родной
+    формат OpenCV, поэтому отдельный проход cvtColor не нужен. Уменьшение
+    в 2/4 раза выполняется самим libjpeg (IMREAD_REDUCED_COLOR_*).
+
+    pool (buffer_pool.FramePool) - буферы для декодированных кадров. cv2.imdecode
+    в Python не принимает dst, поэтому этот декодер выделяет массив на каждый кадр
+    (RGB переставляется в нем же, без второго массива); без выделений декодирует TurboJpegDecoder.
+    """
+    name = 'opencv'
+
+    def __init__(self, pixel_format=BGR, output_size=None, pool=None):
+        self.pixel_format = pixel_format
+        self.output_size = output_size
+        self.pool = pool
+        self._scale_cache = {}
+
+    @staticmethod
+    def is_available():
+        return True
+
+    def _scale(self, data, size=None):
+        if not self.output_size:
+            return 1
+        size = size or jpeg_size(data)
+        if size is None:
+            return 1
+        scale = self._scale_cache.get(size)
+        if scale is None:
+            scale = self._scale_cache[size] = choose_scale(size[0], size[1], self.output_size)
+        return scale
+
+    def decode(self, data):
+        flags = _OPENCV_REDUCED_FLAGS[self._scale(data)]
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if frame is not None and self.pixel_format == RGB:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        return frame
+
+
+class TurboJpegDecoder(OpenCVDecoder):
+    """
+    Декодер на libjpeg-turbo (пакет PyTurboJPEG, необязательная зависимость).
+    Декодирует прямо в BGR/RGB (в буфер из pool, если он задан) и поддерживает
+    DCT-масштабирование 1/2, 1/4. PyTurboJPEG 1.x не принимает dst - тогда кадр
+    декодируется в новый массив, как у OpenCVDecoder.
+    """
+    name = 'turbojpeg'
+
+    def __init__(self, pixel_format=BGR, output_size=None, pool=None):
+        super().__init__(pixel_format, output_size, pool)
+        self._jpeg = TurboJPEG()
+        self._tj_format = TJPF_BGR if pixel_format == BGR else TJPF_RGB
+        self._decode_into = _accepts_dst(self._jpeg.decode)
+
+    @staticmethod
+    def is_available():
+        if TurboJPEG is None:
+            return False
+        try:
+            TurboJPEG()
+        except Exception:
+            # Пакет установлен, но сама библиотека libjpeg-turbo не найдена.
+            return False
+        return True
+
+    def decode(self, data):
+        size = jpeg_size(data)
+        scale = self._scale(data, size)
+        try:
+            if not self._decode_into:
+                return self._jpeg.decode(data, pixel_format=self._tj_format, scaling_factor=(1, scale))
+            dst = None
+            if size is not None:
+                # Размер после DCT-масштабирования libjpeg-turbo округляет вверх.
+                width, height = -(-size[0] // scale), -(-size[1] // scale)
+                dst = acquire(self.pool, (height, width, 3))
+            return self._jpeg.decode(data, pixel_format=self._tj_format, scaling_factor=(1, scale), dst=dst)
+        except (OSError, ValueError):
+            # Поврежденный JPEG.
+            return None
+
+
+def _accepts_dst(function):
+    """Принимает ли функция декодирования готовый массив результата (PyTurboJPEG 2.x: dst=)."""
+    try:
+        return 'dst' in inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+class Nv21Decoder:
+    """
+    Несжатые кадры NV21 (плоскость Y, затем чередующиеся V/U), которые телефон
+    шлет по USB вместо JPEG. В BGR/RGB кадр переводится одним векторным
+    cv2.cvtColor; в NV12 (вирт. камера принимает YUV) - только перестановкой
+    байтов V/U, без преобразования цвета. Уменьшение под output_size -
+    в 2/4 раза, как у декодеров JPEG. Результат пишется в буфер из pool
+    (buffer_pool.FramePool), если он задан, промежуточный кадр перед уменьшением -
+    в свой буфер у каждого потока декодирования.
+    """
+    name = 'nv21'
+
+    def __init__(self, pixel_format=BGR, output_size=None, pool=None):
+        self.pixel_format = pixel_format
+        self.output_size = output_size
+        self.pool = pool
+        self._local = threading.local()
+
+    def _scratch(self, shape):
+        buffer = getattr(self._local, 'scratch', None)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._local.scratch = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def decode(self, data, width, height):
+        if width % 2 or height % 2 or len(data) != width * height * 3 // 2:
+            return None
+        yuv = np.frombuffer(data, dtype=np.uint8).reshape(height * 3 // 2, width)
+        if self.pixel_format == NV12:
+            # Кадр копируется в любом случае: буфер приема сразу возвращается в пул.
+            frame = acquire(self.pool, yuv.shape)
+            frame[:height] = yuv[:height]
+            frame[height:, 0::2] = yuv[height:, 1::2]
+            frame[height:, 1::2] = yuv[height:, 0::2]
+            return frame
+        code = _NV21_CONVERSIONS[self.pixel_format]
+        scale = choose_scale(width, height, self.output_size)
+        if scale == 1:
+            return cv2.cvtColor(yuv, code, dst=acquire(self.pool, (height, width, 3)))
+        frame = cv2.cvtColor(yuv, code, dst=self._scratch((height, width, 3)))
+        size = (width // scale, height // scale)
+        return cv2.resize(frame, size, dst=acquire(self.pool, (size[1], size[0], 3)), interpolation=cv2.INTER_AREA)
+
+
+def frame_size(frame):
+    """(ширина, высота) кадра BGR/RGB или NV12 (двумерный массив высотой 3/2 кадра)."""
+    if frame.ndim == 2:
+        return frame.shape[1], frame.shape[0] * 2 // 3
+    return frame.shape[1], frame.shape[0]
+
+
+def frame_shape(width, height, pixel_format=BGR):
+    """Форма массива кадра width x height в формате BGR/RGB или NV12."""
+    if pixel_format == NV12:
+        return height * 3 // 2, width
+    return height, width, 3
+
+
+def nv12_to(frame, pixel_format=BGR, pool=None):
+    """Кадр NV12 -> BGR/RGB (для превью и для камеры, не принимающей YUV); результат - в буфер из pool."""
+    width, height = frame_size(frame)
+    return cv2.cvtColor(frame, _NV12_CONVERSIONS[pixel_format], dst=acquire(pool, (height, width, 3)))
+
+
+def to_nv12(frame, pixel_format=BGR, pool=None):
+    """
+    Кадр BGR/RGB -> NV12 (кадр JPEG для камеры, открытой в NV12). cvtColor пишет I420 сразу
+    в буфер результата, затем плоскости U и V (через копию в буфер из pool) чередуются на месте.
+    """
+    width, height = frame_size(frame)
+    code = cv2.COLOR_BGR2YUV_I420 if pixel_format == BGR else cv2.COLOR_RGB2YUV_I420
+    nv12 = cv2.cvtColor(frame, code, dst=acquire(pool, frame_shape(width, height, NV12)))
+    chroma = acquire(pool, (height // 2, width))
+    np.copyto(chroma, nv12[height:])
+    planes = chroma.reshape(2, -1)
+    interleaved = nv12[height:].reshape(-1)
+    interleaved[0::2] = planes[0]
+    interleaved[1::2] = planes[1]
+    return nv12
+
+
+def placeholder_frame(width, height, pixel_format=BGR, level=48):
+    """Серый кадр-заглушка width x height в формате BGR/RGB или NV12 (пока нет кадров с телефона)."""
+    if pixel_format == NV12:
+        frame = np.full((height * 3 // 2, width), 128, dtype=np.uint8)
+        frame[:height] = level
+        return frame
+    return np.full((height, width, 3), level, dtype=np.uint8)
+
+
+DECODERS = {decoder.name: decoder for decoder in (OpenCVDecoder, TurboJpegDecoder)}
+
+
+def available_decoders():
+    return [decoder for decoder in DECODERS.values() if decoder.is_available()]
+
+
+def _sample_jpeg(width=1280, height=720, quality=50):
+    """Синтетический кадр для стартового бенчмарка (градиент + шум, как у камеры)."""
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = gradient[None, :, None]
+    noise = np.random.default_rng(0).integers(0, 32, (height, width, 3), dtype=np.uint8)
+    image += noise
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
+
+
+def benchmark_decoders(pixel_format=BGR, output_size=None, iterations=20, sample=None):
+    """
+    Возвращает {имя: среднее время декодирования в мс} для доступных декодеров.
+    Декодер, который не смог декодировать пробный кадр, в результат не попадает.
+    """
+    sample = sample or _sample_jpeg()
+    results = {}
+    for decoder_cls in available_decoders():
+        decoder = decoder_cls(pixel_format, output_size)
+        if decoder.decode(sample) is None:
+            print(f"[!] Декодер {decoder_cls.name} не декодировал пробный кадр - не используется")
+            continue
+        started = time.perf_counter()
+        for _ in range(iterations):
+            decoder.decode(sample)
+        results[decoder_cls.name] = (time.perf_counter() - started) * 1000 / iterations
+    return results
+
+
+def create_decoder(backend='auto', pixel_format=BGR, output_size=None, pool=None):
+    """
+    Создает декодер. backend='auto' выбирает самый быстрый из доступных
+    по короткому бенчмарку (результат кешируется на время работы процесса).
+    """
+    if backend == 'auto':
+        key = (pixel_format, output_size)
+        backend = _benchmark_cache.get(key)
+        if backend is None:
+            timings = benchmark_decoders(pixel_format, output_size)
+            backend = min(timings, key=timings.get)
+            _benchmark_cache[key] = backend
+            summary = ', '.join(f"{name}: {ms:.1f} мс" for name, ms in timings.items())
+            print(f"[*] Бенчмарк декодеров ({summary}) -> выбран {backend}")
+    decoder_cls = DECODERS.get(backend)
+    if decoder_cls is None:
+        raise ValueError(f"Неизвестный декодер: {backend}")
+    if not decoder_cls.is_available():
+        raise RuntimeError(f"Декодер '{backend}' недоступен (не установлен PyTurboJPEG/libjpeg-turbo?)")
+    return decoder_cls(pixel_format, output_size, pool)
@@ -0,0 +1,232 @@
+"""
+Имитация сервера ADB (хост-протокол, см. adb_client.py) для проверки клиента без adb и телефона.
+
+Поддерживаются запросы:
+    host:version, host:devices, host:track-devices, host:list-forward
+    host[-serial:<serial>]:forward[:norebind]:<local>;<remote>
+    host[-serial:<serial>]:killforward:<local>
+Проброс портов только запоминается (соединения не проксируются). Устройства
+добавляются и удаляются методами set_device()/remove_device(): подписчики
+host:track-devices получают новый список сразу, как от настоящего сервера.
+
+Запуск из папки PhoneAsCamera_Server:
+    python -m fake_adb_server --port 5037 --device emulator-5554 --device R58M:unauthorized
+"""
+import argparse
+import socket
+import socketserver
+import sys
+import threading
+
+FAKE_VERSION = 0x29
+
+
+def _string(text):
+    data = text.encode('utf-8')
+    return f"{len(data):04x}".encode('ascii') + data
+
+
+def _fail(message):
+    return b'FAIL' + _string(message)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeAdbServer:
+    """Сервер ADB для тестов: devices - {serial: state}, forwards - {local: (serial, remote)}."""
+
+    def __init__(self, host='127.0.0.1', port=0, devices=None):
+        self.devices = dict(devices or {})
+        self.forwards = {}
+        self.requests = []
+        self._lock = threading.RLock()
+        self._trackers = []
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._handle(self.request)
+
+        self._server = _TCPServer((host, port), Handler)
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-adb', daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            trackers, self._trackers = self._trackers, []
+        for sock in trackers:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def set_device(self, serial, state='device'):
+        """Подключает устройство (или меняет его состояние) и оповещает track-devices."""
+        with self._lock:
+            self.devices[serial] = state
+        self._notify()
+
+    def remove_device(self, serial):
+        with self._lock:
+            self.devices.pop(serial, None)
+            self.forwards = {local: target for local, target in self.forwards.items() if target[0] != serial}
+        self._notify()
+
+    def _device_list(self):
+        with self._lock:
+            return ''.join(f"{serial}\t{state}\n" for serial, state in self.devices.items())
+
+    def _notify(self):
+        message = _string(self._device_list())
+        with self._lock:
+            trackers = list(self._trackers)
+        for sock in trackers:
+            try:
+                sock.sendall(message)
+            except OSError:
+                with self._lock:
+                    if sock in self._trackers:
+                        self._trackers.remove(sock)
+
+    def _read_request(self, sock):
+        length = b''
+        while len(length) < 4:
+            chunk = sock.recv(4 - len(length))
+            if not chunk:
+                return None
+            length += chunk
+        size = int(length, 16)
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data.decode('utf-8')
+
+    def _handle(self, sock):
+        request = self._read_request(sock)
+        if request is None:
+            return
+        self.requests.append(request)
+        if request == 'host:version':
+            sock.sendall(b'OKAY' + _string(f"{FAKE_VERSION:04x}"))
+        elif request == 'host:devices':
+            sock.sendall(b'OKAY' + _string(self._device_list()))
+        elif request == 'host:list-forward':
+            with self._lock:
+                lines = ''.join(f"{serial} {local} {remote}\n" for local, (serial, remote) in self.forwards.items())
+            sock.sendall(b'OKAY' + _string(lines))
+        elif request == 'host:track-devices':
+            # Под блокировкой: изменение списка не должно проскочить между ответом и подпиской.
+            with self._lock:
+                sock.sendall(b'OKAY' + _string(self._device_list()))
+                self._trackers.append(sock)
+            # Соединение остается открытым, пока клиент его не закроет.
+            try:
+                while sock.recv(1024):
+                    pass
+            except OSError:
+                pass
+            with self._lock:
+                if sock in self._trackers:
+                    self._trackers.remove(sock)
+        else:
+            sock.sendall(self._handle_device_request(request))
+
+    def _resolve(self, prefix):
+        """Устройство для запроса host/host-serial: (serial, None) или (None, сообщение об ошибке)."""
+        with self._lock:
+            devices = dict(self.devices)
+        if prefix.startswith('host-serial:'):
+            serial = prefix[len('host-serial:'):]
+            if serial not in devices:
+                return None, f"device '{serial}' not found"
+        else:
+            if not devices:
+                return None, "no devices/emulators found"
+            if len(devices) > 1:
+                return None, "more than one device/emulator"
+            serial = next(iter(devices))
+        if devices[serial] == 'unauthorized':
+            return None, "device unauthorized.\nThis adb server's $ADB_VENDOR_KEYS is not set"
+        if devices[serial] != 'device':
+            return None, f"device offline ({devices[serial]})"
+        return serial, None
+
+    def _handle_device_request(self, request):
+        for service in (':killforward:', ':forward:'):
+            prefix, found, argument = request.partition(service)
+            if found:
+                break
+        else:
+            return _fail(f"unknown host service '{request}'")
+        serial, error = self._resolve(prefix)
+        if error:
+            return _fail(error)
+        if service == ':killforward:':
+            with self._lock:
+                if argument not in self.forwards:
+                    return b'OKAY' + _fail(f"listener '{argument}' not found")
+                del self.forwards[argument]
+            return b'OKAYOKAY'
+        rebind = not argument.startswith('norebind:')
+        if not rebind:
+            argument = argument[len('norebind:'):]
+        local, _, remote = argument.partition(';')
+        with self._lock:
+            if local in self.forwards and not rebind:
+                return b'OKAY' + _fail("cannot rebind existing socket")
+            self.forwards[local] = (serial, remote)
+        return b'OKAYOKAY'
+
+
+def device_arg(value):
+    """Аргумент '--device SERIAL[:state]' -> (serial, state)."""
+    serial, _, state = value.partition(':')
+    return serial, state or 'device'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='fake_adb_server', description="Имитация сервера ADB для проверки клиента")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес для прослушивания")
+    parser.add_argument('--port', type=int, default=5037, help="порт (как у сервера ADB)")
+    parser.add_argument('--device', type=device_arg, action='append', default=[],
+                        help="устройство SERIAL[:state], можно несколько (state по умолчанию device)")
+    args = parser.parse_args(argv)
+
+    server = FakeAdbServer(args.host, args.port, dict(args.device))
+    server.start()
+    print(f"[*] Имитация сервера ADB слушает {server.host}:{server.port}, устройства: "
+          f"{', '.join(server.devices) or 'нет'}")
+    print("[*] Команды: add SERIAL [state], remove SERIAL, list; Ctrl+C - выход.")
+    try:
+        for line in sys.stdin:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == 'add':
+                server.set_device(parts[1], parts[2] if len(parts) > 2 else 'device')
+            elif len(parts) == 2 and parts[0] == 'remove':
+                server.remove_device(parts[1])
+            elif parts and parts[0] == 'list':
+                print(f"[*] Устройства: {server.devices}, пробросы: {server.forwards}")
+            elif parts:
+                print(f"[!] Неизвестная команда: {line.strip()}")
+    except KeyboardInterrupt:
+        print("[*] Остановка по Ctrl+C.")
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import asyncio
+import time
+
+from buffer_pool import BufferPool
+from protocol import CODEC_CONTROL, FRAME_HEADER_V1, FRAME_HEADER_V2, HANDSHAKE, HANDSHAKE_MAGIC, FrameInfo
+
+# Защита от мусорного заголовка: кадр больше этого размера считается ошибкой протокола.
+MAX_FRAME_SIZE = 32 * 1024 * 1024
+
+
+class FramePayload:
+    """
+    Принятый кадр: view - memoryview ровно на payload внутри переиспользуемого буфера,
+    info - поля заголовка протокола v2 (protocol.FrameInfo) или None для v1.
+    После декодирования кадр нужно вернуть читателю через FrameReader.release().
+    """
+    __slots__ = ('view', 'buffer', 'info')
+
+    def __init__(self, view, buffer, info=None):
+        self.view = view
+        self.buffer = buffer
+        self.info = info
+
+    def __len__(self):
+        return len(self.view)
+
+
+class FrameReader:
+    """
+    Читает кадры протокола v1 ('>I' длина + JPEG) или v2 (см. protocol.py)
+    без промежуточных копий.
+
+    Заголовок и данные читаются через socket.recv_into прямо в заранее
+    выделенные bytearray. Буферы переиспользуются (buffer_pool.BufferPool):
+    пока один кадр декодируется, следующий читается в другой буфер из пула.
+    Буфер, которого не хватает под кадр, заменяется новым большего размера
+    (bytearray с живыми memoryview нельзя расширять на месте).
+
+    read_frame() - для блокирующего сокета, read_frame_async() - для
+    неблокирующего сокета внутри asyncio (loop.sock_recv_into).
+    Если передан metrics (metrics.StreamMetrics), записываются времена чтения
+    заголовка и данных и размер каждого кадра.
+
+    По умолчанию ожидается v1; read_handshake_async() читает ответ телефона
+    на HELLO и переключает формат заголовка.
+    """
+
+    def __init__(self, sock, max_frame_size=MAX_FRAME_SIZE, metrics=None):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self.metrics = metrics
+        self.protocol = 1
+        # Один буфер под заголовок любой версии; _header_view - его часть для текущей версии.
+        self._header = bytearray(max(FRAME_HEADER_V2.size, HANDSHAKE.size))
+        self._header_view = memoryview(self._header)[:FRAME_HEADER_V1.size]
+        self._header_pending = False
+        self._skip = bytearray(0)
+        self.pool = BufferPool()
+
+    def _recv_exact_into(self, view):
+        """Заполняет view целиком. Исключение ConnectionAbortedError - если сокет закрыт."""
+        received = 0
+        size = len(view)
+        while received < size:
+            count = self.sock.recv_into(view[received:], size - received)
+            if count == 0:
+                raise ConnectionAbortedError("Сокет закрыт удаленно")
+            received += count
+
+    async def _recv_exact_into_async(self, view):
+        loop = asyncio.get_running_loop()
+        received = 0
+        size = len(view)
+        while received < size:
+            count = await loop.sock_recv_into(self.sock, view[received:])
+            if count == 0:
+                raise ConnectionAbortedError("Сокет закрыт удаленно")
+            received += count
+
+    def set_protocol(self, version):
+        """Переключает формат заголовка кадров (1 или 2)."""
+        self.protocol = version
+        header = FRAME_HEADER_V2 if version >= 2 else FRAME_HEADER_V1
+        self._header_view = memoryview(self._header)[:header.size]
+
+    async def read_handshake_async(self):
+        """
+        Читает ответ телефона на HELLO: (версия, время телефона в мкс) или None,
+        если телефон сразу начал слать кадры v1 (прочитанные байты - заголовок первого кадра).
+        """
+        magic = memoryview(self._header)[:len(HANDSHAKE_MAGIC)]
+        await self._recv_exact_into_async(magic)
+        if magic != HANDSHAKE_MAGIC:
+            self.set_protocol(1)
+            self._header_pending = True
+            return None
+        await self._recv_exact_into_async(memoryview(self._header)[len(HANDSHAKE_MAGIC):HANDSHAKE.size])
+        _, version, phone_time_us = HANDSHAKE.unpack_from(self._header)
+        self.set_protocol(version)
+        return version, phone_time_us
+
+    def _parse_header(self):
+        """Разбирает заголовок: (размер данных, FrameInfo или None, число байт заголовка для пропуска)."""
+        if self.protocol < 2:
+            size, info, extra = FRAME_HEADER_V1.unpack_from(self._header)[0], None, 0
+        else:
+            header_size, size, sequence, capture_us, codec, camera_id, width, height = \
+                FRAME_HEADER_V2.unpack_from(self._header)
+            if header_size < FRAME_HEADER_V2.size:
+                raise ConnectionAbortedError(f"Некорректный размер заголовка кадра: {header_size} байт")
+            info = FrameInfo(sequence, capture_us, codec, camera_id, width, height)
+            extra = header_size - FRAME_HEADER_V2.size
+        if size == 0:
+            raise ConnectionAbortedError("Сервер прислал нулевой размер.")
+        if size > self.max_frame_size:
+            raise ConnectionAbortedError(f"Некорректный размер кадра: {size} байт")
+        return size, info, extra
+
+    def _skip_view(self, count):
+        """Буфер для неизвестных (более новых) полей заголовка, которые пропускаются."""
+        if len(self._skip) < count:
+            self._skip = bytearray(count)
+        return memoryview(self._skip)[:count]
+
+    def _record(self, started, header_done, size, info):
+        # Служебные сообщения (ответы на команды, v3) - не кадры.
+        if self.metrics and (info is None or info.codec != CODEC_CONTROL):
+            sequence = info.sequence if info is not None else None
+            self.metrics.record('header_recv', header_done - started, header_done, sequence)
+            self.metrics.record('payload_recv', time.perf_counter() - header_done, frame=sequence)
+            self.metrics.frame_received(size)
+
+    def read_frame(self):
+        """Читает один кадр и возвращает FramePayload."""
+        started = time.perf_counter()
+        if self._header_pending:
+            self._header_pending = False
+        else:
+            self._recv_exact_into(self._header_view)
+        size, info, extra = self._parse_header()
+        if extra:
+            self._recv_exact_into(self._skip_view(extra))
+        header_done = time.perf_counter()
+        buffer = self.pool.acquire(size)
+        view = memoryview(buffer)[:size]
+        try:
+            self._recv_exact_into(view)
+        except BaseException:
+            self.release(FramePayload(view, buffer))
+            raise
+        self._record(started, header_done, size, info)
+        return FramePayload(view, buffer, info)
+
+    async def read_frame_async(self):
+        """Асинхронный вариант read_frame() для неблокирующего сокета."""
+        started = time.perf_counter()
+        if self._header_pending:
+            self._header_pending = False
+        else:
+            await self._recv_exact_into_async(self._header_view)
+        size, info, extra = self._parse_header()
+        if extra:
+            await self._recv_exact_into_async(self._skip_view(extra))
+        header_done = time.perf_counter()
+        buffer = self.pool.acquire(size)
+        view = memoryview(buffer)[:size]
+        try:
+            await self._recv_exact_into_async(view)
+        except BaseException:
+            self.release(FramePayload(view, buffer))
+            raise
+        self._record(started, header_done, size, info)
+        return FramePayload(view, buffer, info)
+
+    def release(self, payload):
+        """Возвращает буфер кадра в пул для повторного использования."""
+        if payload is None or payload.buffer is None:
+            return
+        buffer = payload.buffer
+        payload.buffer = None
+        self.pool.release(buffer)
@@ -0,0 +1,267 @@
+"""
+Поток H.264 от телефона: разбор Annex-B, декодирование (PyAV/FFmpeg) и кодирование для симулятора.
+
+Телефон кодирует кадры аппаратным кодером (MediaCodec) и шлет каждый закодированный кадр
+(access unit, NAL-блоки Annex-B со стартовыми кодами) отдельным сообщением протокола v2
+с кодеком CODEC_H264. Перед каждым ключевым кадром (IDR) телефон повторяет SPS/PPS,
+поэтому декодирование можно начать с любого ключевого кадра.
+
+Декодер хранит состояние между кадрами: кадры декодируются строго по порядку в одном потоке,
+а после потери кадра (пропуск номера, кадр выброшен из очереди, ошибка декодирования)
+следующие кадры пропускаются до ключевого, который декодер запрашивает у телефона
+командой CMD:KEYFRAME (не чаще KEYFRAME_REQUEST_INTERVAL).
+
+Если кадры приходят не сообщениями, а сплошным байтовым потоком Annex-B произвольными кусками
+(файл .h264, кодер без разбивки на кадры), AnnexBParser режет его на access unit'ы.
+
+PyAV - необязательная зависимость (pip install av): без нее режим H.264 недоступен.
+"""
+import fractions
+import re
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+from buffer_pool import FramePool, acquire
+from decoders import BGR, NV12, RGB, frame_shape
+
+START_CODE = b'\x00\x00\x01'
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+# Не чаще одного запроса ключевого кадра за столько секунд (ответ идет через сеть и кодер).
+KEYFRAME_REQUEST_INTERVAL = 0.5
+# Битрейт кодера симулятора, бит/с на пиксель кадра в секунду (~2.8 Мбит/с для 720p30).
+ENCODER_BITS_PER_PIXEL = 0.1
+ENCODER_KEYFRAME_INTERVAL = 2.0
+
+_START_CODE_RE = re.compile(re.escape(START_CODE))
+_AV_FORMATS = {BGR: 'bgr24', RGB: 'rgb24', NV12: 'nv12'}
+_I420_CONVERSIONS = {BGR: cv2.COLOR_YUV2BGR_I420, RGB: cv2.COLOR_YUV2RGB_I420}
+
+
+def is_available():
+    return av is not None
+
+
+def is_keyframe(data):
+    """
+    Есть ли в access unit кадр IDR. NAL-блоки просматриваются только до первого среза
+    (SPS/PPS/SEI идут перед ним) и без копирования: re ищет прямо в memoryview буфера приема.
+    """
+    length = len(data)
+    for match in _START_CODE_RE.finditer(data):
+        start = match.end()
+        if start < length:
+            kind = data[start] & 0x1F
+            if kind == NAL_IDR:
+                return True
+            if kind == NAL_SLICE:
+                return False
+    return False
+
+
+class AnnexBParser:
+    """
+    Инкрементальный разбор потока Annex-B на access unit'ы. feed(chunk) принимает кусок потока
+    любой длины (стартовый код и заголовок NAL могут разрываться между кусками) и возвращает
+    список законченных access unit (bytes), flush() - последний, недописанный.
+
+    Новый access unit начинается с AUD, SEI, SPS или PPS либо со среза, у которого
+    first_mb_in_slice = 0 (старший бит первого байта после заголовка NAL), если в текущем
+    уже есть срез. Нулевой байт четырехбайтового стартового кода относится к следующему кадру.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Откуда искать следующий стартовый код: все до этой позиции уже разобрано.
+        self._position = 0
+        self._has_slice = False
+
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        units = []
+        position = self._position
+        while True:
+            start = buffer.find(START_CODE, position)
+            if start < 0:
+                # Стартовый код может начинаться в последних двух байтах куска.
+                position = max(position, len(buffer) - 2)
+                break
+            header = start + len(START_CODE)
+            if header + 1 >= len(buffer):
+                # Тип NAL и первый байт среза еще не пришли.
+                position = start
+                break
+            kind = buffer[header] & 0x1F
+            is_slice = kind in (NAL_SLICE, NAL_IDR)
+            if self._has_slice and ((is_slice and buffer[header + 1] & 0x80) or
+                                    kind in (NAL_AUD, NAL_SEI, NAL_SPS, NAL_PPS)):
+                cut = start - 1 if start and buffer[start - 1] == 0 else start
+                units.append(bytes(buffer[:cut]))
+                del buffer[:cut]
+                header -= cut
+                self._has_slice = False
+            if is_slice:
+                self._has_slice = True
+            position = header
+        self._position = position
+        return units
+
+    def flush(self):
+        """Остаток потока - последний access unit (None, если пусто)."""
+        unit = bytes(self._buffer) if self._buffer else None
+        self._buffer.clear()
+        self._position = 0
+        self._has_slice = False
+        return unit
+
+
+class H264Decoder:
+    """
+    Декодер кадров H.264 (по одному access unit на сообщение) в BGR/RGB или NV12.
+
+    decode() вызывается из одного потока по порядку кадров. request_keyframe() - вызывается,
+    когда нужен ключевой кадр (например, StreamEngine.send_command с CMD:KEYFRAME).
+
+    Кадр yuv420p читается прямо из плоскостей FFmpeg (без VideoFrame.to_ndarray, который
+    выделяет массив на кадр): в NV12 - чередованием U/V, в BGR/RGB - cvtColor из I420.
+    Результат пишется в буфер из pool (buffer_pool.FramePool), если он задан.
+    """
+    name = 'h264'
+
+    def __init__(self, pixel_format=BGR, request_keyframe=None, pool=None):
+        if av is None:
+            raise RuntimeError("Для H.264 нужен пакет PyAV (pip install av)")
+        self.pixel_format = pixel_format
+        self.request_keyframe = request_keyframe
+        self.pool = pool
+        # Промежуточный кадр I420 для cvtColor: decode() идет в одном потоке, хватает одного буфера.
+        self._i420 = FramePool(1)
+        self.keyframes = 0
+        self.keyframe_requests = 0
+        self.skipped = 0
+        self.errors = 0
+        self._context = None
+        self._last_sequence = None
+        self._waiting_for_keyframe = True
+        self._last_request = None
+        self.reset()
+
+    def reset(self):
+        """Новый поток (например, после переподключения): декодирование - с ключевого кадра."""
+        context = av.CodecContext.create('h264', 'r')
+        # Потоки по срезам, а не по кадрам: многопоточность по кадрам задерживает вывод на кадр на поток.
+        context.thread_type = 'SLICE'
+        self._context = context
+        self._last_sequence = None
+        self._waiting_for_keyframe = True
+        self._last_request = None
+
+    def _need_keyframe(self, reason):
+        if not self._waiting_for_keyframe:
+            print(f"[*] H.264: {reason}, ожидание ключевого кадра")
+        self._waiting_for_keyframe = True
+        now = time.perf_counter()
+        if self.request_keyframe and (self._last_request is None or
+                                      now - self._last_request >= KEYFRAME_REQUEST_INTERVAL):
+            self._last_request = now
+            self.keyframe_requests += 1
+            self.request_keyframe()
+
+    def decode(self, data, sequence=None):
+        """Кадр из одного access unit или None (кадр пропущен до ключевого или не декодировался)."""
+        if sequence is not None:
+            if self._last_sequence is not None and sequence != (self._last_sequence + 1) & 0xFFFFFFFF:
+                self._need_keyframe(f"потеряно кадров: {(sequence - self._last_sequence - 1) & 0xFFFFFFFF}")
+            self._last_sequence = sequence
+        keyframe = is_keyframe(data)
+        if keyframe:
+            self.keyframes += 1
+        if self._waiting_for_keyframe:
+            if not keyframe:
+                self.skipped += 1
+                self._need_keyframe("нет ключевого кадра")
+                return None
+            self._waiting_for_keyframe = False
+        try:
+            frames = self._context.decode(av.Packet(data))
+        except av.FFmpegError as e:
+            self.errors += 1
+            self._need_keyframe(f"ошибка декодирования ({e})")
+            return None
+        if not frames:
+            return None
+        return self._to_ndarray(frames[-1])
+
+    def _to_ndarray(self, frame):
+        width, height = frame.width, frame.height
+        if frame.format.name != 'yuv420p' or width % 2 or height % 2:
+            return frame.to_ndarray(format=_AV_FORMATS[self.pixel_format])
+        # Строки плоскостей FFmpeg выровнены (line_size >= ширины): берем только видимую часть.
+        y, u, v = (np.frombuffer(plane, dtype=np.uint8).reshape(-1, plane.line_size)[:, :plane.width]
+                   for plane in frame.planes)
+        if self.pixel_format == NV12:
+            nv12 = acquire(self.pool, frame_shape(width, height, NV12))
+            nv12[:height] = y
+            uv = nv12[height:].reshape(height // 2, width // 2, 2)
+            uv[..., 0] = u
+            uv[..., 1] = v
+            return nv12
+        i420 = self._i420.acquire(frame_shape(width, height, NV12))
+        i420[:height] = y
+        chroma = i420[height:].reshape(2, height // 2, width // 2)
+        chroma[0] = u
+        chroma[1] = v
+        return cv2.cvtColor(i420, _I420_CONVERSIONS[self.pixel_format], dst=acquire(self.pool, (height, width, 3)))
+
+    def stats(self):
+        return {'keyframes': self.keyframes, 'keyframe_requests': self.keyframe_requests,
+                'skipped': self.skipped, 'errors': self.errors}
+
+
+class H264Encoder:
+    """
+    Кодер H.264 для симулятора телефона (libx264 через PyAV) с настройками, как у телефона:
+    без B-кадров и задержки в кодере, SPS/PPS перед каждым ключевым кадром.
+    encode(image, keyframe=True) делает кадр ключевым (ответ на CMD:KEYFRAME).
+    """
+
+    def __init__(self, width, height, fps, pixel_format=BGR):
+        if av is None:
+            raise RuntimeError("Для H.264 нужен пакет PyAV (pip install av)")
+        context = av.CodecContext.create('libx264', 'w')
+        context.width = width
+        context.height = height
+        context.pix_fmt = 'yuv420p'
+        context.time_base = fractions.Fraction(1, 1000000)
+        context.framerate = fractions.Fraction(int(round(fps)), 1)
+        context.gop_size = max(1, int(fps * ENCODER_KEYFRAME_INTERVAL))
+        context.max_b_frames = 0
+        context.bit_rate = int(width * height * fps * ENCODER_BITS_PER_PIXEL)
+        context.options = {'preset': 'ultrafast', 'tune': 'zerolatency', 'forced-idr': '1',
+                           'x264-params': 'repeat-headers=1'}
+        self.width = width
+        self.height = height
+        self._context = context
+        self._av_format = _AV_FORMATS[pixel_format]
+        self._started = time.perf_counter()
+
+    def encode(self, image, keyframe=False):
+        """Кадр BGR/RGB -> access unit Annex-B (bytes; пусто, если кодер еще не выдал кадр)."""
+        frame = av.VideoFrame.from_ndarray(image, format=self._av_format)
+        frame.pts = int((time.perf_counter() - self._started) * 1000000)
+        frame.time_base = self._context.time_base
+        if keyframe:
+            frame.pict_type = av.video.frame.PictureType.I
+        return b''.join(bytes(packet) for packet in self._context.encode(frame))
@@ -0,0 +1,95 @@
+"""
+Адаптивный буфер сглаживания (jitter buffer) между декодированием и выводом в вирт. камеру.
+
+Кадры приходят из сети неравномерно (джиттер Wi-Fi, пачки после задержек), а камера
+должна получать их ровно раз в такт target_fps. Декодированные кадры кладутся в буфер
+(push), а часы вывода забирают по одному кадру за такт (pop):
+  - глубина буфера (target) подбирается по разбросу интервалов между кадрами:
+    percentile интервалов, выраженный в тактах, в пределах [min_depth, max_depth];
+  - если буфер опустел, pop() возвращает None (часы повторяют предыдущий кадр),
+    а вывод возобновляется, только когда снова накопится target кадров;
+  - если в буфере дольше trim_ticks тактов подряд лишние кадры, самый старый
+    выбрасывается - задержка не растет бесконечно (при переполнении max_depth - сразу).
+Чем больше percentile и max_depth, тем ровнее вывод и тем больше задержка.
+"""
+import collections
+import threading
+import time
+
+from metrics import RollingHistogram
+
+# Сколько последних интервалов между кадрами учитывается при выборе глубины.
+INTERVAL_WINDOW = 90
+
+
+class JitterBuffer:
+    """
+    Буфер кадров для часов вывода; push() и pop() вызываются из разных потоков.
+    clock - источник времени в секундах (в тестах - управляемые часы).
+    """
+
+    def __init__(self, fps, min_depth=1, max_depth=4, percentile=0.95, trim_ticks=None, clock=time.perf_counter):
+        self.clock = clock
+        self.tick = 1.0 / fps
+        self.min_depth = max(1, min_depth)
+        self.max_depth = max(self.min_depth, max_depth)
+        self.percentile = percentile
+        self.trim_ticks = trim_ticks or max(1, int(fps / 2))
+        self.target = self.min_depth
+        self.underruns = 0
+        self.trimmed = 0
+        self.delay = RollingHistogram()
+        self._items = collections.deque()
+        self._intervals = collections.deque(maxlen=INTERVAL_WINDOW)
+        self._last_push = None
+        self._buffering = True
+        self._excess_ticks = 0
+        self._lock = threading.Lock()
+
+    def push(self, item):
+        now = self.clock()
+        with self._lock:
+            if self._last_push is not None:
+                self._intervals.append(now - self._last_push)
+                self.target = self._target_depth()
+            self._last_push = now
+            self._items.append((now, item))
+            while len(self._items) > self.max_depth:
+                self._items.popleft()
+                self.trimmed += 1
+
+    def _target_depth(self):
+        intervals = sorted(self._intervals)
+        interval = intervals[min(len(intervals) - 1, int(len(intervals) * self.percentile))]
+        depth = int(interval / self.tick + 0.5)
+        return max(self.min_depth, min(self.max_depth, depth))
+
+    def pop(self):
+        """Кадр для очередного такта или None (буфер пуст или накапливается после опустошения)."""
+        with self._lock:
+            depth = len(self._items)
+            if self._buffering:
+                if depth < self.target:
+                    return None
+                self._buffering = False
+            if not depth:
+                self.underruns += 1
+                self._buffering = True
+                return None
+            if depth > self.target:
+                self._excess_ticks += 1
+                if self._excess_ticks >= self.trim_ticks:
+                    self._items.popleft()
+                    self.trimmed += 1
+                    self._excess_ticks = 0
+            else:
+                self._excess_ticks = 0
+            pushed, item = self._items.popleft()
+        self.delay.add(self.clock() - pushed)
+        return item
+
+    def stats(self):
+        with self._lock:
+            depth = len(self._items)
+        return {'depth': depth, 'target': self.target, 'underruns': self.underruns,
+                'trimmed': self.trimmed, 'delay_ms': self.delay.snapshot()}
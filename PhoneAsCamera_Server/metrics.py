@@ -0,0 +1,269 @@
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Стадии обработки кадра, для которых собираются времена:
+#   header_recv  - ожидание и чтение заголовка (сюда входит простой сети/телефона);
+#   payload_recv - чтение данных кадра;
+#   decode       - декодирование JPEG;
+#   transform    - приведение кадра к размеру и ориентации камеры (transform.py);
+#   convert      - преобразование формата для камеры (NV12 <-> BGR/RGB), если оно нужно;
+#   preview      - уменьшение кадра для превью;
+#   send         - cam.send;
+#   pacing       - ожидание темпа (sleep_until_next_frame, с часами вывода - в их потоке).
+STAGES = ('header_recv', 'payload_recv', 'decode', 'transform', 'convert', 'preview', 'send', 'pacing')
+# Сколько последних значений хранит каждая гистограмма.
+METRICS_WINDOW = 300
+# Окно, по которому считаются FPS и байт/с (секунды).
+RATE_WINDOW = 2.0
+
+
+class RollingHistogram:
+    """Последние window значений с процентилями (значения в секундах, отчет в мс)."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self._values = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self._values.append(value)
+
+    def recent_mean(self, count):
+        """Среднее последних count значений (в секундах) или None, если значений нет."""
+        with self._lock:
+            values = list(self._values)[-count:] if count > 0 else []
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+    def snapshot(self, scale=1000.0):
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return {'count': 0}
+        count = len(values)
+        return {
+            'count': count,
+            'mean': sum(values) / count * scale,
+            'p50': values[count // 2] * scale,
+            'p95': values[min(count - 1, int(count * 0.95))] * scale,
+            'p99': values[min(count - 1, int(count * 0.99))] * scale,
+            'max': values[-1] * scale,
+        }
+
+
+class RateMeter:
+    """Частота событий и суммарный объем за последние window секунд."""
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+    def add(self, amount=1, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self._events.append((now, amount))
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
+
+    def rates(self, now=None):
+        """Возвращает (событий в секунду, объем в секунду)."""
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self._trim(now)
+            if len(self._events) < 2:
+                return 0.0, 0.0
+            span = now - self._events[0][0]
+            total = sum(amount for _, amount in self._events)
+            count = len(self._events)
+        if span <= 0:
+            return 0.0, 0.0
+        return count / span, total / span
+
+
+class StreamMetrics:
+    """
+    Метрики одного потока: времена стадий, FPS приема и вывода, байт/с, размеры кадров.
+    Для протокола v2 также задержки "съемка на телефоне -> прием" и "съемка -> вывод"
+    и число потерянных кадров (пропуски в номерах кадров), для v3 - время подтверждения
+    команд телефоном (RTT) и число неподтвержденных команд. При переподключении - число
+    разрывов связи, время восстановления и число повторенных в камеру кадров.
+    Запись из любых потоков; snapshot() возвращает словарь, пригодный для JSON.
+    Если задан tracer (tracing.Tracer), каждое время стадии попадает и в трассировку.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.stages = {name: RollingHistogram(window) for name in STAGES}
+        self.frame_sizes = RollingHistogram(window)
+        self.capture_latency = RollingHistogram(window)
+        self.transfer_latency = RollingHistogram(window)
+        self.lost_frames = 0
+        self.command_rtt = RollingHistogram(window)
+        self.commands_unacked = 0
+        self.outages = 0
+        self.reconnect_time = RollingHistogram(window)
+        self.held_frames = 0
+        self.received = RateMeter()
+        self.output = RateMeter()
+        self.total_frames = 0
+        self.total_bytes = 0
+        self.started = time.time()
+        self.tracer = None
+
+    def record(self, stage, seconds, end=None, frame=None):
+        """Время стадии; end - момент ее окончания (по умолчанию - сейчас), frame - номер кадра (v2)."""
+        self.stages[stage].add(seconds)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.complete(stage, seconds, end, {'frame': frame} if frame is not None else None)
+
+    def frame_received(self, size):
+        self.total_frames += 1
+        self.total_bytes += size
+        self.frame_sizes.add(size)
+        self.received.add(size)
+
+    def frame_output(self):
+        self.output.add()
+
+    def frames_lost(self, count):
+        self.lost_frames += count
+        self._instant('frames_lost', {'count': count})
+
+    def record_capture_latency(self, seconds):
+        self.capture_latency.add(seconds)
+
+    def record_transfer_latency(self, seconds):
+        self.transfer_latency.add(seconds)
+
+    def record_command_rtt(self, seconds):
+        self.command_rtt.add(seconds)
+
+    def command_unacked(self):
+        self.commands_unacked += 1
+
+    def outage(self):
+        self.outages += 1
+        self._instant('outage')
+
+    def record_reconnect(self, seconds):
+        self.reconnect_time.add(seconds)
+        self._instant('reconnected', {'ms': seconds * 1000})
+
+    def frame_held(self):
+        self.held_frames += 1
+        self._instant('frame_held')
+
+    def _instant(self, name, args=None):
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.instant(name, args)
+
+    def snapshot(self, **counters):
+        receive_fps, receive_bps = self.received.rates()
+        output_fps, _ = self.output.rates()
+        return {
+            'uptime': time.time() - self.started,
+            'receive_fps': receive_fps,
+            'output_fps': output_fps,
+            'bytes_per_second': receive_bps,
+            'total_frames': self.total_frames,
+            'total_bytes': self.total_bytes,
+            'frame_size_kb': self.frame_sizes.snapshot(scale=1 / 1024),
+            'stages_ms': {name: hist.snapshot() for name, hist in self.stages.items()},
+            'capture_latency_ms': self.capture_latency.snapshot(),
+            'transfer_latency_ms': self.transfer_latency.snapshot(),
+            'lost_frames': self.lost_frames,
+            'command_rtt_ms': self.command_rtt.snapshot(),
+            'commands_unacked': self.commands_unacked,
+            'outages': self.outages,
+            'reconnect_ms': self.reconnect_time.snapshot(),
+            'held_frames': self.held_frames,
+            **counters,
+        }
+
+
+def format_stats(stats):
+    """Короткая строка для статуса GUI и консоли."""
+    stages = stats.get('stages_ms', {})
+
+    def stage(name):
+        data = stages.get(name, {})
+        if not data.get('count'):
+            return "-"
+        return f"{data['p50']:.1f}/{data['p95']:.1f}"
+
+    text = (f"Прием {stats.get('receive_fps', 0):.1f} к/с, {stats.get('bytes_per_second', 0) / 1048576:.2f} МБ/с"
+            f" | вывод {stats.get('output_fps', 0):.1f} к/с"
+            f" | сеть {stage('payload_recv')} мс, декод. {stage('decode')} мс, отправка {stage('send')} мс"
+            f" | пропущено {stats.get('dropped', 0)}, ошибок декод. {stats.get('decode_failed', 0)}")
+    latency = stats.get('capture_latency_ms', {})
+    if latency.get('count'):
+        text += (f" | съемка->вывод {latency['p50']:.0f}/{latency['p95']:.0f} мс,"
+                 f" потеряно {stats.get('lost_frames', 0)}")
+    rtt = stats.get('command_rtt_ms', {})
+    if rtt.get('count'):
+        text += f" | отклик телефона {rtt['p50']:.0f}/{rtt['max']:.0f} мс"
+    jitter = stats.get('jitter_buffer')
+    if jitter:
+        text += (f" | буфер {jitter['depth']}/{jitter['target']} кадр., опустошений {jitter['underruns']},"
+                 f" сброшено {jitter['trimmed']}")
+    if stats.get('reconnecting'):
+        text += " | переподключение..."
+    if stats.get('outages'):
+        reconnect = stats.get('reconnect_ms', {})
+        text += f" | разрывов связи {stats['outages']}"
+        if reconnect.get('count'):
+            text += f", восстановление {reconnect['p50']:.0f}/{reconnect['max']:.0f} мс"
+    return text
+
+
+class StatsServer:
+    """
+    Локальный HTTP-эндпоинт со статистикой в JSON (GET /stats).
+    provider() возвращает словарь, который отдается клиенту.
+    """
+
+    def __init__(self, provider, port, host='127.0.0.1'):
+        self.provider = provider
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        provider = self.provider
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/stats'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(provider(), ensure_ascii=False, indent=2).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stats-http', daemon=True)
+        self._thread.start()
+        print(f"[*] Статистика доступна по адресу http://{self.host}:{self.port}/stats")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
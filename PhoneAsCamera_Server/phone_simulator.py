@@ -0,0 +1,593 @@
+"""
+Симулятор телефона: локальный сервер с тем же протоколом, что и MainActivity.kt
+(v1, v2 и v3 с рукопожатием, см. protocol.py; команды текстовыми строками, например CMD:SWITCH_CAM,
+в v3 телефон подтверждает каждую команду ответом ACK/NAK в потоке кадров).
+Позволяет проверять и измерять клиент без телефона.
+
+Запуск из папки PhoneAsCamera_Server:
+    python -m phone_simulator --port 8888 --resolution 1280x720 --fps 30
+    python -m phone_simulator --corpus ./jpegs --jitter 0.01 --stall-every 90 --stall-duration 0.5
+    python -m phone_simulator --protocol 1        # как старое приложение на телефоне
+    python -m phone_simulator --codec nv21        # несжатые кадры с самого начала (как по команде CMD:CODEC)
+    python -m phone_simulator --codec h264        # H.264 (libx264 через PyAV вместо MediaCodec)
+    python -m phone_simulator --udp-loss 0.01 --udp-reorder 0.02   # потери и перестановки датаграмм UDP
+После запуска подключитесь клиентом в режиме Wi-Fi к 127.0.0.1.
+"""
+import argparse
+import glob
+import os
+import random
+import select
+import socket
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import h264
+from protocol import (PROTOCOL_VERSION, CONTROL_PROTOCOL_VERSION, HANDSHAKE, HANDSHAKE_MAGIC,
+                      FRAME_HEADER_V1, FRAME_HEADER_V2, CODEC_CONTROL, CODEC_JPEG, CODEC_NV21, CODEC_H264,
+                      CODEC_NAMES, CODEC_COMMAND, KEYFRAME_COMMAND, TRANSPORT_COMMAND, TRANSPORT_UDP,
+                      CAMERA_BACK, CAMERA_FRONT, fragment_message, parse_codec, parse_hello, parse_tagged_command,
+                      parse_transport, reply_message)
+from quality_controller import QUALITY_COMMAND, MAX_RES_COMMAND, parse_resolution
+
+DEFAULT_RESOLUTION = (1280, 720)
+DEFAULT_FPS = 30
+# Качество JPEG, с которым кодирует телефон (YuvImage.compressToJpeg).
+DEFAULT_QUALITY = 50
+# Размер порции данных при ограничении пропускной способности (--bandwidth).
+SEND_CHUNK = 16 * 1024
+# Сколько телефон ждет приветствия HELLO от клиента, прежде чем перейти на v1 (секунды).
+HELLO_TIMEOUT = 1.0
+
+# Каждый кадр несет в верхней полосе номер (по модулю MARKER_CYCLE), по которому
+# приемник находит время отправки и считает задержку "отправка -> вирт. камера".
+MARKER_BITS = 6
+MARKER_CYCLE = 1 << MARKER_BITS
+# Полоса: белый и черный опорные блоки, затем биты номера.
+MARKER_BLOCKS = MARKER_BITS + 2
+
+
+def draw_frame_marker(frame, index):
+    """Рисует номер кадра (index % MARKER_CYCLE) блоками в верхней полосе кадра."""
+    height, width = frame.shape[:2]
+    band = max(8, height // 16)
+    value = index % MARKER_CYCLE
+    levels = [255, 0] + [255 if value & (1 << bit) else 0 for bit in range(MARKER_BITS)]
+    for block, level in enumerate(levels):
+        x0 = block * width // MARKER_BLOCKS
+        x1 = (block + 1) * width // MARKER_BLOCKS
+        frame[:band, x0:x1] = level
+    return frame
+
+
+def read_frame_marker(frame):
+    """Читает номер кадра, нарисованный draw_frame_marker; None - если полоса не распознана."""
+    height, width = frame.shape[:2]
+    band = max(1, height // 16)
+    y = band // 2
+    samples = []
+    for block in range(MARKER_BLOCKS):
+        x = (2 * block + 1) * width // (2 * MARKER_BLOCKS)
+        samples.append(float(np.mean(frame[y, x])))
+    white, black = samples[0], samples[1]
+    if white - black < 64:
+        return None
+    threshold = (white + black) / 2
+    value = 0
+    for bit, level in enumerate(samples[2:]):
+        if level > threshold:
+            value |= 1 << bit
+    return value
+
+
+def bgr_to_nv21(image):
+    """Кадр BGR -> NV21 (как кадр камеры телефона: плоскость Y, затем чередующиеся V/U)."""
+    height, width = image.shape[:2]
+    i420 = cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420).reshape(-1)
+    y_size = width * height
+    quarter = y_size // 4
+    nv21 = np.empty(y_size * 3 // 2, dtype=np.uint8)
+    nv21[:y_size] = i420[:y_size]
+    nv21[y_size::2] = i420[y_size + quarter:]
+    nv21[y_size + 1::2] = i420[y_size:y_size + quarter]
+    return nv21.tobytes()
+
+
+def synthetic_image(width, height, index):
+    """Синтетическая сцена: цветной градиент с движущейся полосой и номером кадра."""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x + index * 4) % 256
+    image[..., 1] = y
+    image[..., 2] = (x[::-1] + y) / 2
+    bar = (index * 8) % width
+    image[:, bar:bar + max(4, width // 64)] = 255
+    scale = max(1.0, height / 360)
+    cv2.putText(image, f"{index:05d}", (width // 20, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                2 * scale, (255, 255, 255), int(3 * scale), cv2.LINE_AA)
+    return image
+
+
+def load_corpus(path, resolution=None):
+    """Загружает JPEG/PNG из папки (или один файл); resolution=(w, h) - привести к размеру."""
+    if os.path.isdir(path):
+        files = sorted(f for pattern in ('*.jpg', '*.jpeg', '*.png')
+                       for f in glob.glob(os.path.join(path, pattern)))
+    else:
+        files = [path]
+    images = []
+    for name in files:
+        image = cv2.imread(name, cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"[!] Не удалось прочитать {name}, пропуск.")
+            continue
+        if resolution and (image.shape[1], image.shape[0]) != tuple(resolution):
+            image = cv2.resize(image, tuple(resolution), interpolation=cv2.INTER_AREA)
+        images.append(image)
+    if not images:
+        raise ValueError(f"В '{path}' нет изображений для воспроизведения")
+    return images
+
+
+class PhoneSimulator:
+    """
+    Сервер, который ведет себя как приложение на телефоне.
+
+    Кадры кодируются заранее (MARKER_CYCLE штук на каждую "камеру"), поэтому
+    симулятор сам почти не тратит CPU во время передачи. Источник кадров -
+    синтетическая сцена или корпус изображений (corpus). CMD:SWITCH_CAM
+    переключает "камеру" (фронтальная отдается зеркально), CMD:QUALITY=<n> и
+    CMD:MAX_RES=<w>x<h> перекодируют кадры с новым качеством и размером, как
+    приложение на телефоне (качество сбрасывается при каждом подключении).
+    CMD:CODEC=NV21 переключает на несжатые кадры (только v2), CMD:CODEC=JPEG - обратно.
+    CMD:CODEC=H264 - на H.264: кадры кодируются на лету (libx264 через PyAV, как MediaCodec
+    на телефоне - без B-кадров, SPS/PPS перед каждым ключевым кадром), CMD:KEYFRAME делает
+    следующий кадр ключевым. Без PyAV телефон отвечает на CMD:CODEC=H264 отказом (NAK).
+    CMD:TRANSPORT=UDP:<порт> переключает кадры на датаграммы UDP на адрес клиента (см. protocol.py),
+    CMD:TRANSPORT=TCP - обратно.
+
+    protocol        - максимальная версия протокола (1 - как старое приложение, без рукопожатия);
+    jitter          - стандартное отклонение случайной задержки кадра (секунды);
+    stall_every     - каждые N кадров передача "замирает" на stall_duration секунд;
+    skip_every      - каждые N кадров пропускать номер кадра (имитация потерь на телефоне, v2;
+                      в H.264 закодированный кадр теряется на самом деле);
+    bandwidth       - ограничение пропускной способности канала, байт/с (None - без ограничения);
+    udp_loss        - доля теряемых датаграмм UDP;
+    udp_reorder     - доля датаграмм UDP, которые уходят после следующей (перестановка соседних,
+                      в том числе последнего фрагмента кадра с первым фрагментом следующего);
+    codec           - кодек кадров в начале каждого подключения (CODEC_JPEG, CODEC_NV21 или CODEC_H264);
+    frames          - сколько кадров отдать клиенту, после чего закрыть соединение (None - без ограничения);
+    sent_times      - необязательный массив длины MARKER_CYCLE, в который записывается
+                      time.perf_counter() отправки кадра с соответствующим номером.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8888, resolution=DEFAULT_RESOLUTION, fps=DEFAULT_FPS,
+                 quality=DEFAULT_QUALITY, corpus=None, jitter=0.0, stall_every=0, stall_duration=0.0,
+                 frames=None, sent_times=None, seed=None, protocol=PROTOCOL_VERSION, skip_every=0,
+                 bandwidth=None, codec=CODEC_JPEG, udp_loss=0.0, udp_reorder=0.0):
+        self.host = host
+        self.port = port
+        self.resolution = tuple(resolution) if resolution else None
+        self.fps = fps
+        self.initial_quality = quality
+        self.quality = quality
+        self.corpus = corpus
+        self.jitter = jitter
+        self.stall_every = stall_every
+        self.stall_duration = stall_duration
+        self.frames = frames
+        self.sent_times = sent_times
+        self.protocol = protocol
+        self.skip_every = skip_every
+        self.bandwidth = bandwidth
+        self.udp_loss = udp_loss
+        self.udp_reorder = udp_reorder
+        self.initial_codec = codec
+        self.codec = codec
+        self.random = random.Random(seed)
+        self.commands = []
+        self.front_camera = False
+        self.running = False
+        self._server = None
+        # Кадры и ответы на команды пишутся в сокет из разных потоков.
+        self._send_lock = threading.Lock()
+        self._encoded = {}
+        self._images = {}
+        self._marked = {}
+        # Кодер H.264 текущего подключения и запрос ключевого кадра (CMD:KEYFRAME).
+        self._h264_encoder = None
+        self._keyframe_requested = False
+        # Транспорт UDP текущего подключения: (сокет, адрес клиента) или None - кадры по TCP.
+        self._client_address = None
+        self._udp = None
+        self._udp_message = 0
+        self._udp_held = None
+        self.udp_sent = 0
+        self.udp_lost = 0
+        self.udp_reordered = 0
+
+    def _images_for(self, resolution):
+        if resolution not in self._images:
+            if self.corpus:
+                self._images[resolution] = load_corpus(self.corpus, resolution)
+            else:
+                width, height = resolution or DEFAULT_RESOLUTION
+                self._images[resolution] = [synthetic_image(width, height, i) for i in range(MARKER_CYCLE)]
+        return self._images[resolution]
+
+    def _marked_images(self, front, resolution):
+        """MARKER_CYCLE кадров одной "камеры" с нарисованными номерами (до кодирования)."""
+        key = (front, resolution)
+        if key not in self._marked:
+            images = self._images_for(resolution)
+            marked = []
+            for index in range(MARKER_CYCLE):
+                image = images[index % len(images)]
+                image = np.ascontiguousarray(image[:, ::-1]) if front else image.copy()
+                marked.append(draw_frame_marker(image, index))
+            self._marked[key] = marked
+        return self._marked[key]
+
+    def _encode_cycle(self, front, codec, quality, resolution):
+        """Кодирует MARKER_CYCLE кадров для одной "камеры", кодека, качества и разрешения."""
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+        encoded = []
+        for image in self._marked_images(front, resolution):
+            if codec == CODEC_NV21:
+                encoded.append((bgr_to_nv21(image), image.shape[1], image.shape[0]))
+                continue
+            ok, jpeg = cv2.imencode('.jpg', image, params)
+            if not ok:
+                raise RuntimeError("Не удалось закодировать кадр")
+            encoded.append((jpeg.tobytes(), image.shape[1], image.shape[0]))
+        return encoded
+
+    def _frames_for(self, front, quality=None, resolution=False, codec=None):
+        """Закодированные кадры для заданных параметров (по умолчанию - текущих)."""
+        codec = self.codec if codec is None else codec
+        quality = self.quality if quality is None else quality
+        resolution = self.resolution if resolution is False else resolution
+        if codec == CODEC_H264:
+            # H.264 кодируется на лету (кадры зависят друг от друга) - заранее готовим только изображения.
+            self._marked_images(front, resolution)
+            return None
+        # Качество JPEG на несжатые кадры не влияет.
+        key = (front, codec, quality if codec == CODEC_JPEG else None, resolution)
+        if key not in self._encoded:
+            self._encoded[key] = self._encode_cycle(front, codec, quality, resolution)
+        return self._encoded[key]
+
+    def prepare(self):
+        """Кодирует кадры заранее и открывает слушающий сокет; возвращает фактический порт."""
+        self._frames_for(False)
+        if self.codec != CODEC_JPEG:
+            # До рукопожатия (и для клиента v1) телефон шлет JPEG.
+            self._frames_for(False, codec=CODEC_JPEG)
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        return self.port
+
+    def serve_forever(self, max_clients=None):
+        """Обслуживает клиентов по одному (как телефон); max_clients - выйти после N клиентов."""
+        if self._server is None:
+            self.prepare()
+        self.running = True
+        served = 0
+        print(f"[*] Симулятор телефона слушает {self.host}:{self.port}")
+        try:
+            while self.running and (max_clients is None or served < max_clients):
+                try:
+                    client, address = self._server.accept()
+                except OSError:
+                    break
+                print(f"[*] Клиент подключен: {address[0]}:{address[1]}")
+                served += 1
+                self._serve_client(client)
+        finally:
+            self.close()
+
+    def close(self):
+        self.running = False
+        if self._server:
+            self._server.close()
+            self._server = None
+
+    def _negotiate(self, client, stream):
+        """Ждет HELLO как приложение на телефоне; возвращает версию протокола для клиента."""
+        if self.protocol < 2:
+            return 1
+        readable, _, _ = select.select([client], [], [], HELLO_TIMEOUT)
+        if not readable:
+            print("[*] Клиент не прислал приветствие - протокол v1")
+            return 1
+        line = stream.readline().decode('utf-8', 'replace').strip()
+        requested = parse_hello(line)
+        if requested is None:
+            print(f"[!] Ожидалось приветствие, получено: {line}")
+            return 1
+        version = min(requested, self.protocol)
+        if version >= 2:
+            client.sendall(HANDSHAKE.pack(HANDSHAKE_MAGIC, version, time.perf_counter_ns() // 1000))
+        print(f"[*] Протокол v{version}")
+        return version
+
+    def _encode_h264(self, index):
+        """Кодирует следующий кадр H.264 (кодер пересоздается при смене разрешения, как на телефоне)."""
+        image = self._marked_images(self.front_camera, self.resolution)[index % MARKER_CYCLE]
+        height, width = image.shape[:2]
+        encoder = self._h264_encoder
+        if encoder is None or (encoder.width, encoder.height) != (width, height):
+            encoder = self._h264_encoder = h264.H264Encoder(width, height, self.fps)
+            self._keyframe_requested = False
+        keyframe, self._keyframe_requested = self._keyframe_requested, False
+        return encoder.encode(image, keyframe), width, height
+
+    def _message(self, version, index, sequence):
+        if version < 2:
+            jpeg, _, _ = self._frames_for(self.front_camera, codec=CODEC_JPEG)[index % MARKER_CYCLE]
+            return FRAME_HEADER_V1.pack(len(jpeg)) + jpeg
+        codec = self.codec
+        if codec == CODEC_H264:
+            data, width, height = self._encode_h264(index)
+        else:
+            data, width, height = self._frames_for(self.front_camera, codec=codec)[index % MARKER_CYCLE]
+        camera_id = CAMERA_FRONT if self.front_camera else CAMERA_BACK
+        header = FRAME_HEADER_V2.pack(FRAME_HEADER_V2.size, len(data), sequence & 0xFFFFFFFF,
+                                      time.perf_counter_ns() // 1000, codec, camera_id, width, height)
+        return header + data
+
+    def _read_commands(self, client, stream, version, stop):
+        try:
+            with stream:
+                for line in stream:
+                    command = line.decode('utf-8', 'replace').strip()
+                    command_id = None
+                    if version >= CONTROL_PROTOCOL_VERSION:
+                        command, command_id = parse_tagged_command(command)
+                    self.commands.append(command)
+                    result = self._handle_command(command)
+                    if command_id is not None:
+                        self._reply(client, command_id, result)
+        except (OSError, ValueError):
+            pass
+        finally:
+            stop.set()
+
+    def _reply(self, client, command_id, result):
+        """Ответ на команду в потоке кадров (протокол v3)."""
+        text = reply_message(command_id, result is not None, result if result is not None else 'UNKNOWN')
+        data = text.encode('utf-8')
+        header = FRAME_HEADER_V2.pack(FRAME_HEADER_V2.size, len(data), 0, time.perf_counter_ns() // 1000,
+                                      CODEC_CONTROL, CAMERA_BACK, 0, 0)
+        self._send(client, header + data)
+
+    def _handle_command(self, command):
+        """Выполняет команду; возвращает результат для подтверждения или None, если команда неизвестна."""
+        name, _, value = command.partition('=')
+        if command == 'CMD:SWITCH_CAM':
+            self.front_camera = not self.front_camera
+            print(f"[*] Камера переключена ({'фронтальная' if self.front_camera else 'основная'})")
+            return 'FRONT' if self.front_camera else 'BACK'
+        if name == QUALITY_COMMAND and value.isdigit():
+            quality = max(1, min(100, int(value)))
+            # Кодируем заранее, чтобы передача не прерывалась, затем переключаемся.
+            self._frames_for(self.front_camera, quality)
+            self.quality = quality
+            print(f"[*] Качество JPEG: {quality}")
+            return str(quality)
+        if name == MAX_RES_COMMAND and parse_resolution(value):
+            resolution = parse_resolution(value)
+            self._frames_for(self.front_camera, self.quality, resolution)
+            self.resolution = resolution
+            print(f"[*] Разрешение: {resolution[0]}x{resolution[1]}")
+            return f"{resolution[0]}x{resolution[1]}"
+        if command == KEYFRAME_COMMAND:
+            self._keyframe_requested = True
+            return 'OK'
+        if name == TRANSPORT_COMMAND and parse_transport(value):
+            return self._switch_transport(*parse_transport(value))
+        if name == CODEC_COMMAND and parse_codec(value):
+            codec = parse_codec(value)
+            if codec == CODEC_H264 and not h264.is_available():
+                print("[!] H.264 недоступен (нет PyAV) - отказ")
+                return None
+            self._frames_for(self.front_camera, codec=codec)
+            self.codec = codec
+            print(f"[*] Кодек кадров: {CODEC_NAMES[codec]}")
+            return CODEC_NAMES[codec]
+        print(f"[!] Неизвестная команда: {command}")
+        return None
+
+    def _switch_transport(self, kind, port):
+        self._close_udp()
+        if kind == TRANSPORT_UDP:
+            host, family = self._client_address
+            self._udp_message = 0
+            self._udp = (socket.socket(family, socket.SOCK_DGRAM), (host, port))
+            print(f"[*] Кадры по UDP на {host}:{port}")
+        else:
+            print("[*] Кадры по TCP")
+        return kind
+
+    def _close_udp(self):
+        udp, self._udp = self._udp, None
+        held, self._udp_held = self._udp_held, None
+        if udp:
+            if held is not None:
+                # Переставленная датаграмма опаздывает, но не теряется.
+                self._sendto(udp[0], held, udp[1])
+            udp[0].close()
+
+    def _send_frame(self, client, message):
+        """Кадр по текущему транспорту: TCP или фрагментами UDP."""
+        udp = self._udp
+        if udp is None:
+            self._send(client, message)
+            return
+        sock, address = udp
+        datagrams = fragment_message(message, self._udp_message)
+        self._udp_message += 1
+        for datagram in datagrams:
+            started = time.perf_counter()
+            held, self._udp_held = self._udp_held, None
+            if self.udp_reorder and held is None and self.random.random() < self.udp_reorder:
+                # Уйдет после следующей датаграммы.
+                self._udp_held = datagram
+                self.udp_reordered += 1
+            elif self.udp_loss and self.random.random() < self.udp_loss:
+                self.udp_lost += 1
+            else:
+                self._sendto(sock, datagram, address)
+            if held is not None:
+                self._sendto(sock, held, address)
+            if self.bandwidth:
+                delay = len(datagram) / self.bandwidth - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _sendto(self, sock, datagram, address):
+        try:
+            sock.sendto(datagram, address)
+            self.udp_sent += 1
+        except OSError:
+            # Как в сети: датаграмма, которую не удалось отправить, просто потеряна.
+            self.udp_lost += 1
+
+    def _send(self, client, message):
+        """
+        Отправляет сообщение целиком (ответ на команду ждет окончания текущего кадра,
+        как в приложении); при ограничении bandwidth - порциями с паузами, как медленный канал.
+        """
+        with self._send_lock:
+            if not self.bandwidth:
+                client.sendall(message)
+                return
+            view = memoryview(message)
+            for offset in range(0, len(view), SEND_CHUNK):
+                chunk = view[offset:offset + SEND_CHUNK]
+                started = time.perf_counter()
+                client.sendall(chunk)
+                delay = len(chunk) / self.bandwidth - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _serve_client(self, client):
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stop = threading.Event()
+        stream = client.makefile('rb')
+        self.quality = self.initial_quality
+        self.codec = self.initial_codec
+        # Телефон запускает кодер заново для каждого клиента.
+        self._h264_encoder = None
+        self._client_address = (client.getpeername()[0], client.family)
+        index = 0
+        sequence = 0
+        reader = None
+        try:
+            version = self._negotiate(client, stream)
+            reader = threading.Thread(target=self._read_commands, args=(client, stream, version, stop),
+                                      name='simulator-commands', daemon=True)
+            reader.start()
+            period = 1.0 / self.fps
+            next_time = time.perf_counter()
+            while self.running and not stop.is_set():
+                if self.frames is not None and index >= self.frames:
+                    break
+                if self.stall_every and index and index % self.stall_every == 0:
+                    next_time += self.stall_duration
+                delay = next_time - time.perf_counter()
+                if self.jitter:
+                    delay += abs(self.random.gauss(0, self.jitter))
+                if delay > 0:
+                    time.sleep(delay)
+                if self.skip_every and index and index % self.skip_every == 0:
+                    if self.codec == CODEC_H264 and version >= 2:
+                        # Кадр закодирован, но потерян: следующие кадры ссылаются на него.
+                        self._message(version, index, sequence)
+                    sequence += 1
+                message = self._message(version, index, sequence)
+                if self.sent_times is not None:
+                    self.sent_times[index % MARKER_CYCLE] = time.perf_counter()
+                self._send_frame(client, message)
+                index += 1
+                sequence += 1
+                next_time += period
+                # Если отстали (медленный клиент или зависание), не пытаемся наверстать очередью кадров.
+                next_time = max(next_time, time.perf_counter() - period)
+        except OSError as e:
+            print(f"[*] Клиент отключился: {e}")
+        finally:
+            print(f"[*] Отправлено кадров: {index}")
+            if self.udp_sent:
+                print(f"[*] UDP: датаграмм {self.udp_sent}, потеряно {self.udp_lost}, переставлено {self.udp_reordered}")
+            self._close_udp()
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+            if reader:
+                reader.join(timeout=1.0)
+            else:
+                stream.close()
+
+
+def resolution_arg(value):
+    """Аргумент командной строки '1280x720' -> (1280, 720)."""
+    resolution = parse_resolution(value)
+    if resolution is None:
+        raise argparse.ArgumentTypeError(f"Ожидается разрешение вида 1280x720, получено '{value}'")
+    return resolution
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='phone_simulator',
+                                     description="Симулятор телефона для проверки клиента без устройства")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес для прослушивания")
+    parser.add_argument('--port', type=int, default=8888, help="порт (как на телефоне)")
+    parser.add_argument('--resolution', type=resolution_arg, default=None,
+                        help="разрешение кадров, например 1920x1080 (по умолчанию 1280x720 "
+                             "или размер изображений корпуса)")
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS, help="частота кадров")
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help="качество JPEG (1-100)")
+    parser.add_argument('--corpus', help="папка с JPEG/PNG (или один файл) для воспроизведения")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная задержка кадров, секунды (σ)")
+    parser.add_argument('--stall-every', type=int, default=0, help="замирание каждые N кадров")
+    parser.add_argument('--stall-duration', type=float, default=0.5, help="длительность замирания, секунды")
+    parser.add_argument('--frames', type=int, default=None, help="отдать N кадров и разорвать соединение")
+    parser.add_argument('--seed', type=int, default=None, help="зерно генератора джиттера")
+    parser.add_argument('--protocol', type=int, default=PROTOCOL_VERSION, choices=(1, 2, 3),
+                        help=f"максимальная версия протокола (по умолчанию {PROTOCOL_VERSION})")
+    parser.add_argument('--skip-every', type=int, default=0,
+                        help="пропускать номер кадра каждые N кадров (имитация потерь, v2)")
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help="ограничение пропускной способности канала, МБ/с")
+    parser.add_argument('--codec', default='jpeg', choices=('jpeg', 'nv21', 'h264'),
+                        help="кодек кадров в начале подключения (клиент может сменить его командой)")
+    parser.add_argument('--udp-loss', type=float, default=0.0,
+                        help="доля теряемых датаграмм, когда клиент включил транспорт UDP (например 0.01)")
+    parser.add_argument('--udp-reorder', type=float, default=0.0,
+                        help="доля датаграмм UDP, переставленных со следующей")
+    args = parser.parse_args(argv)
+
+    simulator = PhoneSimulator(args.host, args.port, args.resolution, args.fps, args.quality,
+                               args.corpus, args.jitter, args.stall_every, args.stall_duration,
+                               args.frames, seed=args.seed, protocol=args.protocol,
+                               skip_every=args.skip_every,
+                               bandwidth=args.bandwidth * 1048576 if args.bandwidth else None,
+                               codec=parse_codec(args.codec), udp_loss=args.udp_loss,
+                               udp_reorder=args.udp_reorder)
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        print("[*] Остановка по Ctrl+C.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import asyncio
+import collections
+import traceback
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DROP_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+class PipelineClosed(Exception):
+    """Очередь закрыта: стадия должна завершить работу."""
+
+
+class StageQueue:
+    """
+    Ограниченная очередь между стадиями конвейера (asyncio).
+    Политика при переполнении:
+      'block'       - производитель ждет, пока освободится место;
+      'drop_oldest' - выбрасывается самый старый элемент очереди;
+      'drop_newest' - выбрасывается новый элемент.
+    Выброшенные элементы передаются в on_drop (например, для отмены задач).
+    """
+
+    def __init__(self, maxsize, policy=DROP_OLDEST, on_drop=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Неизвестная политика очереди: {policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = asyncio.Condition()
+        self._closed = False
+
+    async def put(self, item):
+        """Кладет элемент в очередь с учетом политики переполнения."""
+        dropped = []
+        async with self._cond:
+            if self._closed:
+                raise PipelineClosed()
+            if len(self._items) >= self.maxsize:
+                if self.policy == BLOCK:
+                    await self._cond.wait_for(lambda: len(self._items) < self.maxsize or self._closed)
+                    if self._closed:
+                        raise PipelineClosed()
+                elif self.policy == DROP_OLDEST:
+                    while len(self._items) >= self.maxsize:
+                        dropped.append(self._items.popleft())
+                else:
+                    dropped.append(item)
+                    item = None
+            if item is not None:
+                self._items.append(item)
+                self._cond.notify_all()
+            self.dropped += len(dropped)
+        if self.on_drop:
+            for old in dropped:
+                self.on_drop(old)
+        return len(dropped)
+
+    async def get(self):
+        """Забирает элемент; PipelineClosed - если очередь закрыта и пуста."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._items or self._closed)
+            if self._items:
+                item = self._items.popleft()
+                self._cond.notify_all()
+                return item
+            raise PipelineClosed()
+
+    def qsize(self):
+        return len(self._items)
+
+    async def close(self):
+        """Закрывает очередь и будит все ожидающие стадии."""
+        async with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def drain(self):
+        """Забирает все оставшиеся элементы (для очистки после остановки)."""
+        items = list(self._items)
+        self._items.clear()
+        return items
+
+
+class FramePipeline:
+    """
+    Конвейер обработки видеопотока: прием -> декодирование -> вывод.
+
+    Стадии - задачи asyncio, связанные ограниченными очередями StageQueue,
+    поэтому медленное декодирование или вывод не останавливают чтение сокета
+    (и не создают TCP backpressure на телефоне). Блокирующая работа вынесена
+    в пулы потоков: декодирование - в decode_executor (OpenCV освобождает GIL,
+    так что несколько кадров декодируются параллельно), вывод в камеру
+    с ожиданием темпа - в отдельный поток output_executor. Порядок кадров
+    на выходе сохраняется - в очередь вывода попадают задачи в порядке приема.
+
+    Режим latest_only ("побеждает последний кадр") ставит задержку выше полноты:
+    прием продолжает вычитывать сокет в слот на один кадр, а стадия вывода
+    декодирует только самый свежий полный JPEG. Более старые недекодированные
+    кадры выбрасываются и учитываются в dropped.
+
+    receive_frame() -> payload | None   корутина чтения кадра (None - конец потока: уже
+                                        принятые кадры дообрабатываются до конца)
+    decode_frame(payload) -> frame | None
+    output_frame(frame)                 отправка кадра потребителю (и ожидание темпа)
+    release_payload(payload)            возврат буфера принятого кадра (после декодирования
+                                        или если кадр выброшен из очереди)
+    on_error(stage, exc)                вызывается при ошибке в любой стадии
+    """
+
+    def __init__(self, receive_frame, decode_frame, output_frame,
+                 decode_executor, output_executor,
+                 receive_queue_size=4, output_queue_size=2,
+                 receive_policy=DROP_OLDEST, output_policy=BLOCK, on_error=None,
+                 release_payload=None, latest_only=False):
+        self.receive_frame = receive_frame
+        self.decode_frame = decode_frame
+        self.output_frame = output_frame
+        self.decode_executor = decode_executor
+        self.output_executor = output_executor
+        self.release_payload = release_payload
+        self.on_error = on_error
+        self.latest_only = latest_only
+
+        if latest_only:
+            receive_queue_size, receive_policy = 1, DROP_OLDEST
+        self.receive_queue = StageQueue(receive_queue_size, receive_policy, on_drop=self._release)
+        self.output_queue = StageQueue(output_queue_size, output_policy, on_drop=self._cancel_task)
+
+        self.running = False
+        self.error = None
+        self.stats = {'received': 0, 'decoded': 0, 'decode_failed': 0, 'output': 0}
+
+    def _release(self, payload):
+        if self.release_payload:
+            self.release_payload(payload)
+
+    def _cancel_task(self, item):
+        task, payload = item
+        if task.cancel():
+            # Задача не успела начаться - буфер кадра освобождаем сами.
+            # Уже идущее декодирование освободит буфер само (_decode_task).
+            self._release(payload)
+
+    def _decode_task(self, payload):
+        try:
+            return self.decode_frame(payload)
+        finally:
+            self._release(payload)
+
+    @property
+    def dropped(self):
+        """Общее число кадров, выброшенных из-за переполнения очередей."""
+        return self.receive_queue.dropped + self.output_queue.dropped
+
+    async def run(self):
+        """Выполняет все стадии до конца потока, ошибки или отмены."""
+        self.running = True
+        # Стадия и очередь, которую она закрывает при штатном завершении.
+        if self.latest_only:
+            stages = {'receive': (self._receive_loop(), self.receive_queue),
+                      'output': (self._latest_output_loop(), None)}
+        else:
+            stages = {'receive': (self._receive_loop(), self.receive_queue),
+                      'decode': (self._decode_loop(), self.output_queue),
+                      'output': (self._output_loop(), None)}
+        tasks = {name: asyncio.create_task(self._run_stage(name, stage, downstream), name=f"pipeline-{name}")
+                 for name, (stage, downstream) in stages.items()}
+        output_task = tasks['output']
+        tasks = list(tasks.values())
+        try:
+            # Ошибка любой стадии останавливает весь конвейер. Штатный конец потока
+            # закрывает очереди по цепочке, и конвейер завершается после вывода последнего кадра.
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if self.error or output_task in done:
+                    break
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for item in self.output_queue.drain():
+                self._cancel_task(item)
+            for payload in self.receive_queue.drain():
+                self._release(payload)
+
+    async def _run_stage(self, name, stage, downstream=None):
+        try:
+            await stage
+        except PipelineClosed:
+            pass
+        except Exception as e:
+            if self.running:
+                if self.error is None:
+                    self.error = (name, e)
+                if isinstance(e, (OSError, asyncio.TimeoutError)):
+                    print(f"[!] Стадия '{name}' остановлена: {e}")
+                else:
+                    print(f"[!] Ошибка стадии '{name}': {e}\n{traceback.format_exc()}")
+                if self.on_error:
+                    self.on_error(name, e)
+            return
+        if downstream:
+            await downstream.close()
+
+    def _count(self, key):
+        self.stats[key] += 1
+
+    async def _receive_loop(self):
+        while self.running:
+            payload = await self.receive_frame()
+            if payload is None:
+                break
+            self._count('received')
+            await self.receive_queue.put(payload)
+
+    async def _decode_loop(self):
+        while self.running:
+            payload = await self.receive_queue.get()
+            task = self.decode_executor.submit(self._decode_task, payload)
+            await self.output_queue.put((task, payload))
+
+    async def _emit(self, frame):
+        if frame is None:
+            self._count('decode_failed')
+            return
+        self._count('decoded')
+        if not self.running:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.output_executor, self.output_frame, frame)
+        self._count('output')
+
+    async def _output_loop(self):
+        while self.running:
+            task, _ = await self.output_queue.get()
+            if task.cancelled():
+                continue
+            frame = await asyncio.wrap_future(task)
+            await self._emit(frame)
+
+    async def _latest_output_loop(self):
+        """Вывод в режиме latest_only: декодируется только самый свежий принятый кадр."""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            payload = await self.receive_queue.get()
+            frame = await loop.run_in_executor(self.decode_executor, self._decode_task, payload)
+            await self._emit(frame)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_PREVIEW_FPS = 10
+
+
+class PreviewPublisher:
+    """
+    Общий буфер превью на один кадр.
+
+    Рабочий поток не копирует каждый кадр в GUI: не чаще max_fps раз в секунду
+    он уменьшает кадр до размера окна превью прямо в заранее выделенный буфер.
+    GUI забирает последний опубликованный кадр по таймеру через consume().
+    Если превью скрыто или окно свернуто (enabled = False), работа не выполняется вовсе.
+    """
+
+    def __init__(self, max_fps=DEFAULT_PREVIEW_FPS):
+        self.max_fps = max_fps
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._target_size = None
+        self._buffer = None
+        self._published = 0
+        self._consumed = 0
+        self._last_publish = 0.0
+        self._fit_cache = (None, None, None)
+
+    def set_target_size(self, width, height):
+        """Размер области превью в GUI (кадр вписывается с сохранением пропорций)."""
+        if width > 0 and height > 0:
+            self._target_size = (int(width), int(height))
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def wants_frame(self, now=None):
+        """Нужен ли кадр для превью прямо сейчас (с учетом ограничения FPS)."""
+        if not self.enabled or self._target_size is None:
+            return False
+        now = time.perf_counter() if now is None else now
+        return now - self._last_publish >= 1.0 / self.max_fps
+
+    def _fit(self, frame_shape):
+        source, target, fitted = self._fit_cache
+        if source == frame_shape and target == self._target_size:
+            return fitted
+        frame_height, frame_width = frame_shape[:2]
+        target_width, target_height = self._target_size
+        scale = min(target_width / frame_width, target_height / frame_height, 1.0)
+        fitted = (max(1, int(frame_width * scale)), max(1, int(frame_height * scale)))
+        self._fit_cache = (frame_shape, self._target_size, fitted)
+        return fitted
+
+    def publish(self, frame):
+        """Вызывается из рабочего потока для каждого кадра; лишние кадры пропускаются."""
+        now = time.perf_counter()
+        if not self.wants_frame(now):
+            return False
+        self._last_publish = now
+        width, height = self._fit(frame.shape)
+        shape = (height, width) + frame.shape[2:]
+        with self._lock:
+            if self._buffer is None or self._buffer.shape != shape:
+                self._buffer = np.empty(shape, dtype=frame.dtype)
+            cv2.resize(frame, (width, height), dst=self._buffer, interpolation=cv2.INTER_AREA)
+            self._published += 1
+        return True
+
+    def consume(self, callback):
+        """
+        Передает в callback новый кадр превью, если он появился с прошлого вызова.
+        callback выполняется под блокировкой и должен сам скопировать данные
+        (например, QPixmap.fromImage).
+        """
+        with self._lock:
+            if self._buffer is None or self._consumed == self._published:
+                return False
+            self._consumed = self._published
+            callback(self._buffer)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._buffer = None
+            self._published = self._consumed = 0
+            self._last_publish = 0.0
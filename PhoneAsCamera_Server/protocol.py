@@ -0,0 +1,186 @@
+"""
+Протокол передачи кадров между телефоном и клиентом.
+
+v1: '>I' длина + JPEG. Телефон начинает слать кадры сразу после подключения.
+
+v2 (согласуется при подключении, с откатом на v1):
+    клиент -> телефон   строка "HELLO:<макс. версия клиента>\\n"
+    телефон -> клиент   HANDSHAKE: MAGIC 'PACV', версия ('>H'),
+                        текущее время монотонных часов телефона в мкс ('>q')
+Телефон v1 не знает HELLO (пишет в лог неизвестную команду) и сразу шлет
+кадры v1. Первые 4 байта ответа либо MAGIC, либо длина первого кадра v1;
+'PACV' как длина - больше 1 ГБ, так что спутать их нельзя.
+
+Заголовок кадра v2 (FRAME_HEADER_V2, big-endian):
+    размер заголовка  H   (поля, добавленные в будущем, клиент пропускает)
+    размер данных     I
+    номер кадра       I   (по порядку, с 0 для каждого подключения)
+    время съемки      q   (мкс, монотонные часы телефона)
+    кодек             B   (CODEC_*: JPEG, несжатый NV21 - Y, затем чередующиеся V/U,
+                           или H.264 - один закодированный кадр, NAL-блоки Annex-B)
+    камера            B   (CAMERA_*)
+    ширина, высота    H H
+
+v3 = v2 + подтверждение команд:
+    клиент -> телефон   команда с номером: "<команда>@<номер>\\n" (например "CMD:SWITCH_CAM@7")
+    телефон -> клиент   ответ в общем потоке кадров: заголовок v2 с кодеком CODEC_CONTROL
+                        (номер кадра не расходуется, ширина и высота 0), данные - строка UTF-8
+                        "ACK:<номер>[:<результат>]" или "NAK:<номер>:<причина>"
+Ответ уходит сразу после выполнения команды, поэтому клиент измеряет время отклика
+телефона (RTT) вместе с задержкой за кадром, который передается в этот момент.
+
+Кодек кадров по умолчанию - JPEG; команда CODEC_COMMAND ("CMD:CODEC=NV21") переключает
+телефон на несжатые кадры (для USB, где канал позволяет), "CMD:CODEC=JPEG" - обратно.
+"CMD:CODEC=H264" включает аппаратное кодирование H.264 (для Wi-Fi); телефон без кодера
+отвечает NAK и продолжает слать JPEG. В H.264 каждый ключевой кадр начинается с SPS/PPS,
+а KEYFRAME_COMMAND ("CMD:KEYFRAME") просит кодер сделать следующий кадр ключевым -
+так клиент восстанавливает декодирование после потери кадра.
+
+Транспорт UDP (только Wi-Fi, протокол v3; adb forward пропускает только TCP):
+    клиент открывает UDP-порт и отправляет TRANSPORT_COMMAND "CMD:TRANSPORT=UDP:<порт>";
+    телефон подтверждает команду (ACK) и дальше шлет кадры датаграммами на адрес клиента
+    (адрес TCP-соединения) и этот порт, а команды и ответы на них остаются на TCP.
+    "CMD:TRANSPORT=TCP" возвращает кадры в TCP; телефон без UDP отвечает NAK.
+Каждое сообщение (заголовок v2 + данные - ровно то, что ушло бы по TCP) режется на фрагменты
+не длиннее UDP_FRAGMENT_SIZE байт данных, каждый - отдельная датаграмма с заголовком
+FRAGMENT_HEADER (big-endian):
+    метка             2s  (FRAGMENT_MAGIC)
+    номер сообщения   I   (по порядку, с 0 для каждого подключения)
+    смещение          I   (начало фрагмента в сообщении)
+    размер сообщения  I
+    номер фрагмента   H   и число фрагментов H
+Потерянные фрагменты не пересылаются: клиент выбрасывает недособранный кадр (см. udp_transport.py).
+"""
+import struct
+
+PROTOCOL_VERSION = 3
+# С этой версии телефон подтверждает команды.
+CONTROL_PROTOCOL_VERSION = 3
+
+HELLO_COMMAND = 'HELLO'
+HANDSHAKE_MAGIC = b'PACV'
+HANDSHAKE = struct.Struct('>4sHq')
+
+FRAME_HEADER_V1 = struct.Struct('>I')
+FRAME_HEADER_V2 = struct.Struct('>HIIqBBHH')
+
+# Служебное сообщение телефона (ответ на команду), а не кадр.
+CODEC_CONTROL = 0
+CODEC_JPEG = 1
+CODEC_NV21 = 2
+CODEC_H264 = 3
+CODEC_NAMES = {CODEC_JPEG: 'JPEG', CODEC_NV21: 'NV21', CODEC_H264: 'H264'}
+CODEC_COMMAND = 'CMD:CODEC'
+KEYFRAME_COMMAND = 'CMD:KEYFRAME'
+TRANSPORT_COMMAND = 'CMD:TRANSPORT'
+TRANSPORT_TCP = 'TCP'
+TRANSPORT_UDP = 'UDP'
+
+FRAGMENT_MAGIC = b'PF'
+FRAGMENT_HEADER = struct.Struct('>2sIIIHH')
+# Данных во фрагменте: датаграмма с заголовками IP/UDP помещается в MTU Ethernet/Wi-Fi (1500).
+UDP_FRAGMENT_SIZE = 1400
+
+ACK = 'ACK'
+NAK = 'NAK'
+
+CAMERA_BACK = 0
+CAMERA_FRONT = 1
+CAMERA_NAMES = {CAMERA_BACK: 'основная', CAMERA_FRONT: 'фронтальная'}
+
+
+def hello_command(version=PROTOCOL_VERSION):
+    return f"{HELLO_COMMAND}:{version}"
+
+
+def codec_command(codec):
+    return f"{CODEC_COMMAND}={CODEC_NAMES[codec]}"
+
+
+def parse_codec(name):
+    """Кодек по имени ('NV21', 'h264', без учета регистра) или None."""
+    for codec, codec_name in CODEC_NAMES.items():
+        if codec_name == name.upper():
+            return codec
+    return None
+
+
+def transport_command(port=None):
+    """'CMD:TRANSPORT=UDP:<порт>' - кадры по UDP на этот порт, без порта - 'CMD:TRANSPORT=TCP'."""
+    if port is None:
+        return f"{TRANSPORT_COMMAND}={TRANSPORT_TCP}"
+    return f"{TRANSPORT_COMMAND}={TRANSPORT_UDP}:{port}"
+
+
+def parse_transport(value):
+    """'UDP:5000' -> ('UDP', 5000), 'TCP' -> ('TCP', None); None, если значение некорректно."""
+    kind, _, port = value.upper().partition(':')
+    if kind == TRANSPORT_TCP and not port:
+        return TRANSPORT_TCP, None
+    if kind == TRANSPORT_UDP and port.isdigit() and 0 < int(port) < 65536:
+        return TRANSPORT_UDP, int(port)
+    return None
+
+
+def fragment_message(message, message_id, fragment_size=UDP_FRAGMENT_SIZE):
+    """Режет сообщение на датаграммы транспорта UDP (заголовок FRAGMENT_HEADER + данные)."""
+    view = memoryview(message)
+    size = len(view)
+    count = max(1, -(-size // fragment_size))
+    return [FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, message_id & 0xFFFFFFFF, offset, size, index, count)
+            + view[offset:offset + fragment_size]
+            for index, offset in enumerate(range(0, size, fragment_size))]
+
+
+def tag_command(command, command_id):
+    return f"{command}@{command_id}"
+
+
+def parse_tagged_command(line):
+    """'CMD:SWITCH_CAM@7' -> ('CMD:SWITCH_CAM', 7); команда без номера -> (line, None)."""
+    command, separator, command_id = line.rpartition('@')
+    if not separator or not command_id.isdigit():
+        return line, None
+    return command, int(command_id)
+
+
+def reply_message(command_id, ok, detail=''):
+    text = f"{ACK if ok else NAK}:{command_id}"
+    return f"{text}:{detail}" if detail else text
+
+
+def parse_reply(text):
+    """'ACK:7:FRONT' -> (True, 7, 'FRONT'); None, если это не ответ на команду."""
+    kind, _, rest = text.partition(':')
+    command_id, _, detail = rest.partition(':')
+    if kind not in (ACK, NAK) or not command_id.isdigit():
+        return None
+    return kind == ACK, int(command_id), detail
+
+
+def parse_hello(line):
+    """Версия из строки приветствия или None, если это не приветствие."""
+    prefix = HELLO_COMMAND + ':'
+    if not line.startswith(prefix):
+        return None
+    try:
+        return int(line[len(prefix):])
+    except ValueError:
+        return None
+
+
+class FrameInfo:
+    """Поля заголовка кадра v2."""
+    __slots__ = ('sequence', 'capture_us', 'codec', 'camera_id', 'width', 'height')
+
+    def __init__(self, sequence, capture_us, codec, camera_id, width, height):
+        self.sequence = sequence
+        self.capture_us = capture_us
+        self.codec = codec
+        self.camera_id = camera_id
+        self.width = width
+        self.height = height
+
+    @property
+    def camera_name(self):
+        return CAMERA_NAMES.get(self.camera_id, f"камера {self.camera_id}")
@@ -0,0 +1,168 @@
+"""
+Замкнутый контур адаптации качества JPEG и разрешения камеры телефона.
+
+Раз в интервал статистики контроллер смотрит на загрузку канала и CPU клиента
+и при необходимости отправляет телефону команды:
+    CMD:QUALITY=<1-100>     качество JPEG
+    CMD:MAX_RES=<w>x<h>     максимальное разрешение анализа кадров
+Уменьшение - быстрое (мультипликативное), увеличение - осторожное
+(аддитивное, только после нескольких спокойных интервалов подряд).
+Для несжатых кадров (NV21) качество JPEG не действует - меняется только разрешение.
+"""
+
+QUALITY_COMMAND = 'CMD:QUALITY'
+MAX_RES_COMMAND = 'CMD:MAX_RES'
+
+# Начальное качество - то, с которым телефон начинает каждое подключение.
+INITIAL_QUALITY = 50
+MIN_QUALITY = 25
+MAX_QUALITY = 90
+QUALITY_STEP_UP = 5
+QUALITY_DECREASE = 0.7
+# Ступени разрешения (по возрастанию).
+RESOLUTIONS = ((640, 360), (960, 540), (1280, 720), (1920, 1080))
+
+# Доля времени, которую прием занят чтением данных кадров: выше - канал перегружен,
+# ниже - есть запас для повышения качества.
+LINK_BUSY_HIGH = 0.8
+LINK_BUSY_LOW = 0.5
+# Доля мощности пула декодирования, занятая декодированием.
+DECODE_BUSY_HIGH = 0.85
+DECODE_BUSY_LOW = 0.6
+# Прием медленнее этой доли целевого FPS при занятом канале - признак перегрузки.
+RECEIVE_FPS_LOW = 0.9
+# Рост задержки "съемка -> прием" над минимальной за сессию, при котором канал
+# считается перегруженным (кадры копятся в буферах сети), секунды.
+QUEUE_DELAY_HIGH = 0.15
+# Сколько спокойных интервалов подряд нужно для повышения качества.
+HOLD_INTERVALS = 3
+# Сколько интервалов ждать после изменения, прежде чем оценивать снова.
+COOLDOWN_INTERVALS = 2
+
+
+def quality_command(quality):
+    return f"{QUALITY_COMMAND}={quality}"
+
+
+def max_res_command(width, height):
+    return f"{MAX_RES_COMMAND}={width}x{height}"
+
+
+def parse_resolution(value):
+    """'1280x720' -> (1280, 720) или None."""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        return None
+    return width, height
+
+
+class QualityController:
+    """
+    Контроллер качества одного потока.
+
+    update(signals, frame_size) вызывается раз в интервал и возвращает список
+    команд для телефона (обычно пустой). signals - словарь:
+        receive_fps      принятых кадров в секунду
+        payload_recv     среднее время чтения данных кадра (секунды)
+        decode           среднее время декодирования кадра (секунды)
+        transfer_latency средняя задержка "съемка -> прием" (секунды) или None
+        dropped          общее число выброшенных кадров
+    frame_size - (ширина, высота) последних кадров от телефона.
+    adjust_quality=False - поток без сжатия, управлять можно только разрешением.
+    """
+
+    def __init__(self, target_fps, decode_workers=1, quality=INITIAL_QUALITY, resolutions=RESOLUTIONS,
+                 adjust_quality=True):
+        self.target_fps = target_fps
+        self.decode_workers = max(1, decode_workers)
+        self.quality = quality
+        self.adjust_quality = adjust_quality
+        self.resolutions = resolutions
+        self.max_resolution = None
+        self.reason = None
+        self._dropped = None
+        self._base_latency = None
+        self._calm = 0
+        self._cooldown = 0
+
+    def _resolution_index(self, frame_size):
+        """Ступень, ближайшая к текущему размеру кадра (по высоте, ориентация не важна)."""
+        height = min(frame_size)
+        return min(range(len(self.resolutions)),
+                   key=lambda i: abs(min(self.resolutions[i]) - height))
+
+    def update(self, signals, frame_size):
+        dropped = signals.get('dropped', 0)
+        new_drops = 0 if self._dropped is None else dropped - self._dropped
+        self._dropped = dropped
+        if self._cooldown:
+            self._cooldown -= 1
+            return []
+        receive_fps = signals.get('receive_fps', 0.0)
+        if not receive_fps or not frame_size:
+            return []
+
+        link_busy = signals.get('payload_recv', 0.0) * receive_fps
+        decode_busy = signals.get('decode', 0.0) * self.target_fps / self.decode_workers
+        # Смещение часов телефона известно неточно, поэтому считаем рост задержки
+        # над минимальной, а не ее абсолютное значение.
+        latency = signals.get('transfer_latency')
+        queue_delay = 0.0
+        if latency is not None:
+            if self._base_latency is None or latency < self._base_latency:
+                self._base_latency = latency
+            queue_delay = latency - self._base_latency
+        index = self._resolution_index(frame_size)
+        slow = receive_fps < self.target_fps * RECEIVE_FPS_LOW
+
+        if decode_busy > DECODE_BUSY_HIGH or (new_drops > 0 and decode_busy > DECODE_BUSY_LOW):
+            # Клиент не успевает декодировать: время декодирования зависит от числа пикселей.
+            self.reason = 'cpu'
+            if index > 0:
+                return self._set_resolution(index - 1)
+            if self.adjust_quality:
+                return self._set_quality(int(self.quality * QUALITY_DECREASE))
+            return []
+        congested = link_busy > LINK_BUSY_HIGH or (slow and link_busy > LINK_BUSY_LOW)
+        if congested or queue_delay > QUEUE_DELAY_HIGH:
+            # Канал перегружен: сначала снижаем качество, затем разрешение.
+            self.reason = 'network'
+            if self.adjust_quality and self.quality > MIN_QUALITY:
+                return self._set_quality(int(self.quality * QUALITY_DECREASE))
+            if index > 0:
+                return self._set_resolution(index - 1)
+            return []
+
+        if link_busy < LINK_BUSY_LOW and decode_busy < DECODE_BUSY_LOW:
+            self._calm += 1
+        else:
+            self._calm = 0
+        if self._calm < HOLD_INTERVALS:
+            return []
+        self.reason = 'headroom'
+        if self.adjust_quality and self.quality < MAX_QUALITY:
+            return self._set_quality(self.quality + QUALITY_STEP_UP)
+        # Следующая ступень примерно вдвое увеличит время декодирования.
+        if index + 1 < len(self.resolutions) and decode_busy * 2.25 < DECODE_BUSY_HIGH:
+            return self._set_resolution(index + 1)
+        return []
+
+    def _changed(self, command):
+        self._calm = 0
+        self._cooldown = COOLDOWN_INTERVALS
+        return [command]
+
+    def _set_quality(self, quality):
+        quality = max(MIN_QUALITY, min(MAX_QUALITY, quality))
+        if quality == self.quality:
+            return []
+        self.quality = quality
+        return self._changed(quality_command(quality))
+
+    def _set_resolution(self, index):
+        resolution = self.resolutions[index]
+        if resolution == self.max_resolution:
+            return []
+        self.max_resolution = resolution
+        return self._changed(max_res_command(*resolution))
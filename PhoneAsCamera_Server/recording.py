@@ -0,0 +1,259 @@
+"""
+Запись и воспроизведение потока JPEG без перекодирования.
+
+Формат файла записи (все числа big-endian):
+    заголовок   MAGIC (8 байт) + время начала записи, time.time() ('>d')
+    кадры       '>Id' (размер JPEG, время приема в секундах от начала записи) + JPEG
+    индекс      для каждого кадра '>QId' (смещение JPEG в файле, размер, время приема)
+    окончание   '>QI' (смещение индекса, число кадров) + INDEX_MAGIC (8 байт)
+Индекс дописывается при закрытии записи. Если запись оборвалась (нет окончания),
+при воспроизведении индекс восстанавливается последовательным проходом по кадрам.
+"""
+import asyncio
+import mmap
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from frame_reader import FramePayload
+
+MAGIC = b'PACREC01'
+INDEX_MAGIC = b'PACRIDX1'
+FILE_HEADER = struct.Struct('>8sd')
+RECORD_HEADER = struct.Struct('>Id')
+INDEX_ENTRY = np.dtype([('offset', '>u8'), ('size', '>u4'), ('timestamp', '>f8')])
+FOOTER = struct.Struct('>QI8s')
+
+# Сколько кадров может ждать записи на диск; при переполнении кадры не записываются
+# (прием никогда не ждет диск).
+RECORD_QUEUE_SIZE = 64
+# Буфер файла записи.
+RECORD_FILE_BUFFER = 1024 * 1024
+# Сколько close() ждет, пока поток записи сбросит очередь на диск, секунды.
+RECORD_CLOSE_TIMEOUT = 5.0
+
+
+class FrameRecorder:
+    """
+    Дописывает принятые JPEG как есть в файл записи.
+
+    write() вызывается из стадии приема: кадр копируется (буфер приема
+    возвращается в пул сразу) и ставится в очередь, а запись на диск идет
+    в отдельном потоке. close() дописывает индекс кадров. Подключается
+    к движку как приемник JPEG (см. sinks.py).
+
+    Ошибка записи (например, диск заполнен) останавливает запись, но не прием: error - исключение,
+    следующие кадры считаются невыведенными, а файл остается без индекса (его восстановит Recording).
+    """
+    kind = 'jpeg'
+    name = 'record'
+
+    def __init__(self, path, queue_size=RECORD_QUEUE_SIZE):
+        self.path = path
+        self.frames = 0
+        self.dropped = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._index = []
+        self._file = open(path, 'wb', buffering=RECORD_FILE_BUFFER)
+        self._started = time.perf_counter()
+        self._file.write(FILE_HEADER.pack(MAGIC, time.time()))
+        self._offset = FILE_HEADER.size
+        self._thread = threading.Thread(target=self._write_loop, name='recorder', daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        """Ставит кадр в очередь записи с текущим временем приема."""
+        if self.error is not None:
+            self.dropped += 1
+            return
+        timestamp = time.perf_counter() - self._started
+        try:
+            self._queue.put_nowait((bytes(data), timestamp))
+        except queue.Full:
+            if not self.dropped:
+                print(f"[!] Диск не успевает за потоком, кадры не записываются: {self.path}")
+            self.dropped += 1
+
+    def put(self, item):
+        """Интерфейс приемника: item - (JPEG, FrameInfo или None)."""
+        self.write(item[0])
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'delivered': self.frames, 'dropped': self.dropped}
+
+    def _write_loop(self):
+        file = self._file
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # Запись остановлена: очередь только разбирается, чтобы не ждал close().
+                self.dropped += 1
+                continue
+            data, timestamp = item
+            try:
+                file.write(RECORD_HEADER.pack(len(data), timestamp))
+                file.write(data)
+            except OSError as e:
+                self.error = e
+                self.dropped += 1
+                print(f"[!] Ошибка записи в {self.path}: {e} - запись остановлена")
+                continue
+            self._offset += RECORD_HEADER.size
+            self._index.append((self._offset, len(data), timestamp))
+            self._offset += len(data)
+            self.frames += 1
+
+    def close(self):
+        """Дожидается записи очереди, дописывает индекс и закрывает файл."""
+        file = self._file
+        if file is None:
+            return
+        try:
+            self._queue.put(None, timeout=RECORD_CLOSE_TIMEOUT)
+        except queue.Full:
+            pass
+        self._thread.join(RECORD_CLOSE_TIMEOUT)
+        self._file = None
+        if self._thread.is_alive():
+            # Поток записи завис на диске: файл остается ему, индекс не дописывается.
+            print(f"[!] Запись на диск не завершилась за {RECORD_CLOSE_TIMEOUT:.0f} с, индекс не записан: "
+                  f"{self.path}")
+            return
+        try:
+            if self.error is None:
+                index = np.array(self._index, dtype=INDEX_ENTRY)
+                file.write(index.tobytes())
+                file.write(FOOTER.pack(self._offset, len(self._index), INDEX_MAGIC))
+            file.close()
+        except OSError as e:
+            self.error = self.error or e
+            print(f"[!] Ошибка записи в {self.path}: {e}")
+        print(f"[*] Запись сохранена: {self.path} (кадров: {self.frames}, не записано: {self.dropped})")
+
+
+class Recording:
+    """
+    Файл записи, отображенный в память (mmap). frame(i) возвращает memoryview
+    на JPEG без копирования; index - массив (offset, size, timestamp).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Файл записи пуст: {path}")
+        self._view = memoryview(self._mmap)
+        magic, self.started_at = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Не файл записи потока: {path}")
+        self.index = self._read_index()
+
+    def _read_index(self):
+        size = len(self._mmap)
+        if size >= FILE_HEADER.size + FOOTER.size:
+            index_offset, count, magic = FOOTER.unpack_from(self._mmap, size - FOOTER.size)
+            if magic == INDEX_MAGIC and index_offset + count * INDEX_ENTRY.itemsize == size - FOOTER.size:
+                return np.frombuffer(self._mmap, dtype=INDEX_ENTRY, count=count, offset=index_offset)
+        print(f"[!] Индекс записи не найден (запись оборвалась?), восстановление: {self.path}")
+        return self._scan_index(size)
+
+    def _scan_index(self, size):
+        entries = []
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= size:
+            length, timestamp = RECORD_HEADER.unpack_from(self._mmap, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > size:
+                break
+            entries.append((offset, length, timestamp))
+            offset += length
+        return np.array(entries, dtype=INDEX_ENTRY)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def duration(self):
+        if not len(self.index):
+            return 0.0
+        return float(self.index['timestamp'][-1] - self.index['timestamp'][0])
+
+    def frame(self, number):
+        """JPEG кадра number (memoryview внутри mmap) и время его приема."""
+        offset, size, timestamp = self.index[number]
+        return self._view[int(offset):int(offset) + int(size)], float(timestamp)
+
+    def close(self):
+        self.index = None
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # Кадры еще используются - mmap закроется сборщиком мусора.
+            pass
+        self._file.close()
+
+
+class ReplaySource:
+    """
+    Источник кадров для StreamEngine вместо сокета: отдает кадры записи
+    с исходными интервалами (realtime=True, скорость speed) или так быстро,
+    как их забирает конвейер. loop=True - воспроизводить по кругу.
+    Интерфейс совпадает с FrameReader (read_frame_async/release).
+    """
+
+    def __init__(self, path, realtime=True, speed=1.0, loop=False, metrics=None):
+        self.recording = Recording(path)
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.metrics = metrics
+        self._position = 0
+        self._clock_start = None
+        self._time_offset = 0.0
+
+    def __len__(self):
+        return len(self.recording)
+
+    async def read_frame_async(self):
+        """Следующий кадр записи (FramePayload) или None, если запись закончилась."""
+        recording = self.recording
+        if not len(recording):
+            return None
+        if self._position >= len(recording):
+            if not self.loop:
+                return None
+            # Пауза между кругами - средний интервал кадров записи.
+            self._time_offset += recording.duration * len(recording) / max(1, len(recording) - 1)
+            self._position = 0
+        view, timestamp = recording.frame(self._position)
+        self._position += 1
+        if self.realtime:
+            if self._clock_start is None:
+                self._clock_start = time.perf_counter() - timestamp / self.speed
+            delay = self._clock_start + (timestamp + self._time_offset) / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            # Отдаем управление циклу, чтобы не занимать его целиком.
+            await asyncio.sleep(0)
+        if self.metrics:
+            self.metrics.frame_received(len(view))
+        return FramePayload(view, None)
+
+    def release(self, payload):
+        """Кадры лежат в mmap - освобождать нечего."""
+        pass
+
+    def close(self):
+        self.recording.close()
@@ -0,0 +1,136 @@
+import asyncio
+import copy
+import functools
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_tools import setup_forward, remove_forward
+from stream_engine import StreamEngine, StreamConfig, EngineListener, PORT
+
+# Общий пул декодирования для всех потоков: по одному потоку на ядро (минимум 2).
+SHARED_DECODE_WORKERS = max(2, os.cpu_count() or 2)
+
+
+class StreamSession:
+    """Одна пара "телефон -> виртуальная камера"."""
+
+    def __init__(self, name, host, port, serial=None, camera_device=None, frame_source=None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.serial = serial
+        self.camera_device = camera_device
+        self.frame_source = frame_source
+        self.engine = None
+        self.forwarded = False
+        # Вызывается перед каждым переподключением (для USB - заново настроить adb forward).
+        self.prepare_connection = None
+
+
+def _session_path(path, session):
+    """Файл отдельной сессии: имя.ext -> имя_<сессия>.ext."""
+    root, ext = os.path.splitext(path)
+    suffix = re.sub(r'[^\w.-]', '_', session.name)
+    return f"{root}_{suffix}{ext}"
+
+
+class SessionManager:
+    """
+    Запускает несколько потоков одновременно, каждый в свою виртуальную камеру.
+
+    Для USB-устройств каждому серийному номеру выделяется свой локальный порт
+    (adb -s <serial> forward tcp:base_port+i -> tcp:PORT на телефоне).
+    Все движки работают в одном цикле asyncio, а декодирование идет в общем
+    ограниченном пуле потоков, поэтому пропускная способность масштабируется по ядрам.
+
+    listener_factory(session) -> EngineListener создает получателя событий для сессии.
+    """
+
+    def __init__(self, config=None, decode_workers=SHARED_DECODE_WORKERS,
+                 listener_factory=None, camera_factory=None):
+        self.config = config or StreamConfig()
+        self.decode_workers = decode_workers
+        self.listener_factory = listener_factory or (lambda session: EngineListener())
+        self.camera_factory = camera_factory
+        self.sessions = []
+
+    def add_session(self, name, host, port=PORT, serial=None, camera_device=None, frame_source=None):
+        session = StreamSession(name, host, port, serial, camera_device, frame_source)
+        self.sessions.append(session)
+        return session
+
+    def add_usb_devices(self, serials, base_port=PORT, camera_devices=None, remote_port=PORT):
+        """
+        Настраивает проброс портов для каждого устройства и добавляет сессии.
+        Возвращает список (serial, error) для устройств, которые настроить не удалось.
+        """
+        failures = []
+        camera_devices = list(camera_devices or [])
+        for index, serial in enumerate(serials):
+            local_port = base_port + index
+            forward_ok, forward_err = setup_forward(local_port, remote_port, serial)
+            if not forward_ok:
+                failures.append((serial, forward_err))
+                continue
+            camera_device = camera_devices[index] if index < len(camera_devices) else None
+            session = self.add_session(serial, '127.0.0.1', local_port, serial, camera_device)
+            session.forwarded = True
+            session.prepare_connection = functools.partial(setup_forward, local_port, remote_port, serial)
+        return failures
+
+    def _create_engine(self, session, decode_executor):
+        config = copy.copy(self.config)
+        # Декодирование идет в общем пуле, поэтому и QualityController оценивает загрузку по нему.
+        config.decode_workers = self.decode_workers
+        if session.camera_device is not None:
+            config.camera_device = session.camera_device
+        if len(self.sessions) > 1:
+            # Каждый поток пишется в свой файл: запись.pacr -> запись_<имя>.pacr (и трассировка так же).
+            if config.record_path:
+                config.record_path = _session_path(config.record_path, session)
+            if config.trace_file:
+                config.trace_file = _session_path(config.trace_file, session)
+            # Потоки декодирования и asyncio общие, а cProfile - один на поток: сэмплы снимает
+            # первая сессия, и в них попадают все.
+            if config.profile_dir and self.sessions.index(session) > 0:
+                config.profile_dir = None
+        if config.mjpeg_port and len(self.sessions) > 1:
+            # Каждый поток транслируется на своем порту: MJPEG_PORT, MJPEG_PORT + 1, ...
+            config.mjpeg_port += self.sessions.index(session)
+        kwargs = {'decode_executor': decode_executor, 'frame_source': session.frame_source,
+                  'prepare_connection': session.prepare_connection}
+        if self.camera_factory:
+            kwargs['camera_factory'] = self.camera_factory
+        return StreamEngine(session.host, session.port, config,
+                            listener=self.listener_factory(session), **kwargs)
+
+    async def run(self):
+        """Запускает все сессии и ждет их завершения."""
+        with ThreadPoolExecutor(max_workers=self.decode_workers,
+                                thread_name_prefix='decode') as decode_executor:
+            for session in self.sessions:
+                session.engine = self._create_engine(session, decode_executor)
+            await asyncio.gather(*(session.engine.run() for session in self.sessions),
+                                 return_exceptions=True)
+
+    def stats(self):
+        """Статистика всех запущенных сессий: {имя сессии: StreamEngine.stats()}."""
+        return {session.name: session.engine.stats()
+                for session in self.sessions if session.engine}
+
+    def stop(self):
+        """Останавливает все сессии (потокобезопасно)."""
+        for session in self.sessions:
+            if session.engine:
+                session.engine.stop()
+
+    def cleanup(self):
+        """Удаляет пробросы портов ADB, созданные менеджером, и закрывает источники кадров."""
+        for session in self.sessions:
+            if session.forwarded:
+                remove_forward(session.port, session.serial)
+                session.forwarded = False
+            if session.frame_source:
+                session.frame_source.close()
+                session.frame_source = None
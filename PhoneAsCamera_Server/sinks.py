@@ -0,0 +1,281 @@
+"""
+Раздача принятого потока нескольким получателям (приемникам) помимо вирт. камеры и превью.
+
+Телефон принимает только одного клиента, поэтому все остальные потребители - запись,
+трансляция в локальную сеть, анализ кадров - получают кадры от клиента через SinkFanout:
+  - приемники вида 'jpeg' получают принятые JPEG как есть (без декодирования и перекодирования),
+    приемники вида 'frame' - декодированные кадры в формате и размере вирт. камеры;
+  - каждый кадр копируется один раз на всех приемников своего вида (буфер приема и выходные
+    буферы преобразования переиспользуются), получатели не должны его изменять;
+  - у каждого приемника (а у MJPEG - у каждого HTTP-клиента) своя очередь ограниченной длины:
+    при переполнении выбрасывается самый старый кадр, поэтому медленный получатель теряет
+    кадры сам, но никогда не задерживает прием, вирт. камеру и других получателей.
+"""
+import abc
+import collections
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+JPEG = 'jpeg'
+FRAME = 'frame'
+# Длина очереди приемника по умолчанию, кадров.
+SINK_QUEUE_SIZE = 4
+# Длина очереди каждого клиента MJPEG: небольшая, чтобы задержка трансляции не росла.
+MJPEG_CLIENT_QUEUE_SIZE = 2
+MJPEG_BOUNDARY = 'phoneascamera-frame'
+
+
+class DropOldestQueue:
+    """Очередь ограниченной длины: put() не блокирует, а при переполнении вытесняет самый старый элемент."""
+
+    def __init__(self, maxsize):
+        self._items = collections.deque(maxlen=max(1, maxsize))
+        self._ready = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._ready:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Следующий элемент; None - очередь закрыта (и пуста) или истек таймаут."""
+        with self._ready:
+            if not self._items and not self._closed:
+                self._ready.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FrameSink(abc.ABC):
+    """
+    Базовый класс приемника с собственным потоком: put() ставит (кадр, FrameInfo или None)
+    в очередь, а consume() вызывается в потоке приемника. Наследники реализуют consume()
+    и при необходимости переопределяют close(); готовый приемник с функцией - CallbackSink.
+    """
+    kind = FRAME
+
+    def __init__(self, name, queue_size=SINK_QUEUE_SIZE):
+        self.name = name
+        self.delivered = 0
+        self._queue = DropOldestQueue(queue_size)
+        self._thread = threading.Thread(target=self._consume_loop, name=f'sink-{name}', daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def _consume_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self.consume(*item)
+            except Exception as e:
+                print(f"[!] Ошибка приемника '{self.name}': {e}")
+            self.delivered += 1
+
+    @abc.abstractmethod
+    def consume(self, data, info):
+        """Обрабатывает кадр (в потоке приемника)."""
+
+    def close(self):
+        """Дожидается обработки очереди (не дольше секунды) и останавливает поток приемника."""
+        self._queue.close()
+        self._thread.join(timeout=1.0)
+
+    def stats(self):
+        return {'queued': len(self._queue), 'delivered': self.delivered, 'dropped': self._queue.dropped}
+
+
+class CallbackSink(FrameSink):
+    """Вызывает callback(data, info) в отдельном потоке - например, для анализа кадров."""
+
+    def __init__(self, name, callback, kind=FRAME, queue_size=SINK_QUEUE_SIZE):
+        self.kind = kind
+        self.callback = callback
+        super().__init__(name, queue_size)
+
+    def consume(self, data, info):
+        self.callback(data, info)
+
+
+class MjpegHttpSink:
+    """
+    Трансляция принятых JPEG по HTTP как MJPEG (multipart/x-mixed-replace), без перекодирования:
+        GET /        - поток (открывается браузером, VLC, ffmpeg, OBS);
+        GET /snapshot.jpg - последний кадр.
+    Каждый HTTP-клиент обслуживается своим потоком со своей короткой очередью.
+    """
+    kind = JPEG
+
+    def __init__(self, port, host='0.0.0.0', name='mjpeg', queue_size=MJPEG_CLIENT_QUEUE_SIZE):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.delivered = 0
+        self.dropped = 0
+        self._clients = []
+        self._latest = None
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0].rstrip('/')
+                if path in ('', '/stream', '/stream.mjpg'):
+                    sink._serve_stream(self)
+                elif path == '/snapshot.jpg':
+                    sink._serve_snapshot(self)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mjpeg-http', daemon=True)
+        self._thread.start()
+        print(f"[*] MJPEG-трансляция: http://{self.host}:{self.port}/")
+        return self.port
+
+    def put(self, item):
+        with self._lock:
+            self._latest = item[0]
+            clients = list(self._clients)
+        for client in clients:
+            client.put(item)
+
+    def _serve_snapshot(self, handler):
+        data = self._latest
+        if data is None:
+            # Текст причины в строке статуса - только latin-1, поэтому русский текст - в теле ответа.
+            handler.send_error(503, explain="Кадров пока нет")
+            return
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'image/jpeg')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _serve_stream(self, handler):
+        client = DropOldestQueue(self.queue_size)
+        with self._lock:
+            self._clients.append(client)
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}')
+            handler.send_header('Cache-Control', 'no-cache')
+            handler.send_header('Connection', 'close')
+            handler.end_headers()
+            while True:
+                item = client.get()
+                if item is None:
+                    return
+                data = item[0]
+                handler.wfile.write(f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                    f"Content-Length: {len(data)}\r\n\r\n".encode('ascii'))
+                handler.wfile.write(data)
+                handler.wfile.write(b'\r\n')
+                self.delivered += 1
+        except OSError:
+            # Клиент отключился.
+            pass
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+            self.dropped += client.dropped
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients)
+        return {'clients': len(clients), 'delivered': self.delivered,
+                'dropped': self.dropped + sum(client.dropped for client in clients)}
+
+
+class SinkFanout:
+    """
+    Раздает кадры приемникам: publish_jpeg() - из стадии приема, publish_frame() - из стадии
+    вывода. Если приемников нужного вида нет, кадр даже не копируется.
+    """
+
+    def __init__(self, sinks=()):
+        self._jpeg_sinks = []
+        self._frame_sinks = []
+        for sink in sinks:
+            self.add(sink)
+
+    def add(self, sink):
+        (self._jpeg_sinks if sink.kind == JPEG else self._frame_sinks).append(sink)
+
+    @property
+    def sinks(self):
+        return self._jpeg_sinks + self._frame_sinks
+
+    @property
+    def wants_jpeg(self):
+        return bool(self._jpeg_sinks)
+
+    @property
+    def wants_frames(self):
+        return bool(self._frame_sinks)
+
+    def publish_jpeg(self, data, info=None):
+        if not self._jpeg_sinks:
+            return
+        item = (bytes(data), info)
+        for sink in self._jpeg_sinks:
+            sink.put(item)
+
+    def publish_frame(self, frame, info=None):
+        if not self._frame_sinks:
+            return
+        frame = frame.copy()
+        frame.flags.writeable = False
+        item = (frame, info)
+        for sink in self._frame_sinks:
+            sink.put(item)
+
+    def close(self):
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"[!] Ошибка закрытия приемника '{sink.name}': {e}")
+        self._jpeg_sinks = []
+        self._frame_sinks = []
+
+    def stats(self):
+        return {sink.name: sink.stats() for sink in self.sinks}
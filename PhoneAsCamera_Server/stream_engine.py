@@ -0,0 +1,1147 @@
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import pyvirtualcam
+
+from buffer_pool import FramePool, copy_frame
+from decoders import NV12, Nv21Decoder, create_decoder, frame_size, nv12_to, placeholder_frame, to_nv12
+from frame_reader import FrameReader
+from h264 import H264Decoder, is_available as h264_available
+from jitter_buffer import JitterBuffer
+from metrics import StreamMetrics
+from pipeline import FramePipeline
+from protocol import (PROTOCOL_VERSION, CONTROL_PROTOCOL_VERSION, CODEC_CONTROL, CODEC_JPEG, CODEC_NV21, CODEC_H264,
+                      CODEC_COMMAND, KEYFRAME_COMMAND, TRANSPORT_COMMAND,
+                      CODEC_NAMES, codec_command, hello_command, parse_reply, tag_command, transport_command)
+from quality_controller import QualityController
+from recording import FrameRecorder
+from sinks import JPEG, MjpegHttpSink, SinkFanout
+from tracing import ProfileSampler, Tracer
+from transform import FrameTransform
+from udp_transport import UdpFrameReceiver
+
+TARGET_FPS = 30
+PORT = 8888
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 10
+
+# Настройки конвейера прием -> декодирование -> вывод.
+# Политики очередей: 'block', 'drop_oldest', 'drop_newest' (см. pipeline.StageQueue).
+DECODE_WORKERS = 2
+RECEIVE_QUEUE_SIZE = 4
+RECEIVE_QUEUE_POLICY = 'drop_oldest'
+OUTPUT_QUEUE_SIZE = 2
+OUTPUT_QUEUE_POLICY = 'block'
+# Режим "побеждает последний кадр": выводится только самый свежий кадр,
+# устаревшие выбрасываются (минимальная задержка вместо полноты потока).
+LATEST_FRAME_MODE = False
+# Часы вывода: кадры идут в вирт. камеру из отдельного потока ровно раз в такт target_fps
+# через буфер сглаживания джиттера (см. jitter_buffer.py); нет кадра - повторяется предыдущий.
+# False - каждый кадр отправляется сразу после декодирования, темп - cam.sleep_until_next_frame().
+OUTPUT_CLOCK = True
+# Глубина буфера сглаживания (кадров) и доля интервалов между кадрами, которую он покрывает:
+# больше - ровнее вывод при джиттере Wi-Fi, но больше задержка.
+JITTER_MIN_DEPTH = 1
+JITTER_MAX_DEPTH = 4
+JITTER_PERCENTILE = 0.95
+
+# Декодер JPEG: 'auto' (выбор по стартовому бенчмарку), 'opencv' или 'turbojpeg'.
+DECODER_BACKEND = 'auto'
+# Формат кадров после декодирования и формат вирт. камеры. BGR - родной для OpenCV,
+# поэтому кадр не требует отдельного преобразования цвета.
+PIXEL_FORMAT = 'BGR'
+# Разрешение вирт. камеры (ширина, высота) или None - по первому кадру (после обрезки и поворота).
+# Каждый кадр приводится к нему (см. transform.py), а если кадр заметно больше, декодер
+# уменьшает его в 2/4 раза прямо при декодировании.
+OUTPUT_RESOLUTION = None
+# Поворот по часовой стрелке (0/90/180/270), зеркальное отражение, обрезка (x, y, ширина, высота
+# в долях кадра или None) и приведение к разрешению камеры: 'fit' - с полями, 'fill' - с обрезкой
+# краев, 'stretch' - растягиванием.
+OUTPUT_ROTATION = 0
+OUTPUT_MIRROR = False
+OUTPUT_CROP = None
+OUTPUT_SCALE = 'fit'
+
+# Бэкенд pyvirtualcam и имя устройства вирт. камеры (None - устройство по умолчанию).
+# Для нескольких камер одновременно нужен бэкенд с несколькими устройствами
+# (например, 'unitycapture' в Windows или v4l2loopback в Linux).
+CAMERA_BACKEND = 'obs'
+CAMERA_DEVICE = None
+
+# Максимальная версия протокола, которую клиент предлагает телефону (1 - без согласования).
+# Телефон со старым приложением отвечает кадрами v1.
+MAX_PROTOCOL_VERSION = PROTOCOL_VERSION
+# Адаптация качества JPEG и разрешения камеры телефона под канал и CPU клиента
+# (команды CMD:QUALITY / CMD:MAX_RES, см. quality_controller.py). Работает с телефоном,
+# поддерживающим протокол v2: старое приложение этих команд не знает.
+ADAPTIVE_QUALITY = True
+# Кодек кадров от телефона: 'jpeg', 'nv21' (несжатые кадры - без кодирования на телефоне
+# и декодирования здесь, но в 10-20 раз больше данных), 'h264' (аппаратный кодер телефона:
+# в несколько раз меньше трафика, чем JPEG, для загруженного Wi-Fi; нужен PyAV, см. h264.py)
+# или 'auto' - NV21 по USB (adb forward, подключение к локальному адресу), JPEG по Wi-Fi.
+# Нужен протокол v2; телефон, который не умеет кодек, продолжает слать JPEG.
+TRANSPORT_CODEC = 'auto'
+# Несжатые кадры выводятся в вирт. камеру как YUV (NV12) без преобразования цвета,
+# если бэкенд камеры это поддерживает; иначе - в PIXEL_FORMAT.
+YUV_PASSTHROUGH = True
+# Кадры по UDP (только Wi-Fi, протокол v3): потерянный пакет стоит одного кадра, а не задержки
+# всех следующих, как в TCP (см. udp_transport.py). Команды и ответы на них остаются на TCP;
+# телефон, который не умеет UDP, отвечает отказом, и кадры идут по TCP. UDP_PORT - локальный
+# порт приема (0 - любой свободный; фиксированный удобнее для правила брандмауэра).
+UDP_TRANSPORT = False
+UDP_PORT = 0
+# Сколько ждать подтверждения команды телефоном (протокол v3), секунды.
+COMMAND_ACK_TIMEOUT = 2.0
+# Сколько секунд телефон v3 может слать JPEG после запроса NV21/H.264, прежде чем вирт. камера
+# откроется по кадрам JPEG (не дольше, чем ждем ответа на команду).
+CODEC_SWITCH_TIMEOUT = COMMAND_ACK_TIMEOUT
+# Переподключение после разрыва связи (USB или Wi-Fi) без закрытия вирт. камеры:
+# первая попытка сразу, затем с удвоением паузы от RECONNECT_DELAY до RECONNECT_MAX_DELAY (секунды).
+RECONNECT = True
+RECONNECT_DELAY = 0.25
+RECONNECT_MAX_DELAY = 4.0
+# Сколько секунд пытаться переподключиться (None - пока поток не остановят).
+RECONNECT_TIMEOUT = None
+# Если новых кадров нет дольше HOLD_AFTER секунд (разрыв связи, замирание телефона), вирт. камера
+# получает в темпе target_fps повтор последнего кадра ('last') или серую заглушку ('placeholder'),
+# чтобы приложения видеосвязи не теряли устройство. None - не повторять. С часами вывода
+# последний кадр при любой паузе повторяют сами часы, а HOLD_AFTER - время до перехода на заглушку.
+HOLD_AFTER = 0.25
+HOLD_FRAME = 'last'
+# Порт трансляции принятых JPEG по HTTP (MJPEG, без перекодирования) для других программ
+# и компьютеров в сети или None - без трансляции. 0 - любой свободный порт.
+MJPEG_PORT = None
+MJPEG_HOST = '0.0.0.0'
+# Задержка "съемка -> вывод" больше этой считается ошибкой оценки часов и не учитывается.
+MAX_CAPTURE_LATENCY = 10.0
+
+# Файл для записи принятого потока JPEG (см. recording.py) или None - без записи.
+RECORD_PATH = None
+# Трассировка стадий каждого кадра по потокам в файл Chrome trace (JSON, открывается
+# в ui.perfetto.dev) по окончании сессии или None - выключена (см. tracing.py).
+TRACE_FILE = None
+# Папка для сэмплов cProfile потоков движка (раз в 30 с на 2 с) или None - без профилирования.
+PROFILE_DIR = None
+
+# Как часто движок публикует статистику (секунды).
+STATS_INTERVAL = 1.0
+
+
+class StreamConfig:
+    """Настройки потока. По умолчанию берутся константы модуля, любые можно переопределить."""
+
+    def __init__(self, **overrides):
+        self.target_fps = TARGET_FPS
+        self.connect_timeout = CONNECT_TIMEOUT
+        self.read_timeout = READ_TIMEOUT
+        self.decode_workers = DECODE_WORKERS
+        self.receive_queue_size = RECEIVE_QUEUE_SIZE
+        self.receive_queue_policy = RECEIVE_QUEUE_POLICY
+        self.output_queue_size = OUTPUT_QUEUE_SIZE
+        self.output_queue_policy = OUTPUT_QUEUE_POLICY
+        self.latest_only = LATEST_FRAME_MODE
+        self.output_clock = OUTPUT_CLOCK
+        self.jitter_min_depth = JITTER_MIN_DEPTH
+        self.jitter_max_depth = JITTER_MAX_DEPTH
+        self.jitter_percentile = JITTER_PERCENTILE
+        self.decoder_backend = DECODER_BACKEND
+        self.pixel_format = PIXEL_FORMAT
+        self.output_resolution = OUTPUT_RESOLUTION
+        self.output_rotation = OUTPUT_ROTATION
+        self.output_mirror = OUTPUT_MIRROR
+        self.output_crop = OUTPUT_CROP
+        self.output_scale = OUTPUT_SCALE
+        self.camera_backend = CAMERA_BACKEND
+        self.camera_device = CAMERA_DEVICE
+        self.record_path = RECORD_PATH
+        self.protocol_version = MAX_PROTOCOL_VERSION
+        self.adaptive_quality = ADAPTIVE_QUALITY
+        self.transport_codec = TRANSPORT_CODEC
+        self.yuv_passthrough = YUV_PASSTHROUGH
+        self.udp_transport = UDP_TRANSPORT
+        self.udp_port = UDP_PORT
+        self.reconnect = RECONNECT
+        self.reconnect_timeout = RECONNECT_TIMEOUT
+        self.hold_after = HOLD_AFTER
+        self.hold_frame = HOLD_FRAME
+        self.mjpeg_port = MJPEG_PORT
+        self.mjpeg_host = MJPEG_HOST
+        self.trace_file = TRACE_FILE
+        self.profile_dir = PROFILE_DIR
+        for key, value in overrides.items():
+            if not hasattr(self, key):
+                raise TypeError(f"Неизвестный параметр потока: {key}")
+            setattr(self, key, value)
+
+
+class EngineListener:
+    """
+    Получатель событий движка. GUI и консольный клиент переопределяют нужные методы.
+    Методы вызываются из потоков движка, а не из потока, создавшего движок.
+    """
+
+    def on_status(self, message):
+        pass
+
+    def on_connected(self, device_info):
+        pass
+
+    def on_failed(self, message):
+        pass
+
+    def on_disconnected(self):
+        pass
+
+    def on_stats(self, stats):
+        """Периодическая статистика потока (словарь из StreamEngine.stats())."""
+        pass
+
+    def on_command_result(self, command, ok, detail, rtt):
+        """
+        Ответ телефона на команду (протокол v3): ok - выполнена ли, detail - результат
+        или причина отказа, rtt - время от отправки до ответа в секундах
+        (None - ответа нет за COMMAND_ACK_TIMEOUT).
+        """
+        pass
+
+
+def open_virtual_camera(width, height, fps, pixel_format, backend=CAMERA_BACKEND, device=CAMERA_DEVICE):
+    """Открывает виртуальную камеру в формате pixel_format ('BGR'/'RGB')."""
+    return pyvirtualcam.Camera(width=width, height=height, fps=fps, backend=backend, device=device,
+                               fmt=pyvirtualcam.PixelFormat[pixel_format])
+
+
+def frame_buffers(config):
+    """
+    Размеры колец буферов кадров (buffer_pool.FramePool): (преобразование и формат камеры, декодер).
+    Выходной буфер не должен переиспользоваться, пока кадр ждет в буфере сглаживания или повторяется
+    в камере. Кадр, которому преобразование не нужно, идет в камеру прямо из буфера декодера - его
+    кольцо покрывает еще и очередь вывода (с кадром, который ждет места в ней, и кадром в стадии вывода).
+    """
+    buffers = (config.jitter_max_depth if config.output_clock else 0) + 3
+    return buffers, buffers + config.output_queue_size + 1
+
+
+def is_usb_host(host):
+    """Подключение через adb forward идет на локальный адрес компьютера."""
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+class StreamEngine:
+    """
+    Асинхронный движок потока с телефона в виртуальную камеру, без зависимости от Qt.
+
+    Соединение и чтение кадров идут в цикле asyncio (неблокирующий сокет,
+    loop.sock_recv_into в переиспользуемые буферы FrameReader), декодирование -
+    в пуле потоков, вывод в камеру - в отдельном потоке (см. pipeline.FramePipeline),
+    а с часами вывода (OUTPUT_CLOCK) - через буфер сглаживания в потоке со своим темпом.
+    Команды для телефона отправляются из того же цикла сразу, не дожидаясь кадров;
+    с телефоном v3 ответы на них приходят в потоке кадров и учитываются в метриках (RTT).
+
+    run() - корутина сессии; stop() и send_command() можно вызывать из любого потока.
+    camera_factory(width, height, fps, pixel_format, backend, device) позволяет подменить
+    вывод (например, при встраивании движка в другой сервис).
+    decode_executor - общий пул декодирования (если потоков несколько, см. session_manager);
+    по умолчанию движок создает собственный.
+    frame_source - готовый источник кадров вместо подключения к телефону
+    (например, recording.ReplaySource); команды телефону в этом случае не отправляются.
+    Кадры NV21 (см. TRANSPORT_CODEC) декодирует raw_decoder, H.264 - h264_decoder
+    (в отдельном потоке строго по порядку кадров), JPEG - decoder.
+    С транспортом UDP (UDP_TRANSPORT) кадры принимает udp_receiver, а TCP-соединение читает
+    _control_loop: ответы на команды и кадры, отправленные телефоном до переключения.
+
+    После разрыва связи с уже работающей вирт. камерой движок переподключается сам
+    (RECONNECT): камера остается открытой и получает повтор последнего кадра (HOLD_AFTER),
+    а состояние соединения (протокол, кодек, часы телефона, контроллер качества)
+    согласуется заново. prepare_connection() -> (ok, error) вызывается в пуле потоков
+    перед каждой попыткой - например, чтобы заново настроить adb forward для USB.
+
+    sinks - дополнительные приемники кадров (см. sinks.py): принятые JPEG и декодированные
+    кадры раздаются им вместе с записью (RECORD_PATH) и MJPEG-трансляцией (MJPEG_PORT),
+    каждому через свою очередь. Движок закрывает их при завершении.
+    """
+
+    def __init__(self, host, port=PORT, config=None, listener=None, preview=None,
+                 camera_factory=open_virtual_camera, decode_executor=None, frame_source=None,
+                 prepare_connection=None, sinks=None):
+        self.host = host
+        self.port = port
+        self.config = config or StreamConfig()
+        self.listener = listener or EngineListener()
+        self.preview = preview
+        self.camera_factory = camera_factory
+        self.decode_executor = decode_executor
+        self.frame_source = frame_source
+        self.prepare_connection = prepare_connection
+        self.extra_sinks = list(sinks or ())
+
+        self.running = False
+        self.sock = None
+        self.cam = None
+        self.decoder = None
+        self.raw_decoder = None
+        self.h264_decoder = None
+        self.transform = None
+        # Пулы буферов кадров (buffer_pool.py): результат декодирования, преобразования формата
+        # для камеры и кадр NV12 -> BGR/RGB для превью.
+        self.frame_pools = {}
+        self.frame_reader = None
+        self.udp_receiver = None
+        self.sinks = SinkFanout()
+        self.pipeline = None
+        self.jitter_buffer = None
+        self._clock_thread = None
+        self._clock_stop = threading.Event()
+        self.metrics = StreamMetrics()
+        # Трассировщик и сэмплер профиля, если включены (trace_file, profile_dir).
+        self.tracer = None
+        self.profiler = None
+        self.protocol = 1
+        self.codec = CODEC_JPEG
+        # Смещение часов телефона относительно time.perf_counter() (секунды), из рукопожатия v2.
+        self.clock_offset = None
+        self.camera_id = None
+        self.frame_size = None
+        self.quality_controller = None
+        self._camera_format = None
+        # Когда пришел первый JPEG после запроса другого кодека (камера еще не открыта).
+        self._codec_wait_started = None
+        # Последний отправленный в камеру кадр и время отправки - для повтора при разрыве связи.
+        self._last_frame = None
+        self._last_output_time = None
+        self._placeholder = None
+        # Время от запуска сессии до первого кадра в вирт. камере (мс) или None, пока кадра не было.
+        self._run_started = None
+        self.first_frame_ms = None
+        # Начало текущего разрыва связи (time.perf_counter()) или None; число попыток в нем.
+        self._outage_started = None
+        self._reconnect_attempts = 0
+        # Счетчики конвейеров прошлых соединений (для статистики за всю сессию).
+        self._totals = {}
+        self._last_sequence = None
+        # Отправленные и еще не подтвержденные команды: номер -> (команда, время отправки).
+        self._pending_commands = {}
+        self._next_command_id = 1
+        self._loop = None
+        self._stop_event = None
+        self._commands = None
+        self._stop_requested = False
+
+    def stop(self):
+        """Запрашивает остановку сессии (потокобезопасно)."""
+        self._stop_requested = True
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._request_stop)
+
+    def _request_stop(self):
+        if self.running:
+            self.listener.on_status("Запрос на остановку...")
+        self._stop_event.set()
+
+    def send_command(self, command):
+        """Ставит команду для телефона в очередь отправки (потокобезопасно)."""
+        if not self._loop or self._loop.is_closed():
+            self.listener.on_status("Ошибка: Нет соединения для отправки команды")
+            return
+        self._loop.call_soon_threadsafe(self._commands.put_nowait, command)
+
+    async def run(self):
+        """Сессия: подключение, прием кадров (с переподключениями) до конца или stop(), освобождение ресурсов."""
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._stop_event = asyncio.Event()
+        self._commands = asyncio.Queue()
+        self.running = True
+        self._run_started = time.perf_counter()
+        self.first_frame_ms = None
+        self.tracer = Tracer() if self.config.trace_file else None
+        self.metrics.tracer = self.tracer
+        self.profiler = ProfileSampler(self.config.profile_dir) if self.config.profile_dir else None
+        own_decode_executor = self.decode_executor is None
+        decode_executor = self.decode_executor or ThreadPoolExecutor(
+            max_workers=self.config.decode_workers, thread_name_prefix='decode')
+        output_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='output')
+        # Декодер H.264 хранит состояние между кадрами: один поток сохраняет порядок кадров.
+        self._h264_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='decode-h264')
+        tasks = []
+
+        try:
+            config = self.config
+            buffers, decode_buffers = frame_buffers(config)
+            self.transform = FrameTransform(config.output_rotation, config.output_mirror, config.output_crop,
+                                            config.output_scale, buffers)
+            self.frame_pools = {'decode': FramePool(decode_buffers),
+                                'convert': FramePool(buffers),
+                                # Превью получает кадр из своего кольца, а не выходной буфер: кольца выходных
+                                # кадров рассчитаны на очереди и камеру (frame_buffers) и превью не учитывают.
+                                # Превью сразу уменьшается в свой буфер: кадр нужен на время вызова.
+                                'preview': FramePool(1)}
+            decode_size = self.transform.source_size(config.output_resolution) if config.output_resolution else None
+            # Выбор декодера - до подключения: пока идет стартовый бенчмарк, телефон еще не шлет кадры,
+            # и пачка накопившихся кадров не раздувает буфер сглаживания. GUI прогревает бенчмарк
+            # (он кешируется) в фоне при запуске.
+            self.decoder = await loop.run_in_executor(
+                None, create_decoder, config.decoder_backend, config.pixel_format, decode_size,
+                self.frame_pools['decode'])
+            raw_format = NV12 if config.yuv_passthrough else config.pixel_format
+            self.raw_decoder = Nv21Decoder(raw_format, decode_size, self.frame_pools['decode'])
+            if config.output_clock:
+                self.jitter_buffer = JitterBuffer(config.target_fps, config.jitter_min_depth,
+                                                  config.jitter_max_depth, config.jitter_percentile)
+            if self._stop_requested:
+                return
+            if self.frame_source is None:
+                self.listener.on_status(f"Подключение к {self.host}:{self.port}...")
+                await self._open_connection()
+                self.listener.on_status("Подключено!")
+            else:
+                self.listener.on_status(f"Воспроизведение: {self.host}")
+                self.frame_reader = self.frame_source
+                self.frame_reader.metrics = self.metrics
+            self._start_sinks()
+            tasks.append(asyncio.create_task(self._report_loop()))
+            if config.hold_after is not None and not config.output_clock:
+                tasks.append(asyncio.create_task(self._hold_loop(output_executor)))
+            while await self._stream(decode_executor, output_executor):
+                if not await self._reconnect():
+                    break
+
+        except (asyncio.TimeoutError, socket.timeout):
+            if self.running:
+                self.listener.on_failed("Не удалось подключиться (таймаут).")
+        except ConnectionRefusedError:
+             if self.running:
+                 self.listener.on_failed("Connection refused. Проверьте сервер/adb forward.")
+        except OSError as e:
+             if self.running:
+                  self.listener.on_failed(f"Ошибка сокета: {e}")
+        except Exception as e:
+            if self.running:
+                err_msg = f"Непредвиденная ошибка в потоке: {e}\n{traceback.format_exc()}"
+                print(f"[!] {err_msg}")
+                self.listener.on_failed(f"Ошибка в потоке: {e}")
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Поток вывода должен закончить текущий кадр до закрытия камеры.
+            output_executor.shutdown(wait=True)
+            if own_decode_executor:
+                decode_executor.shutdown(wait=False, cancel_futures=True)
+            self._h264_executor.shutdown(wait=False, cancel_futures=True)
+            self.cleanup()
+            self._save_diagnostics()
+
+    async def _stream(self, decode_executor, output_executor):
+        """
+        Конвейер по текущему соединению (или источнику кадров) до конца потока, ошибки или stop().
+        Возвращает True, если связь с телефоном потеряна и можно переподключиться.
+        """
+        config = self.config
+        h264 = self.codec == CODEC_H264
+        if h264 and config.latest_only:
+            self.listener.on_status("H.264 декодирует все кадры по порядку - режим минимальной задержки не используется.")
+        pipeline = self.pipeline = FramePipeline(
+            self._read_frame, self._decode_frame, self._output_frame,
+            self._h264_executor if h264 else decode_executor, output_executor,
+            receive_queue_size=config.receive_queue_size,
+            output_queue_size=config.output_queue_size,
+            receive_policy=config.receive_queue_policy,
+            output_policy=config.output_queue_policy,
+            on_error=self._on_pipeline_error,
+            release_payload=(self.udp_receiver or self.frame_reader).release,
+            latest_only=config.latest_only and not h264,
+        )
+        pipeline_task = asyncio.create_task(pipeline.run())
+        stop_task = asyncio.create_task(self._stop_event.wait())
+        tasks = [pipeline_task, stop_task]
+        if self.sock:
+            # Ошибка отправки команды - тоже разрыв связи.
+            tasks.append(asyncio.create_task(self._command_loop()))
+        if self.udp_receiver is not None:
+            # Конец TCP-соединения - разрыв связи, даже если датаграммы еще идут.
+            tasks.append(asyncio.create_task(self._control_loop()))
+        try:
+            if self._stop_requested:
+                self._stop_event.set()
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._add_totals(pipeline)
+        error = pipeline.error
+        if self.frame_source is not None:
+            if pipeline_task.done() and not error and not self._stop_event.is_set():
+                self.listener.on_status("Воспроизведение завершено.")
+            return False
+        if self._stop_event.is_set() or (error and error[0] != 'receive'):
+            return False
+        return self.config.reconnect and self.cam is not None
+
+    def _add_totals(self, pipeline):
+        """Переносит счетчики завершенного конвейера в итоги сессии."""
+        totals = self._totals
+        for key, value in pipeline.stats.items():
+            totals[key] = totals.get(key, 0) + value
+        totals['dropped'] = totals.get('dropped', 0) + pipeline.dropped
+        self.pipeline = None
+
+    async def _reconnect(self):
+        """
+        Переподключение с экспоненциальной паузой между попытками. Вирт. камера остается
+        открытой (ее кормит _hold_loop). Возвращает True, если соединение установлено;
+        разрыв считается законченным с приходом первого кадра (см. _link_restored).
+        """
+        self._close_connection()
+        self._reset_connection()
+        if self._outage_started is None:
+            self._outage_started = time.perf_counter()
+            self._reconnect_attempts = 0
+            self.metrics.outage()
+            self.listener.on_status("Связь с телефоном потеряна, переподключение...")
+        loop = asyncio.get_running_loop()
+        timeout = self.config.reconnect_timeout
+        while not self._stop_event.is_set():
+            if self._reconnect_attempts:
+                delay = min(RECONNECT_MAX_DELAY, RECONNECT_DELAY * 2 ** (self._reconnect_attempts - 1))
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+            if timeout is not None and time.perf_counter() - self._outage_started > timeout:
+                self.listener.on_failed(f"Не удалось восстановить связь с телефоном за {timeout:.0f} с.")
+                return False
+            self._reconnect_attempts += 1
+            try:
+                if self.prepare_connection:
+                    ok, error = await loop.run_in_executor(None, self.prepare_connection)
+                    if not ok:
+                        raise ConnectionError(error)
+                await self._open_connection()
+                self.listener.on_status(f"Переподключено (попытка {self._reconnect_attempts}), ожидание кадров...")
+                return True
+            except (OSError, asyncio.TimeoutError) as e:
+                self._close_connection()
+                self.listener.on_status(f"Попытка переподключения {self._reconnect_attempts} не удалась: "
+                                        f"{str(e) or 'таймаут'}")
+        return False
+
+    def _link_restored(self):
+        """Первый кадр после переподключения: разрыв закончен."""
+        elapsed = time.perf_counter() - self._outage_started
+        self.metrics.record_reconnect(elapsed)
+        self.listener.on_status(f"Связь восстановлена за {elapsed * 1000:.0f} мс "
+                                f"(попыток: {self._reconnect_attempts}).")
+        self._outage_started = None
+        self._reconnect_attempts = 0
+
+    async def _open_connection(self):
+        """Подключение к телефону и согласование протокола (для первого подключения и переподключений)."""
+        self.sock = await self._connect()
+        self.frame_reader = FrameReader(self.sock, metrics=self.metrics)
+        if self.config.protocol_version >= 2:
+            await self._negotiate()
+
+    def _reset_connection(self):
+        """Сбрасывает состояние, согласованное с телефоном по прошлому соединению."""
+        self.frame_reader = None
+        self.udp_receiver = None
+        self.protocol = 1
+        self.codec = CODEC_JPEG
+        self.h264_decoder = None
+        self.clock_offset = None
+        self._last_sequence = None
+        self.quality_controller = None
+        # Ответы на команды прошлого соединения уже не придут.
+        for command, _ in self._pending_commands.values():
+            self._notify('on_command_result', command, False, 'disconnected', None)
+        self._pending_commands.clear()
+
+    async def _connect(self):
+        """Неблокирующее подключение к телефону с таймаутом."""
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(self.host, self.port, type=socket.SOCK_STREAM)
+        family, sock_type, proto, _, address = infos[0]
+        sock = socket.socket(family, sock_type, proto)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, address), self.config.connect_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def _negotiate(self):
+        """Рукопожатие протокола v2 (телефон v1 отвечает сразу кадрами - остаемся на v1)."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        hello = hello_command(self.config.protocol_version) + '\n'
+        await loop.sock_sendall(self.sock, hello.encode('utf-8'))
+        handshake = await asyncio.wait_for(self.frame_reader.read_handshake_async(), self.config.read_timeout)
+        if handshake is None:
+            self.listener.on_status("Телефон использует протокол v1.")
+            return
+        self.protocol, phone_time_us = handshake
+        # Время телефона соответствует середине интервала запрос-ответ.
+        self.clock_offset = phone_time_us / 1e6 - (started + time.perf_counter()) / 2
+        self.listener.on_status(f"Протокол v{self.protocol}.")
+        self.codec = self._choose_codec()
+        if self.codec == CODEC_H264:
+            raw_format = NV12 if self.config.yuv_passthrough and self._camera_format in (None, NV12) \
+                else self.config.pixel_format
+            # Новое соединение - новый поток H.264 (телефон заново запускает кодер).
+            self.h264_decoder = H264Decoder(raw_format, request_keyframe=self._request_keyframe,
+                                            pool=self.frame_pools['decode'])
+            self._commands.put_nowait(codec_command(self.codec))
+            self.listener.on_status("Кадры H.264.")
+        elif self.codec != CODEC_JPEG:
+            self._commands.put_nowait(codec_command(self.codec))
+            self.listener.on_status(f"Кадры без сжатия ({CODEC_NAMES[self.codec]}).")
+        if self.config.udp_transport:
+            self._start_udp()
+        if self.config.adaptive_quality:
+            self.quality_controller = QualityController(self.config.target_fps, self.config.decode_workers,
+                                                        adjust_quality=self.codec == CODEC_JPEG)
+
+    def _start_udp(self):
+        """Открывает порт приема кадров по UDP и просит телефон переключиться на него (протокол v3)."""
+        if self.protocol < CONTROL_PROTOCOL_VERSION:
+            self.listener.on_status("Для кадров по UDP нужен протокол v3 - кадры по TCP.")
+            return
+        peer = self.sock.getpeername()[0]
+        receiver = UdpFrameReceiver(self.frame_reader.pool, port=self.config.udp_port, peer=peer,
+                                    metrics=self.metrics)
+        try:
+            port = receiver.start(asyncio.get_running_loop(), self.sock.family)
+        except OSError as e:
+            self.listener.on_status(f"Не удалось открыть UDP-порт {self.config.udp_port}: {e} - кадры по TCP.")
+            return
+        self.udp_receiver = receiver
+        self._commands.put_nowait(transport_command(port))
+        self.listener.on_status(f"Кадры по UDP, порт {port}.")
+
+    def _wants_jpeg(self):
+        """Нужны ли принятые JPEG как есть (запись, MJPEG-трансляция, свои приемники JPEG)."""
+        return bool(self.config.record_path) or self.config.mjpeg_port is not None or \
+            any(sink.kind == JPEG for sink in self.extra_sinks)
+
+    def _start_sinks(self):
+        """Создает приемники кадров на время работы движка (они не зависят от переподключений)."""
+        config = self.config
+        self.sinks = SinkFanout(self.extra_sinks)
+        if config.record_path:
+            self.sinks.add(FrameRecorder(config.record_path))
+            self.listener.on_status(f"Запись потока в {config.record_path}")
+        if config.mjpeg_port is not None:
+            mjpeg = MjpegHttpSink(config.mjpeg_port, config.mjpeg_host)
+            try:
+                mjpeg.start()
+                self.sinks.add(mjpeg)
+                self.listener.on_status(f"MJPEG-трансляция на порту {mjpeg.port}")
+            except OSError as e:
+                self.listener.on_status(f"Не удалось запустить MJPEG-трансляцию на порту {config.mjpeg_port}: {e}")
+        if self.sinks.wants_jpeg and self.codec != CODEC_JPEG:
+            self.listener.on_status("Запись и MJPEG-трансляция получают только JPEG - "
+                                    "несжатые кадры им не передаются.")
+
+    def _choose_codec(self):
+        """Кодек кадров по настройке transport_codec: при 'auto' несжатые кадры - только по USB."""
+        setting = self.config.transport_codec
+        if setting == 'nv21':
+            return CODEC_NV21
+        if setting == 'h264':
+            if h264_available():
+                return CODEC_H264
+            self.listener.on_status("Для H.264 нужен пакет PyAV (pip install av) - кадры JPEG.")
+        if setting == 'auto' and is_usb_host(self.host) and not self._wants_jpeg():
+            return CODEC_NV21
+        return CODEC_JPEG
+
+    def _request_keyframe(self):
+        """Декодер H.264 потерял кадр: просим телефон сделать следующий кадр ключевым (из потока декодирования)."""
+        if self.tracer is not None:
+            self.tracer.instant('keyframe_request')
+        self.send_command(KEYFRAME_COMMAND)
+
+    def _track_frame(self, info):
+        """Учет потерь по номерам кадров и смены камеры телефона (протокол v2)."""
+        if self._last_sequence is not None:
+            gap = (info.sequence - self._last_sequence - 1) & 0xFFFFFFFF
+            if gap:
+                self.metrics.frames_lost(gap)
+        self._last_sequence = info.sequence
+        self.frame_size = (info.width, info.height)
+        if info.camera_id != self.camera_id:
+            if self.camera_id is not None:
+                self.listener.on_status(f"Камера телефона: {info.camera_name}")
+            self.camera_id = info.camera_id
+
+    async def _read_frame(self):
+        """
+        Стадия приема: один кадр с таймаутом ожидания (и запись JPEG как есть, если включена).
+        Ответы телефона на команды, пришедшие между кадрами, обрабатываются здесь же.
+        """
+        if self.profiler is not None:
+            self.profiler.tick()
+        reader = self.udp_receiver or self.frame_reader
+        while True:
+            if self.frame_source is not None:
+                # В записи могут быть долгие паузы - таймаут нужен только для сети.
+                payload = await reader.read_frame_async()
+            else:
+                payload = await asyncio.wait_for(reader.read_frame_async(), self.config.read_timeout)
+            if payload is None:
+                return None
+            if payload.info is None or payload.info.codec != CODEC_CONTROL:
+                break
+            self._handle_reply(payload)
+        if self._outage_started is not None:
+            self._link_restored()
+        if payload.info is not None:
+            self._track_frame(payload.info)
+            if self.clock_offset is not None:
+                latency = time.perf_counter() - (payload.info.capture_us / 1e6 - self.clock_offset)
+                if 0 <= latency < MAX_CAPTURE_LATENCY:
+                    self.metrics.record_transfer_latency(latency)
+        if self.sinks.wants_jpeg and (payload.info is None or payload.info.codec == CODEC_JPEG):
+            self.sinks.publish_jpeg(payload.view, payload.info)
+        return payload
+
+    async def _command_loop(self):
+        """Отправляет команды телефону сразу по мере поступления (с номером для подтверждения в v3)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            command = (await self._commands.get()).strip()
+            line = command
+            if self.protocol >= CONTROL_PROTOCOL_VERSION:
+                command_id = self._next_command_id
+                self._next_command_id += 1
+                line = tag_command(command, command_id)
+                self._pending_commands[command_id] = (command, time.perf_counter())
+            try:
+                await loop.sock_sendall(self.sock, (line + '\n').encode('utf-8'))
+                self.listener.on_status(f"Команда отправлена: {command}")
+            except OSError as e:
+                self.listener.on_status(f"Ошибка отправки команды: {e}")
+                return
+
+    async def _control_loop(self):
+        """
+        Транспорт UDP: читает TCP-соединение - ответы на команды и кадры, которые телефон отправил
+        по TCP (до переключения или после отказа от UDP; они идут в очередь приемника UDP).
+        """
+        try:
+            while True:
+                payload = await self.frame_reader.read_frame_async()
+                receiver = self.udp_receiver
+                if payload.info is not None and payload.info.codec == CODEC_CONTROL:
+                    self._handle_reply(payload)
+                elif receiver.active and receiver.assembler.frames:
+                    # Кадр TCP, отставший от уже принятых по UDP: номера кадров пошли бы назад.
+                    self.frame_reader.release(payload)
+                else:
+                    receiver.put(payload)
+        except OSError as e:
+            if self.running and not self._stop_event.is_set():
+                self.listener.on_status(f"Соединение разорвано: {e}")
+
+    def _notify(self, event, *args):
+        """
+        Вызывает метод получателя событий, добавленный в EngineListener позже остальных (on_stats,
+        on_command_result): получатель, написанный без наследования от EngineListener, может его не иметь.
+        """
+        handler = getattr(self.listener, event, None)
+        if handler is not None:
+            handler(*args)
+
+    def _handle_reply(self, payload):
+        """Ответ телефона на команду: RTT в метрики, результат - получателю событий."""
+        text = bytes(payload.view).decode('utf-8', 'replace')
+        self.frame_reader.release(payload)
+        reply = parse_reply(text)
+        if reply is None:
+            self.listener.on_status(f"Неизвестное сообщение телефона: {text}")
+            return
+        ok, command_id, detail = reply
+        pending = self._pending_commands.pop(command_id, None)
+        if pending is None:
+            # Ответ пришел после таймаута - о команде уже сообщено.
+            return
+        command, sent = pending
+        rtt = time.perf_counter() - sent
+        self.metrics.record_command_rtt(rtt)
+        if ok:
+            self.listener.on_status(f"Телефон выполнил {command} за {rtt * 1000:.0f} мс")
+        else:
+            self.listener.on_status(f"Телефон отклонил {command}: {detail}")
+            if command.startswith(CODEC_COMMAND):
+                # Телефон не умеет кодек (например, нет кодера H.264) и продолжает слать JPEG.
+                self.codec = CODEC_JPEG
+                self.listener.on_status("Кадры JPEG.")
+            elif command.startswith(TRANSPORT_COMMAND) and self.udp_receiver is not None:
+                # Телефон без UDP продолжает слать кадры по TCP (их читает _control_loop).
+                self.udp_receiver.close()
+                self.listener.on_status("Кадры по TCP.")
+        self._notify('on_command_result', command, ok, detail, rtt)
+
+    def _expire_commands(self):
+        """Сообщает о командах, которые телефон не подтвердил за COMMAND_ACK_TIMEOUT."""
+        now = time.perf_counter()
+        for command_id, (command, sent) in list(self._pending_commands.items()):
+            if now - sent > COMMAND_ACK_TIMEOUT:
+                del self._pending_commands[command_id]
+                self.metrics.command_unacked()
+                self.listener.on_status(f"Телефон не подтвердил команду {command}")
+                self._notify('on_command_result', command, False, 'timeout', None)
+
+    def stats(self):
+        """Снимок метрик потока вместе со счетчиками конвейера (потокобезопасно)."""
+        pipeline = self.pipeline
+        counters = {'host': self.host, 'port': self.port, 'connected': self.cam is not None,
+                    'protocol': self.protocol, 'codec': CODEC_NAMES[self.codec],
+                    'commands_pending': len(self._pending_commands),
+                    'reconnecting': self._outage_started is not None}
+        if self.first_frame_ms is not None:
+            counters['first_frame_ms'] = self.first_frame_ms
+        if self.jitter_buffer:
+            counters['jitter_buffer'] = self.jitter_buffer.stats()
+        if self.h264_decoder:
+            counters['h264'] = self.h264_decoder.stats()
+        if self.udp_receiver:
+            counters['udp'] = self.udp_receiver.stats()
+        if self.sinks.sinks:
+            counters['sinks'] = self.sinks.stats()
+        counters['buffer_pools'] = self.buffer_pool_stats()
+        if self.quality_controller:
+            if self.quality_controller.adjust_quality:
+                counters['quality'] = self.quality_controller.quality
+            counters['max_resolution'] = self.quality_controller.max_resolution
+        counters.update(self._totals)
+        if pipeline:
+            for key, value in pipeline.stats.items():
+                counters[key] = self._totals.get(key, 0) + value
+            counters['dropped'] = self._totals.get('dropped', 0) + pipeline.dropped
+            counters['receive_queue'] = pipeline.receive_queue.qsize()
+            counters['output_queue'] = pipeline.output_queue.qsize()
+        return self.metrics.snapshot(**counters)
+
+    def buffer_pool_stats(self):
+        """{пул: {'hits', 'misses', ...}} для буферов приема и пулов кадров (см. buffer_pool.py)."""
+        pools = dict(self.frame_pools)
+        if self.transform is not None:
+            pools['transform'] = self.transform.pool
+        receive_pool = getattr(self.frame_reader, 'pool', None)
+        if receive_pool is not None:
+            pools['receive'] = receive_pool
+        return {name: pool.stats() for name, pool in pools.items()}
+
+    async def _report_loop(self):
+        """Периодически публикует статистику потока и подстраивает качество на телефоне."""
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            self._expire_commands()
+            self._notify('on_stats', self.stats())
+            if self.quality_controller and self.pipeline:
+                self._adapt_quality()
+
+    def _adapt_quality(self):
+        """Передает контроллеру качества сигналы за последний интервал и отправляет его команды."""
+        metrics = self.metrics
+        receive_fps, _ = metrics.received.rates()
+        recent = max(1, int(receive_fps * STATS_INTERVAL))
+        signals = {
+            'receive_fps': receive_fps,
+            'payload_recv': metrics.stages['payload_recv'].recent_mean(recent) or 0.0,
+            'decode': metrics.stages['decode'].recent_mean(recent) or 0.0,
+            'transfer_latency': metrics.transfer_latency.recent_mean(recent),
+            'dropped': self.pipeline.dropped,
+        }
+        controller = self.quality_controller
+        for command in controller.update(signals, self.frame_size):
+            self._commands.put_nowait(command)
+            resolution = 'x'.join(map(str, controller.max_resolution)) if controller.max_resolution else '-'
+            quality = controller.quality if controller.adjust_quality else '-'
+            self.listener.on_status(f"Адаптация ({controller.reason}): качество {quality}, "
+                                    f"макс. разрешение {resolution}")
+
+    def _decode_frame(self, payload):
+        """
+        Стадия декодирования (выполняется в пуле потоков): JPEG, NV21 или H.264 читается прямо
+        из буфера приема. Возвращает (кадр, FrameInfo или None) или None при ошибке.
+        """
+        if self.profiler is not None:
+            self.profiler.tick()
+        info = payload.info
+        codec = CODEC_JPEG if info is None else info.codec
+        sequence = info.sequence if info is not None else None
+        h264_decoder = self.h264_decoder
+        if codec not in (CODEC_JPEG, CODEC_NV21, CODEC_H264) or (codec == CODEC_H264 and h264_decoder is None):
+            self.listener.on_status(f"Неподдерживаемый кодек кадра: {CODEC_NAMES.get(codec, codec)}")
+            return None
+        started = time.perf_counter()
+        if codec == CODEC_NV21:
+            frame = self.raw_decoder.decode(payload.view, info.width, info.height)
+        elif codec == CODEC_H264:
+            frame = h264_decoder.decode(payload.view, info.sequence)
+            if frame is None:
+                # Кадр пропущен до ключевого - декодер сообщает об этом сам.
+                return None
+        else:
+            frame = self.decoder.decode(payload.view)
+        self.metrics.record('decode', time.perf_counter() - started, frame=sequence)
+        if frame is None:
+            self.listener.on_status("Ошибка декодирования кадра.")
+            return None
+        return frame, info
+
+    def _output_frame(self, decoded):
+        """
+        Стадия вывода: запуск вирт. камеры по первому кадру, преобразование к размеру и ориентации
+        камеры (transform.py), превью, отправка и ожидание темпа (с часами вывода - только
+        передача кадра в буфер сглаживания).
+        """
+        if self.profiler is not None:
+            self.profiler.tick()
+        frame, info = decoded
+        sequence = info.sequence if info is not None else None
+        metrics = self.metrics
+        if self.cam is None:
+            if self.codec in (CODEC_NV21, CODEC_H264) and frame.ndim == 3 and self.config.yuv_passthrough \
+                    and self._awaiting_codec_switch():
+                # JPEG, отправленный до переключения телефона на NV21/H.264: камеру откроем по первому
+                # кадру нового кодека, чтобы выбрать формат NV12.
+                return
+            self._start_virtual_camera(frame)
+            if self.jitter_buffer is not None:
+                self._clock_thread = threading.Thread(target=self._clock_loop, name='output-clock', daemon=True)
+                self._clock_thread.start()
+        # Сначала размер и ориентация (кадр обычно уменьшается), затем формат камеры.
+        started = time.perf_counter()
+        frame = self.transform.apply(frame, self.cam.width, self.cam.height)
+        metrics.record('transform', time.perf_counter() - started, frame=sequence)
+        if frame.ndim == 2 and self._camera_format != NV12:
+            started = time.perf_counter()
+            frame = nv12_to(frame, self._camera_format, self.frame_pools['convert'])
+            metrics.record('convert', time.perf_counter() - started, frame=sequence)
+        elif frame.ndim == 3 and self._camera_format == NV12:
+            started = time.perf_counter()
+            frame = to_nv12(frame, self.config.pixel_format, self.frame_pools['convert'])
+            metrics.record('convert', time.perf_counter() - started, frame=sequence)
+
+        try:
+            if self.running and self.preview and self.preview.wants_frame():
+                started = time.perf_counter()
+                preview_pool = self.frame_pools['preview']
+                preview_frame = nv12_to(frame, self.config.pixel_format, preview_pool) \
+                    if frame.ndim == 2 else copy_frame(preview_pool, frame)
+                if self.preview.publish(preview_frame):
+                    metrics.record('preview', time.perf_counter() - started, frame=sequence)
+        except Exception as preview_err:
+             print(f"[!] Ошибка публикации превью: {preview_err}")
+
+        if self.sinks.wants_frames:
+            self.sinks.publish_frame(frame, info)
+
+        if self.jitter_buffer is not None:
+            self.jitter_buffer.push((frame, info))
+            return
+        self._send_frame(frame, info)
+        started = time.perf_counter()
+        self.cam.sleep_until_next_frame()
+        metrics.record('pacing', time.perf_counter() - started)
+
+    def _awaiting_codec_switch(self):
+        """
+        Ждать ли кадров нового кодека, не открывая камеру по JPEG. Ждем только телефон v3 (он
+        подтверждает команду или отказывается) и не дольше CODEC_SWITCH_TIMEOUT; телефон v2,
+        который не знает команду, отказаться не может и продолжает слать JPEG. Иначе - кадры JPEG,
+        камера открывается в pixel_format.
+        """
+        now = time.perf_counter()
+        if self._codec_wait_started is None:
+            self._codec_wait_started = now
+        if self.protocol >= CONTROL_PROTOCOL_VERSION and now - self._codec_wait_started < CODEC_SWITCH_TIMEOUT:
+            return True
+        self.listener.on_status(f"Телефон не переключился на {CODEC_NAMES[self.codec]} - кадры JPEG.")
+        self.codec = CODEC_JPEG
+        return False
+
+    def _send_frame(self, frame, info):
+        """Отправляет кадр в камеру и учитывает задержку "съемка -> вывод"."""
+        metrics = self.metrics
+        started = time.perf_counter()
+        self.cam.send(frame)
+        sent = time.perf_counter()
+        if info is not None and self.clock_offset is not None:
+            latency = sent - (info.capture_us / 1e6 - self.clock_offset)
+            if 0 <= latency < MAX_CAPTURE_LATENCY:
+                metrics.record_capture_latency(latency)
+        self._last_frame = frame
+        self._last_output_time = sent
+        metrics.record('send', sent - started, sent, info.sequence if info is not None else None)
+        metrics.frame_output()
+        if self.first_frame_ms is None:
+            self.first_frame_ms = (sent - self._run_started) * 1000
+            print(f"[*] Первый кадр в вирт. камере через {self.first_frame_ms:.0f} мс после запуска")
+
+    def _clock_loop(self):
+        """
+        Часы вывода (отдельный поток): ровно один кадр в камеру за такт target_fps - из буфера
+        сглаживания или, если он пуст, повтор предыдущего. Чтение сети и декодирование
+        от ожидания темпа не зависят.
+        """
+        buffer = self.jitter_buffer
+        metrics = self.metrics
+        while not self._clock_stop.is_set():
+            if self.profiler is not None:
+                self.profiler.tick()
+            item = buffer.pop()
+            try:
+                if item is not None:
+                    self._send_frame(*item)
+                else:
+                    self._hold_frame()
+                started = time.perf_counter()
+                self.cam.sleep_until_next_frame()
+                metrics.record('pacing', time.perf_counter() - started)
+            except Exception as e:
+                self.listener.on_status(f"Ошибка отправки в вирт. камеру: {e}")
+                self.stop()
+                return
+
+    async def _hold_loop(self, output_executor):
+        """
+        Повторяет в вирт. камеру последний кадр (или заглушку), пока новых кадров нет дольше
+        hold_after: вывод идет в том же потоке, что и обычные кадры, поэтому они не смешиваются.
+        """
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.config.target_fps
+        next_time = time.perf_counter()
+        while True:
+            next_time = max(next_time + interval, time.perf_counter())
+            await asyncio.sleep(next_time - time.perf_counter())
+            if self.cam is None or self._last_output_time is None:
+                continue
+            if time.perf_counter() - self._last_output_time > self.config.hold_after:
+                await loop.run_in_executor(output_executor, self._hold_frame)
+
+    def _hold_frame(self):
+        """
+        Отправляет в камеру повтор последнего кадра, а после hold_after без новых кадров
+        (если hold_frame='placeholder') - серую заглушку. Вызывается из потока вывода.
+        """
+        if self.cam is None or self._last_frame is None:
+            return
+        config = self.config
+        frame = self._last_frame
+        if config.hold_frame == 'placeholder' and config.hold_after is not None and \
+                time.perf_counter() - self._last_output_time > config.hold_after:
+            if self._placeholder is None:
+                self._placeholder = placeholder_frame(self.cam.width, self.cam.height, self._camera_format)
+            frame = self._placeholder
+        self.cam.send(frame)
+        self.metrics.frame_held()
+
+    def _start_virtual_camera(self, frame):
+        """
+        Создает виртуальную камеру размера OUTPUT_RESOLUTION или первого кадра после обрезки
+        и поворота (в NV12, если кадры несжатые).
+        """
+        config = self.config
+        self.listener.on_status("Первый кадр: {}x{}. Запуск вирт. камеры...".format(*frame_size(frame)))
+        frame_width, frame_height = config.output_resolution or self.transform.output_size(*frame_size(frame))
+        if frame.ndim == 2:
+            try:
+                self.cam = self.camera_factory(frame_width, frame_height, config.target_fps,
+                                               NV12, config.camera_backend, config.camera_device)
+                self._camera_format = NV12
+                self.listener.on_connected(f"{self.cam.device} ({self.cam.width}x{self.cam.height} "
+                                           f"@ {self.cam.fps}fps, NV12)")
+                return
+            except Exception as e_yuv:
+                self.listener.on_status(f"Вирт. камера не принимает NV12 ({e_yuv}), вывод в {config.pixel_format}.")
+                self.raw_decoder.pixel_format = config.pixel_format
+                if self.h264_decoder:
+                    self.h264_decoder.pixel_format = config.pixel_format
+        try:
+            self.cam = self.camera_factory(frame_width, frame_height, config.target_fps,
+                                           config.pixel_format, config.camera_backend, config.camera_device)
+            self._camera_format = config.pixel_format
+            self.listener.on_connected(f"{self.cam.device} ({self.cam.width}x{self.cam.height} @ {self.cam.fps}fps)")
+        except Exception as e_cam:
+            self.listener.on_status(f"КРИТИЧЕСКАЯ ОШИБКА: Не удалось запустить вирт. камеру: {e_cam}")
+            self.listener.on_failed(f"Ошибка вирт. камеры: {e_cam}")
+            self.running = False
+            raise
+
+    def _on_pipeline_error(self, stage, error):
+        """Переводит ошибку стадии конвейера в сообщение статуса."""
+        if not self.running:
+            return
+        if stage == 'receive':
+            if isinstance(error, (asyncio.TimeoutError, socket.timeout)):
+                self.listener.on_status("Таймаут ожидания кадра.")
+            elif isinstance(error, ConnectionAbortedError):
+                self.listener.on_status(f"Соединение разорвано: {error}")
+            else:
+                self.listener.on_status(f"Ошибка чтения кадра: {error}")
+        elif stage == 'output':
+            self.listener.on_status(f"Ошибка отправки в вирт. камеру: {error}")
+        else:
+            self.listener.on_status(f"Ошибка декодирования: {error}")
+
+    def _close_connection(self):
+        """Закрывает сокет текущего соединения с телефоном (и порт UDP)."""
+        if self.udp_receiver is not None:
+            self.udp_receiver.close()
+            self.udp_receiver.clear()
+        if self.sock:
+            print("[*] Закрытие сокета клиента...")
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            finally:
+                self.sock.close()
+                self.sock = None
+
+    def cleanup(self):
+         """Освобождает сокет, запись и виртуальную камеру."""
+         self._close_connection()
+         if self._clock_thread:
+             self._clock_stop.set()
+             self._clock_thread.join(timeout=1.0)
+             self._clock_thread = None
+         self.sinks.close()
+         if self.cam:
+             print("[*] Остановка виртуальной камеры...")
+             self.cam.close()
+             self.cam = None
+         self.listener.on_status("Отключено")
+         self.listener.on_disconnected()
+         print("[*] Ресурсы потока очищены.")
+
+    def _save_diagnostics(self):
+        """Конец сессии: сохраняет трассировку и незаконченные сэмплы профиля."""
+        if self.profiler is not None:
+            self.profiler.close()
+        if self.tracer is not None:
+            try:
+                count = self.tracer.save(self.config.trace_file)
+            except OSError as e:
+                print(f"[!] Не удалось сохранить трассировку {self.config.trace_file}: {e}")
+                return
+            print(f"[*] Трассировка ({count} событий) сохранена: {self.config.trace_file} "
+                  f"(открыть в ui.perfetto.dev или chrome://tracing)")
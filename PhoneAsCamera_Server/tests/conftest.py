@@ -0,0 +1,51 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# Модули клиента лежат плоско в PhoneAsCamera_Server и импортируются по имени.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phone_simulator import PhoneSimulator
+
+
+class RecordingCamera:
+    """Вирт. камера для тестов движка: без темпа, хранит копии выведенных кадров."""
+
+    device = 'test'
+
+    def __init__(self, width, height, fps, pixel_format=None, backend=None, device=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pixel_format = pixel_format
+        self.frames = []
+
+    def send(self, frame):
+        self.frames.append(frame.copy())
+
+    def sleep_until_next_frame(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def start_simulator():
+    """Запускает PhoneSimulator в фоновом потоке на свободном порту (один клиент)."""
+    started = []
+
+    def start(**options):
+        simulator = PhoneSimulator(port=0, **options)
+        simulator.prepare()
+        thread = threading.Thread(target=simulator.serve_forever, kwargs={'max_clients': 1}, daemon=True)
+        thread.start()
+        started.append((simulator, thread))
+        return simulator
+
+    yield start
+    for simulator, thread in started:
+        simulator.close()
+        thread.join(timeout=5)
@@ -0,0 +1,104 @@
+"""AdbClient и DeviceTracker против имитации сервера ADB (fake_adb_server.py)."""
+import socket
+import threading
+
+import pytest
+
+from adb_client import AdbClient, AdbError
+from fake_adb_server import FAKE_VERSION, FakeAdbServer
+
+
+@pytest.fixture
+def server():
+    server = FakeAdbServer(devices={'emulator-5554': 'device'})
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    client = AdbClient(port=server.port)
+    yield client
+    client.close()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_version_and_devices(client):
+    assert client.version() == FAKE_VERSION
+    assert client.devices() == {'emulator-5554': 'device'}
+
+
+def test_forward_and_kill_forward(server, client):
+    client.forward('tcp:8888', 'tcp:8888')
+    assert server.forwards == {'tcp:8888': ('emulator-5554', 'tcp:8888')}
+    with pytest.raises(AdbError, match='cannot rebind'):
+        client.forward('tcp:8888', 'tcp:9999', rebind=False)
+    client.kill_forward('tcp:8888', serial='emulator-5554')
+    assert server.forwards == {}
+
+
+def test_device_errors_are_reported(server, client):
+    with pytest.raises(AdbError, match='not found'):
+        client.forward('tcp:8888', 'tcp:8888', serial='missing')
+    server.set_device('R58M', 'unauthorized')
+    with pytest.raises(AdbError, match='more than one device'):
+        client.forward('tcp:8888', 'tcp:8888')
+    with pytest.raises(AdbError, match='unauthorized'):
+        client.forward('tcp:8888', 'tcp:8888', serial='R58M')
+
+
+def test_server_not_running():
+    client = AdbClient(port=_free_port())
+    with pytest.raises(AdbError):
+        client.version()
+
+
+def test_server_is_started_on_demand():
+    port = _free_port()
+    started = []
+
+    def start_server():
+        server = FakeAdbServer(port=port)
+        server.start()
+        started.append(server)
+        return True, None
+
+    client = AdbClient(port=port, start_server=start_server)
+    try:
+        assert client.version() == FAKE_VERSION
+        assert len(started) == 1
+    finally:
+        for server in started:
+            server.stop()
+
+
+def test_tracker_follows_device_changes(server, client):
+    updates = []
+    changed = threading.Event()
+
+    def on_devices(devices):
+        updates.append(devices)
+        changed.set()
+
+    tracker = client.track_devices(on_devices)
+    assert tracker.wait_ready(2.0)
+    assert client.devices() == {'emulator-5554': 'device'}
+
+    changed.clear()
+    server.set_device('R58M', 'unauthorized')
+    assert changed.wait(2.0)
+    assert updates[-1] == {'emulator-5554': 'device', 'R58M': 'unauthorized'}
+
+    changed.clear()
+    server.remove_device('emulator-5554')
+    assert changed.wait(2.0)
+    assert updates[-1] == {'R58M': 'unauthorized'}
+    # Список отвечает из кеша отслеживания, без нового запроса host:devices.
+    assert client.devices() == {'R58M': 'unauthorized'}
+    assert 'host:devices' not in server.requests
@@ -0,0 +1,156 @@
+"""
+Кольца буферов кадров (frame_buffers, buffer_pool.FramePool) против phone_simulator.py: кадр не
+перезаписывается, пока ждет в буфере сглаживания или очереди вывода и пока повторяется в камере;
+выделения памяти на кадр в установившемся режиме (bench_alloc.py).
+"""
+import asyncio
+import time
+
+import pytest
+
+import bench_alloc
+import h264
+from buffer_pool import FramePool
+from conftest import RecordingCamera
+from decoders import TurboJpegDecoder
+from phone_simulator import MARKER_CYCLE, read_frame_marker
+from protocol import CODEC_NV21
+from stream_engine import EngineListener, StreamConfig, StreamEngine, frame_buffers
+
+FRAMES = 60
+
+
+class StallingCamera(RecordingCamera):
+    """Камера, которая раз в stall_every кадров "зависает" - очереди и буфер сглаживания заполняются."""
+
+    def __init__(self, *args, stall_every=10, stall=0.25, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stall_every = stall_every
+        self.stall = stall
+        self.sends = 0
+        self.sent = set()
+
+    def send(self, frame):
+        self.sends += 1
+        self.sent.add(id(frame))
+        if self.sends % self.stall_every == 0:
+            time.sleep(self.stall)
+
+
+class RecordingPreview:
+    """Превью, которое хочет каждый кадр и запоминает, какие массивы ему передали."""
+
+    def __init__(self):
+        self.frames = set()
+
+    def wants_frame(self):
+        return True
+
+    def publish(self, frame):
+        self.frames.add(id(frame))
+        return True
+
+
+def _check_output(engine):
+    """
+    Оборачивает вывод движка: номер, нарисованный симулятором в кадре, должен совпадать
+    с номером кадра из заголовка (при отправке после буфера сглаживания или очереди вывода)
+    и с номером последнего отправленного кадра (при повторе в _hold_frame).
+    Возвращает словарь {'sent': [...], 'held': [...], 'overwritten': [...]}.
+    """
+    checks = {'sent': [], 'held': [], 'overwritten': []}
+    send_frame, hold_frame = engine._send_frame, engine._hold_frame
+
+    def checked_send(frame, info):
+        expected = info.sequence % MARKER_CYCLE
+        marker = read_frame_marker(frame)
+        checks['sent'].append(expected)
+        if marker != expected:
+            checks['overwritten'].append(('sent', expected, marker))
+        send_frame(frame, info)
+
+    def checked_hold():
+        if engine._last_frame is not None and checks['sent']:
+            expected = checks['sent'][-1]
+            marker = read_frame_marker(engine._last_frame)
+            checks['held'].append(expected)
+            if marker != expected:
+                checks['overwritten'].append(('held', expected, marker))
+        hold_frame()
+
+    engine._send_frame = checked_send
+    engine._hold_frame = checked_hold
+    return checks
+
+
+# Кадры NV21 декодируются в кольцо декодера (cv2.imdecode выделял бы новый массив на кадр):
+# в NV12 и BGR - прямо в камеру, с увеличением - через кольцо преобразования.
+@pytest.mark.parametrize('output_clock', [True, False])
+@pytest.mark.parametrize('yuv_passthrough, output_resolution', [(True, None), (False, None), (True, (400, 300))])
+def test_frames_are_not_overwritten_while_queued_or_held(start_simulator, output_clock, yuv_passthrough,
+                                                         output_resolution):
+    simulator = start_simulator(resolution=(320, 240), fps=60, frames=FRAMES, seed=0, jitter=0.02,
+                                stall_every=25, stall_duration=0.3, codec=CODEC_NV21)
+    cameras = []
+
+    def camera_factory(*args, **kwargs):
+        cameras.append(StallingCamera(*args, **kwargs))
+        return cameras[-1]
+
+    config = StreamConfig(transport_codec='nv21', decoder_backend='opencv', adaptive_quality=False,
+                          reconnect=False, hold_after=0.05, output_clock=output_clock,
+                          yuv_passthrough=yuv_passthrough, output_resolution=output_resolution,
+                          output_scale='stretch', receive_queue_policy='block')
+    preview = RecordingPreview()
+    engine = StreamEngine('127.0.0.1', simulator.port, config, EngineListener(), preview=preview,
+                          camera_factory=camera_factory)
+    checks = _check_output(engine)
+    asyncio.run(engine.run())
+
+    assert not checks['overwritten']
+    assert len(checks['sent']) >= 10 and checks['held']
+    if output_clock:
+        # Камера зависала, а кадры продолжали приходить: буфер сглаживания был полон.
+        assert engine.jitter_buffer.stats()['trimmed']
+    # Превью получает свою копию, а не буфер, который видит камера.
+    assert preview.frames and not preview.frames & cameras[0].sent
+
+
+def test_frame_buffers_cover_queues():
+    config = StreamConfig(jitter_max_depth=4, output_queue_size=2)
+    buffers, decode_buffers = frame_buffers(config)
+    # Буфер сглаживания, кадр в камере, повторяемый кадр и кадр в преобразовании.
+    assert buffers >= config.jitter_max_depth + 3
+    # Кадр без преобразования идет в камеру из буфера декодера: еще очередь вывода,
+    # кадр, ждущий места в ней, и кадр в стадии вывода.
+    assert decode_buffers >= buffers + config.output_queue_size + 1
+    assert frame_buffers(StreamConfig(output_clock=False))[0] == 3
+
+
+def test_frame_pool_ring_order():
+    pool = FramePool(3)
+    first, second, third = (pool.acquire((2, 2)) for _ in range(3))
+    assert len({id(first), id(second), id(third)}) == 3
+    assert pool.acquire((2, 2)) is first
+    assert pool.acquire((4, 2)) is not second
+    assert pool.stats()['misses'] == 4
+
+
+STEADY_STATE_SCENARIOS = ['nv21-1080p', 'nv21-1080p-bgr', 'jpeg-720p', 'jpeg-720p-nv12', 'h264-720p']
+
+
+@pytest.mark.parametrize('name', STEADY_STATE_SCENARIOS)
+def test_steady_state_allocates_nothing_per_frame(name):
+    codec = bench_alloc.SCENARIOS[name][0]
+    if codec == bench_alloc.CODEC_H264 and not h264.is_available():
+        pytest.skip("нет PyAV")
+    if codec == bench_alloc.CODEC_JPEG and not TurboJpegDecoder.is_available():
+        # cv2.imdecode не принимает dst: без turbojpeg декодер выделяет кадр.
+        pytest.skip("нет PyTurboJPEG/libjpeg-turbo")
+    pooled = bench_alloc.run(name, frames=20, warmup=10, pooled=True, decoder_backend='turbojpeg')
+    unpooled = bench_alloc.run(name, frames=5, warmup=2, pooled=False, decoder_backend='turbojpeg')
+    frame_kb = pooled['frame_mb'] * 1024
+    assert pooled['pool_misses'] == 0
+    # Мелкие объекты Python (заголовки, FrameInfo) - не данные кадра.
+    assert pooled['allocated_kb']['max'] < 16 < frame_kb
+    assert unpooled['allocated_kb']['mean'] >= frame_kb
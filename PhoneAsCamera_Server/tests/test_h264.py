@@ -0,0 +1,100 @@
+"""H.264: кодирование синтетического клипа, разбор Annex-B кусками, декодирование и восстановление после потери."""
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip('av')
+
+from conftest import RecordingCamera
+from decoders import BGR
+from h264 import AnnexBParser, H264Decoder, H264Encoder, is_keyframe
+from phone_simulator import read_frame_marker, synthetic_image
+from stream_engine import EngineListener, StreamConfig, StreamEngine
+
+WIDTH, HEIGHT, FPS = 320, 240, 30
+FRAMES = 40
+
+
+@pytest.fixture(scope='module')
+def clip():
+    """(исходные кадры BGR, access unit'ы кодера)."""
+    encoder = H264Encoder(WIDTH, HEIGHT, FPS)
+    images = [synthetic_image(WIDTH, HEIGHT, index) for index in range(FRAMES)]
+    return images, [encoder.encode(image) for image in images]
+
+
+def test_encoder_output(clip):
+    _, units = clip
+    assert all(units)
+    assert is_keyframe(units[0]) and not is_keyframe(units[1])
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_annexb_parser_arbitrary_chunks(clip, seed):
+    images, units = clip
+    stream = b''.join(units)
+    chunk_random = random.Random(seed)
+    parser = AnnexBParser()
+    parsed = []
+    position = 0
+    while position < len(stream):
+        size = chunk_random.choice([1, 2, 3, 5, chunk_random.randint(1, 4000)])
+        parsed += parser.feed(stream[position:position + size])
+        position += size
+    parsed.append(parser.flush())
+    assert parsed == units
+
+    decoder = H264Decoder(BGR)
+    for sequence, (image, unit) in enumerate(zip(images, parsed)):
+        frame = decoder.decode(unit, sequence)
+        assert frame is not None and frame.shape == (HEIGHT, WIDTH, 3)
+        assert np.mean(np.abs(frame.astype(np.int16) - image)) < 12
+    assert decoder.stats() == {'keyframes': 1, 'keyframe_requests': 0, 'skipped': 0, 'errors': 0}
+
+
+def test_keyframe_request_recovers_after_loss():
+    """Потерянный кадр: следующий P-кадр пропускается, запрос ключевого кадра восстанавливает поток."""
+    encoder = H264Encoder(WIDTH, HEIGHT, FPS)
+    requests = []
+    decoder = H264Decoder(BGR, request_keyframe=lambda: requests.append(True))
+    lost = 10
+    decoded = []
+    for index in range(FRAMES):
+        unit = encoder.encode(synthetic_image(WIDTH, HEIGHT, index), keyframe=bool(requests))
+        if requests:
+            requests.clear()
+            assert is_keyframe(unit)
+        if index == lost:
+            continue
+        decoded.append(decoder.decode(unit, index) is not None)
+    assert decoded[:lost] == [True] * lost
+    # Кадр после потери ссылается на потерянный и пропускается; следующий - ключевой.
+    assert decoded[lost:] == [False] + [True] * (FRAMES - lost - 2)
+    assert decoder.stats()['keyframe_requests'] == 1 and decoder.stats()['skipped'] == 1
+
+
+def test_simulator_skip_every_recovers_with_keyframe(start_simulator):
+    skip_every = 20
+    simulator = start_simulator(resolution=(WIDTH, HEIGHT), fps=FPS, frames=70, seed=0,
+                                skip_every=skip_every)
+    cameras = []
+
+    def camera_factory(*args, **kwargs):
+        cameras.append(RecordingCamera(*args, **kwargs))
+        return cameras[-1]
+
+    config = StreamConfig(transport_codec='h264', adaptive_quality=False, reconnect=False, hold_after=None,
+                          output_clock=False, decoder_backend='opencv')
+    engine = StreamEngine('127.0.0.1', simulator.port, config, EngineListener(), camera_factory=camera_factory)
+    asyncio.run(engine.run())
+
+    stats = engine.stats()
+    assert stats['codec'] == 'H264'
+    assert stats['h264']['keyframe_requests'] >= 1
+    assert 'CMD:KEYFRAME' in simulator.commands
+    # После каждой потери вывод продолжается с ключевого кадра: в камеру попадают кадры
+    # и из последнего отрезка между потерями.
+    markers = [read_frame_marker(frame) for frame in cameras[0].frames]
+    assert max(marker for marker in markers if marker is not None) > 2 * skip_every
@@ -0,0 +1,150 @@
+"""Буфер сглаживания (JitterBuffer) и часы вывода StreamEngine._clock_loop на управляемых часах."""
+import numpy as np
+import pytest
+
+from jitter_buffer import JitterBuffer
+from stream_engine import StreamConfig, StreamEngine
+
+FPS = 30
+TICK = 1.0 / FPS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, ticks=1):
+        self.now += ticks * TICK
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _push_every(buffer, clock, intervals):
+    """Кладет кадры с заданными интервалами (в тактах) между ними."""
+    buffer.push('first')
+    for number, ticks in enumerate(intervals):
+        clock.advance(ticks)
+        buffer.push(number)
+
+
+def test_depth_stays_minimal_for_steady_frames(clock):
+    buffer = JitterBuffer(FPS, min_depth=1, max_depth=4, clock=clock)
+    _push_every(buffer, clock, [1] * 20)
+    assert buffer.target == 1
+
+
+def test_depth_follows_interval_spread(clock):
+    buffer = JitterBuffer(FPS, min_depth=1, max_depth=4, percentile=0.9, clock=clock)
+    # Пачки: кадры приходят по три раза в три такта.
+    _push_every(buffer, clock, [3, 0, 0] * 10)
+    assert buffer.target == 3
+
+
+def test_depth_is_capped(clock):
+    buffer = JitterBuffer(FPS, min_depth=1, max_depth=4, clock=clock)
+    _push_every(buffer, clock, [10] * 5)
+    assert buffer.target == 4
+
+
+def test_output_starts_after_target_depth(clock):
+    buffer = JitterBuffer(FPS, min_depth=2, max_depth=4, clock=clock)
+    buffer.push('a')
+    assert buffer.pop() is None
+    assert buffer.underruns == 0
+    clock.advance()
+    buffer.push('b')
+    assert buffer.pop() == 'a'
+
+
+def test_overflow_drops_oldest(clock):
+    buffer = JitterBuffer(FPS, min_depth=1, max_depth=2, clock=clock)
+    for item in 'abc':
+        buffer.push(item)
+    assert buffer.trimmed == 1
+    assert [buffer.pop(), buffer.pop()] == ['b', 'c']
+
+
+def test_trims_when_over_target(clock):
+    buffer = JitterBuffer(FPS, min_depth=1, max_depth=4, trim_ticks=2, clock=clock)
+    for item in 'abc':
+        buffer.push(item)
+    assert buffer.target == 1
+    # Два такта подряд в буфере лишние кадры: на втором самый старый из оставшихся выбрасывается.
+    assert buffer.pop() == 'a'
+    clock.advance()
+    assert buffer.pop() == 'c'
+    assert buffer.trimmed == 1
+    assert buffer.stats()['depth'] == 0
+
+
+def test_underrun_and_rebuffering(clock):
+    buffer = JitterBuffer(FPS, min_depth=1, max_depth=4, clock=clock)
+    buffer.push('a')
+    clock.advance()
+    assert buffer.pop() == 'a'
+    assert buffer.pop() is None
+    assert buffer.underruns == 1
+    assert buffer.pop() is None
+    # Повторные пустые такты, пока буфер накапливается, - не новые опустошения.
+    assert buffer.underruns == 1
+    buffer.push('b')
+    assert buffer.pop() == 'b'
+    # Задержка считается по тем же часам: 'a' ждал такт, 'b' - нисколько.
+    delay = buffer.stats()['delay_ms']
+    assert delay['count'] == 2 and delay['max'] == pytest.approx(TICK * 1000)
+
+
+class TickingCamera:
+    """
+    Камера для часов вывода: вместо ожидания такта двигает управляемые часы и кладет
+    в буфер кадры по расписанию {такт: кадр}; после ticks тактов останавливает часы вывода.
+    """
+
+    device = 'test'
+    width, height, fps = 4, 4, FPS
+
+    def __init__(self, engine, clock, schedule, ticks):
+        self.engine = engine
+        self.clock = clock
+        self.schedule = schedule
+        self.ticks = ticks
+        self.tick = 0
+        self.sent = []
+
+    def send(self, frame):
+        self.sent.append(int(frame[0, 0, 0]))
+
+    def sleep_until_next_frame(self):
+        self.tick += 1
+        self.clock.advance()
+        if self.tick in self.schedule:
+            self.engine.jitter_buffer.push((self.schedule[self.tick], None))
+        if self.tick >= self.ticks:
+            self.engine._clock_stop.set()
+
+
+def _frame(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_clock_loop_repeats_previous_frame_on_underrun(clock):
+    engine = StreamEngine('127.0.0.1', config=StreamConfig(hold_after=None))
+    engine.jitter_buffer = JitterBuffer(FPS, min_depth=1, max_depth=4, clock=clock)
+    engine._run_started = 0.0
+    # Кадр 2 приходит через такт, кадр 3 - через два такта: буфер опустел,
+    # а глубина выросла до двух кадров, поэтому вывод ждет еще и кадр 4.
+    schedule = {1: _frame(2), 3: _frame(3), 4: _frame(4)}
+    engine.cam = TickingCamera(engine, clock, schedule, ticks=6)
+    engine.jitter_buffer.push((_frame(1), None))
+    engine._clock_loop()
+
+    assert engine.cam.sent == [1, 2, 2, 2, 3, 4]
+    assert engine.jitter_buffer.underruns == 1
+    assert engine.jitter_buffer.target == 2
+    assert engine.metrics.held_frames == 2
@@ -0,0 +1,113 @@
+"""Заголовок кадра v2, рукопожатие и откат на v1 (FrameReader против phone_simulator.py)."""
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from frame_reader import FrameReader
+from phone_simulator import PhoneSimulator
+from protocol import CODEC_JPEG, FRAME_HEADER_V1, FRAME_HEADER_V2, hello_command
+
+RESOLUTION = (320, 240)
+
+
+def _message_v2(data, sequence=0, header_extra=b'', codec=CODEC_JPEG, width=320, height=240):
+    header_size = FRAME_HEADER_V2.size + len(header_extra)
+    return FRAME_HEADER_V2.pack(header_size, len(data), sequence, 123456, codec, 1, width, height) \
+        + header_extra + data
+
+
+@pytest.fixture
+def pair():
+    reader_sock, writer_sock = socket.socketpair()
+    yield FrameReader(reader_sock), writer_sock
+    reader_sock.close()
+    writer_sock.close()
+
+
+def test_v1_frame(pair):
+    reader, writer = pair
+    writer.sendall(FRAME_HEADER_V1.pack(3) + b'abc')
+    payload = reader.read_frame()
+    assert bytes(payload.view) == b'abc' and payload.info is None
+
+
+def test_v2_header_fields(pair):
+    reader, writer = pair
+    reader.set_protocol(2)
+    writer.sendall(_message_v2(b'jpeg', sequence=7))
+    payload = reader.read_frame()
+    info = payload.info
+    assert bytes(payload.view) == b'jpeg'
+    assert (info.sequence, info.capture_us, info.codec, info.camera_id, info.width, info.height) == \
+        (7, 123456, CODEC_JPEG, 1, 320, 240)
+
+
+def test_v2_unknown_header_fields_are_skipped(pair):
+    reader, writer = pair
+    reader.set_protocol(2)
+    writer.sendall(_message_v2(b'first', header_extra=b'\x00' * 6) + _message_v2(b'second', sequence=1))
+    assert bytes(reader.read_frame().view) == b'first'
+    assert bytes(reader.read_frame().view) == b'second'
+
+
+@pytest.mark.parametrize('header_size, size', [(FRAME_HEADER_V2.size - 1, 4), (FRAME_HEADER_V2.size, 0)])
+def test_v2_invalid_header(pair, header_size, size):
+    reader, writer = pair
+    reader.set_protocol(2)
+    writer.sendall(FRAME_HEADER_V2.pack(header_size, size, 0, 0, CODEC_JPEG, 0, 0, 0))
+    with pytest.raises(ConnectionAbortedError):
+        reader.read_frame()
+
+
+@pytest.fixture
+def simulator_factory():
+    simulators = []
+
+    def start(protocol):
+        simulator = PhoneSimulator(port=0, resolution=RESOLUTION, fps=60, frames=5, protocol=protocol)
+        port = simulator.prepare()
+        threading.Thread(target=simulator.serve_forever, kwargs={'max_clients': 1}, daemon=True).start()
+        simulators.append(simulator)
+        return port
+
+    yield start
+    for simulator in simulators:
+        simulator.close()
+
+
+async def _session(port, client_version, frames=3):
+    """Приветствие клиента и несколько кадров: (результат рукопожатия, [FramePayload])."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket()
+    sock.setblocking(False)
+    await loop.sock_connect(sock, ('127.0.0.1', port))
+    try:
+        reader = FrameReader(sock)
+        await loop.sock_sendall(sock, (hello_command(client_version) + '\n').encode('utf-8'))
+        handshake = await asyncio.wait_for(reader.read_handshake_async(), 5)
+        payloads = [await asyncio.wait_for(reader.read_frame_async(), 5) for _ in range(frames)]
+        return handshake, [(bytes(payload.view[:2]), payload.info) for payload in payloads]
+    finally:
+        sock.close()
+
+
+@pytest.mark.parametrize('phone_version, client_version, expected', [(3, 3, 3), (3, 2, 2), (2, 3, 2)])
+def test_handshake_negotiates_lower_version(simulator_factory, phone_version, client_version, expected):
+    handshake, frames = asyncio.run(_session(simulator_factory(phone_version), client_version))
+    version, phone_time_us = handshake
+    assert version == expected and phone_time_us > 0
+    assert [info.sequence for _, info in frames] == [0, 1, 2]
+    for start, info in frames:
+        assert start == b'\xff\xd8'
+        assert (info.codec, info.width, info.height) == (CODEC_JPEG, *RESOLUTION)
+
+
+def test_v1_phone_falls_back(simulator_factory):
+    """Старое приложение не знает HELLO и сразу шлет кадры v1: первый заголовок не теряется."""
+    handshake, frames = asyncio.run(_session(simulator_factory(1), 3))
+    assert handshake is None
+    assert len(frames) == 3
+    for start, info in frames:
+        assert start == b'\xff\xd8' and info is None
@@ -0,0 +1,113 @@
+"""QualityController: снижение и осторожное повышение качества и разрешения на синтетических замерах."""
+import pytest
+
+from quality_controller import (COOLDOWN_INTERVALS, HOLD_INTERVALS, INITIAL_QUALITY, MIN_QUALITY,
+                                QUALITY_STEP_UP, QualityController, max_res_command, quality_command)
+from session_manager import SessionManager
+
+FPS = 30
+FULL_HD = (1920, 1080)
+HD = (1280, 720)
+
+
+def signals(receive_fps=FPS, payload_recv=0.005, decode=0.005, latency=None, dropped=0):
+    """Замеры интервала: по умолчанию канал и декодирование почти свободны."""
+    return {'receive_fps': receive_fps, 'payload_recv': payload_recv, 'decode': decode,
+            'transfer_latency': latency, 'dropped': dropped}
+
+
+def _cooldown(controller, sample, frame_size):
+    """После изменения контроллер пропускает COOLDOWN_INTERVALS интервалов."""
+    for _ in range(COOLDOWN_INTERVALS):
+        assert controller.update(sample, frame_size) == []
+
+
+def test_decode_overload_lowers_resolution_then_quality():
+    controller = QualityController(FPS)
+    # 40 мс на кадр при 30 кадрах/с на одном потоке - декодирование занято на 120%.
+    overloaded = signals(decode=0.04)
+    assert controller.update(overloaded, FULL_HD) == [max_res_command(*HD)]
+    assert controller.reason == 'cpu'
+    _cooldown(controller, overloaded, HD)
+    assert controller.update(overloaded, HD) == [max_res_command(960, 540)]
+    _cooldown(controller, overloaded, (960, 540))
+    assert controller.update(overloaded, (960, 540)) == [max_res_command(640, 360)]
+    _cooldown(controller, overloaded, (640, 360))
+    # Разрешение уже минимальное - снижается качество.
+    assert controller.update(overloaded, (640, 360)) == [quality_command(int(INITIAL_QUALITY * 0.7))]
+
+
+def test_drops_lower_resolution_under_moderate_decode_load():
+    controller = QualityController(FPS)
+    moderate = signals(decode=0.025)
+    assert controller.update(moderate, FULL_HD) == []
+    assert controller.update(signals(decode=0.025, dropped=5), FULL_HD) == [max_res_command(*HD)]
+
+
+def test_network_congestion_lowers_quality_then_resolution():
+    controller = QualityController(FPS)
+    # Чтение данных кадров занимает 90% времени приема.
+    congested = signals(payload_recv=0.03)
+    assert controller.update(congested, HD) == [quality_command(35)]
+    assert controller.reason == 'network'
+    _cooldown(controller, congested, HD)
+    assert controller.update(congested, HD) == [quality_command(MIN_QUALITY)]
+    _cooldown(controller, congested, HD)
+    assert controller.update(congested, HD) == [max_res_command(960, 540)]
+
+
+def test_growing_latency_counts_as_congestion():
+    controller = QualityController(FPS)
+    assert controller.update(signals(latency=0.05), HD) == []
+    assert controller.update(signals(latency=0.1), HD) == []
+    assert controller.update(signals(latency=0.25), HD) == [quality_command(35)]
+
+
+def test_step_up_needs_calm_intervals():
+    controller = QualityController(FPS)
+    calm = signals()
+    for _ in range(HOLD_INTERVALS - 1):
+        assert controller.update(calm, HD) == []
+    assert controller.update(calm, HD) == [quality_command(INITIAL_QUALITY + QUALITY_STEP_UP)]
+    assert controller.reason == 'headroom'
+    _cooldown(controller, calm, HD)
+    # Счет спокойных интервалов начинается заново, и один занятой интервал его сбрасывает.
+    for _ in range(HOLD_INTERVALS - 1):
+        assert controller.update(calm, HD) == []
+    busy = signals(payload_recv=0.02)
+    assert controller.update(busy, HD) == []
+    for _ in range(HOLD_INTERVALS - 1):
+        assert controller.update(calm, HD) == []
+    assert controller.update(calm, HD) == [quality_command(INITIAL_QUALITY + 2 * QUALITY_STEP_UP)]
+
+
+def test_hysteresis_band_keeps_settings():
+    """Между порогами снижения и повышения ничего не меняется."""
+    controller = QualityController(FPS)
+    middle = signals(payload_recv=0.02, decode=0.0233)
+    assert all(controller.update(middle, HD) == [] for _ in range(20))
+
+
+def test_recovers_after_overload():
+    controller = QualityController(FPS, adjust_quality=False)
+    assert controller.update(signals(decode=0.04), FULL_HD) == [max_res_command(*HD)]
+    _cooldown(controller, signals(), HD)
+    # Без сжатия качество не трогается. Разрешение возвращается, только если следующая
+    # ступень (примерно в 2.25 раза больше точек) не перегрузит декодирование.
+    for _ in range(2 * HOLD_INTERVALS):
+        assert controller.update(signals(decode=0.015), HD) == []
+    assert controller.update(signals(decode=0.005), HD) == [max_res_command(*FULL_HD)]
+
+
+@pytest.mark.parametrize('decode_workers, expected', [(1, [max_res_command(*HD)]), (4, [])])
+def test_decode_load_is_shared_by_pool_workers(decode_workers, expected):
+    controller = QualityController(FPS, decode_workers=decode_workers, adjust_quality=False)
+    assert controller.update(signals(decode=0.04), FULL_HD) == expected
+
+
+def test_session_manager_passes_shared_pool_size():
+    manager = SessionManager(decode_workers=3)
+    session = manager.add_session('phone', '127.0.0.1')
+    engine = manager._create_engine(session, decode_executor=None)
+    assert engine.config.decode_workers == 3
+    assert manager.config.decode_workers != 3
@@ -0,0 +1,143 @@
+"""Запись потока JPEG и воспроизведение: индекс, оборванная запись, ошибка диска."""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import recording
+from recording import FILE_HEADER, FOOTER, INDEX_ENTRY, RECORD_HEADER, FrameRecorder, Recording, ReplaySource
+
+FRAMES = 12
+
+
+def _payloads():
+    return [b'\xff\xd8' + os.urandom(100 + 37 * index) + b'\xff\xd9' for index in range(FRAMES)]
+
+
+def _record(path, payloads, interval=0.002):
+    recorder = FrameRecorder(str(path))
+    started = time.perf_counter()
+    for data in payloads:
+        recorder.write(memoryview(data))
+        time.sleep(interval)
+    elapsed = time.perf_counter() - started
+    recorder.close()
+    assert recorder.frames == len(payloads) and recorder.dropped == 0 and recorder.error is None
+    return elapsed
+
+
+async def _replay(source):
+    frames = []
+    while True:
+        payload = await source.read_frame_async()
+        if payload is None:
+            return frames
+        frames.append(bytes(payload.view))
+        source.release(payload)
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    path = tmp_path / 'stream.pacr'
+    payloads = _payloads()
+    elapsed = _record(path, payloads)
+    return path, payloads, elapsed
+
+
+def test_round_trip(recorded):
+    path, payloads, elapsed = recorded
+    source = ReplaySource(str(path), realtime=False)
+    index = source.recording.index
+    assert len(source) == FRAMES
+    assert list(index['size']) == [len(data) for data in payloads]
+    # Кадры лежат подряд: каждый - после заголовка записи и предыдущего кадра.
+    expected = []
+    offset = FILE_HEADER.size
+    for data in payloads:
+        offset += RECORD_HEADER.size
+        expected.append(offset)
+        offset += len(data)
+    assert list(index['offset']) == expected
+    timestamps = list(index['timestamp'])
+    assert timestamps == sorted(timestamps) and 0 <= timestamps[0] and timestamps[-1] <= elapsed
+    assert timestamps[-1] - timestamps[0] >= 0.002 * (FRAMES - 1)
+    assert asyncio.run(_replay(source)) == payloads
+    source.close()
+
+
+def test_truncated_recording_without_index(recorded):
+    path, payloads, _ = recorded
+    data = path.read_bytes()
+    index_offset, count, _ = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+    assert count == FRAMES and len(data) == index_offset + count * INDEX_ENTRY.itemsize + FOOTER.size
+    # Запись оборвалась посреди последнего кадра: индекса и окончания нет.
+    path.write_bytes(data[:index_offset - len(payloads[-1]) // 2])
+    stored = Recording(str(path))
+    assert len(stored) == FRAMES - 1
+    assert [bytes(stored.frame(number)[0]) for number in range(len(stored))] == payloads[:-1]
+    stored.close()
+    source = ReplaySource(str(path), realtime=False)
+    assert asyncio.run(_replay(source)) == payloads[:-1]
+    source.close()
+
+
+class FullDisk:
+    """
+    Файл, запись в который после limit байт падает с OSError (ENOSPC).
+    Пока gate не открыт, запись ждет (диск "тормозит" - очередь записи переполняется).
+    """
+
+    def __init__(self, file, limit):
+        self.file = file
+        self.limit = limit
+        self.gate = None
+
+    def write(self, data):
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.limit < len(data):
+            raise OSError(28, 'No space left on device')
+        self.limit -= len(data)
+        return self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+def test_write_error_stops_recording_without_hanging(tmp_path, monkeypatch):
+    path = tmp_path / 'full.pacr'
+    payloads = _payloads()
+    # Места хватает на заголовок файла и первый кадр.
+    disks = []
+
+    def open_full_disk(*args, **kwargs):
+        disks.append(FullDisk(open(*args, **kwargs), FILE_HEADER.size + RECORD_HEADER.size + len(payloads[0])))
+        return disks[-1]
+
+    monkeypatch.setattr(recording, 'open', open_full_disk, raising=False)
+    recorder = FrameRecorder(str(path), queue_size=2)
+    monkeypatch.undo()
+    disk = disks[0]
+    disk.gate = threading.Event()
+    for data in payloads[:6]:
+        recorder.write(data)
+    assert recorder.dropped >= 3
+    disk.gate.set()
+    deadline = time.perf_counter() + 5
+    while recorder.error is None and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert isinstance(recorder.error, OSError)
+    # После ошибки кадры не ставятся в очередь, и close() не ждет поток записи.
+    for data in payloads[6:]:
+        recorder.write(data)
+    closing = threading.Thread(target=recorder.close)
+    closing.start()
+    closing.join(timeout=10)
+    assert not closing.is_alive()
+    assert recorder.frames == 1 and recorder.frames + recorder.dropped == FRAMES
+    # Файл без индекса: воспроизводится кадр, записанный до ошибки.
+    stored = Recording(str(path))
+    assert len(stored) == 1 and bytes(stored.frame(0)[0]) == payloads[0]
+    stored.close()
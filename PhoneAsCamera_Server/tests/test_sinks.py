@@ -0,0 +1,129 @@
+"""Приемники кадров: медленный приемник теряет старые кадры сам, MJPEG отдает JPEG как есть."""
+import http.client
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pytest
+
+from sinks import FRAME, JPEG, MJPEG_BOUNDARY, CallbackSink, FrameSink, MjpegHttpSink, SinkFanout
+
+QUEUE_SIZE = 3
+FRAMES = 12
+
+
+def test_frame_sink_is_abstract():
+    with pytest.raises(TypeError):
+        FrameSink('base')
+
+
+class BlockedSink(CallbackSink):
+    """Приемник, который "зависает" на первом кадре, пока не открыт release."""
+
+    def __init__(self, kind):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.received = []
+        super().__init__('slow', self._consume, kind=kind, queue_size=QUEUE_SIZE)
+
+    def _consume(self, data, info):
+        self.entered.set()
+        self.release.wait(5)
+        self.received.append(info)
+
+
+def _wait(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.mark.parametrize('kind', [JPEG, FRAME])
+def test_slow_sink_drops_oldest_without_delaying_others(kind):
+    slow = BlockedSink(kind)
+    fast_received = []
+    fast = CallbackSink('fast', lambda data, info: fast_received.append(info), kind=kind, queue_size=QUEUE_SIZE)
+    fanout = SinkFanout([slow, fast])
+
+    def publish(number):
+        if kind == JPEG:
+            fanout.publish_jpeg(memoryview(b'\xff\xd8' + bytes([number]) + b'\xff\xd9'), number)
+        else:
+            fanout.publish_frame(np.full((4, 4, 3), number, dtype=np.uint8), number)
+
+    publish(0)
+    assert slow.entered.wait(5)
+    started = time.perf_counter()
+    for number in range(1, FRAMES):
+        publish(number)
+        # Быстрый приемник успевает за каждым кадром, пока медленный стоит.
+        assert _wait(lambda: len(fast_received) == number + 1)
+    # Публикация не ждет медленный приемник (он держит кадр 0 до release).
+    assert time.perf_counter() - started < 2
+    assert fast_received == list(range(FRAMES))
+    slow.release.set()
+    fanout.close()
+    # Медленный приемник: кадр, на котором он стоял, и последние QUEUE_SIZE - остальные вытеснены.
+    assert slow.received == [0] + list(range(FRAMES - QUEUE_SIZE, FRAMES))
+    assert slow.stats()['dropped'] == FRAMES - 1 - QUEUE_SIZE
+    assert fast.stats()['dropped'] == 0
+
+
+def test_published_frame_is_a_readonly_copy():
+    received = []
+    sink = CallbackSink('copy', lambda data, info: received.append(data))
+    fanout = SinkFanout([sink])
+    frame = np.zeros((2, 2, 3), dtype=np.uint8)
+    fanout.publish_frame(frame)
+    frame[:] = 255
+    fanout.close()
+    assert not received[0].any() and not received[0].flags.writeable
+
+
+@pytest.fixture
+def mjpeg():
+    sink = MjpegHttpSink(0, host='127.0.0.1')
+    sink.start()
+    yield sink
+    sink.close()
+
+
+def _jpeg(number):
+    return b'\xff\xd8\xff\xe0' + bytes(range(256)) * (number + 1) + b'\xff\xd9'
+
+
+def test_mjpeg_snapshot_serves_received_bytes(mjpeg):
+    url = f'http://127.0.0.1:{mjpeg.port}/snapshot.jpg'
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(url, timeout=5)
+    assert error.value.code == 503
+    SinkFanout([mjpeg]).publish_jpeg(memoryview(_jpeg(3)))
+    with urllib.request.urlopen(url, timeout=5) as response:
+        assert response.headers['Content-Type'] == 'image/jpeg'
+        assert response.read() == _jpeg(3)
+
+
+def test_mjpeg_stream_serves_received_bytes(mjpeg):
+    connection = http.client.HTTPConnection('127.0.0.1', mjpeg.port, timeout=5)
+    connection.request('GET', '/')
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.headers['Content-Type'] == f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}'
+    assert _wait(lambda: mjpeg.stats()['clients'] == 1)
+    fanout = SinkFanout([mjpeg])
+    for number in range(3):
+        fanout.publish_jpeg(memoryview(_jpeg(number)))
+        assert response.readline() == f'--{MJPEG_BOUNDARY}\r\n'.encode('ascii')
+        headers = {}
+        while True:
+            line = response.readline().decode('ascii').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name] = value.strip()
+        assert headers['Content-Type'] == 'image/jpeg'
+        assert response.read(int(headers['Content-Length'])) == _jpeg(number)
+        assert response.read(2) == b'\r\n'
+    connection.close()
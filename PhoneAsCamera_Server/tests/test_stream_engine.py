@@ -0,0 +1,78 @@
+"""Сессии StreamEngine против phone_simulator.py (протокол v3, ответы на команды)."""
+import asyncio
+
+from conftest import RecordingCamera
+from stream_engine import EngineListener, StreamConfig, StreamEngine
+
+RESOLUTION = (320, 240)
+ENGINE_OPTIONS = {'transport_codec': 'jpeg', 'decoder_backend': 'opencv', 'adaptive_quality': False,
+                  'reconnect': False, 'hold_after': None}
+
+
+class MinimalListener:
+    """Получатель событий без наследования от EngineListener: нет on_stats и on_command_result."""
+
+    def __init__(self):
+        self.engine = None
+        self.messages = []
+        self.failures = []
+
+    def on_status(self, message):
+        self.messages.append(message)
+
+    def on_connected(self, device_info):
+        self.engine.send_command('CMD:QUALITY=60')
+        self.engine.send_command('CMD:UNKNOWN')
+
+    def on_failed(self, message):
+        self.failures.append(message)
+
+    def on_disconnected(self):
+        pass
+
+
+class RecordingListener(MinimalListener, EngineListener):
+    def __init__(self):
+        super().__init__()
+        self.results = []
+        self.stats = []
+
+    def on_stats(self, stats):
+        self.stats.append(stats)
+
+    def on_command_result(self, command, ok, detail, rtt):
+        self.results.append((command, ok, detail))
+
+
+def _run_session(start_simulator, listener, frames=45):
+    simulator = start_simulator(resolution=RESOLUTION, fps=30, frames=frames, seed=0)
+    cameras = []
+
+    def camera_factory(*args, **kwargs):
+        cameras.append(RecordingCamera(*args, **kwargs))
+        return cameras[-1]
+
+    engine = StreamEngine('127.0.0.1', simulator.port, StreamConfig(**ENGINE_OPTIONS), listener,
+                          camera_factory=camera_factory)
+    listener.engine = engine
+    asyncio.run(engine.run())
+    return engine, cameras
+
+
+def test_listener_without_optional_methods(start_simulator):
+    listener = MinimalListener()
+    engine, cameras = _run_session(start_simulator, listener)
+    assert not listener.failures
+    assert engine.stats()['protocol'] == 3
+    # Ответы на обе команды дошли, и прием не оборвался на первом из них.
+    assert any(message.startswith("Телефон выполнил CMD:QUALITY=60") for message in listener.messages)
+    assert "Телефон отклонил CMD:UNKNOWN: UNKNOWN" in listener.messages
+    assert engine.stats()['received'] == 45
+    assert cameras and cameras[0].frames
+
+
+def test_listener_receives_command_results(start_simulator):
+    listener = RecordingListener()
+    _run_session(start_simulator, listener)
+    assert listener.results == [('CMD:QUALITY=60', True, '60'), ('CMD:UNKNOWN', False, 'UNKNOWN')]
+    assert listener.stats
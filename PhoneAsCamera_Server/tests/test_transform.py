@@ -0,0 +1,109 @@
+"""FrameTransform: размещение пикселей при повороте и зеркале (BGR и NV12), поля 'fit', кэш планов."""
+import numpy as np
+import pytest
+
+from transform import BORDER_UV, BORDER_Y, ROTATIONS, FrameTransform
+
+WIDTH, HEIGHT = 8, 6
+
+
+def _bgr(width=WIDTH, height=HEIGHT, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def _nv12(width=WIDTH, height=HEIGHT, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height * 3 // 2, width), dtype=np.uint8)
+
+
+def _oriented(image, rotation, mirror):
+    """Ожидаемый результат: поворот по часовой стрелке, затем зеркало по горизонтали."""
+    image = np.rot90(image, k=-(rotation // 90), axes=(0, 1))
+    return image[:, ::-1] if mirror else image
+
+
+def _nv12_planes(frame, width, height):
+    return frame[:height], frame[height:].reshape(height // 2, width // 2, 2)
+
+
+@pytest.mark.parametrize('mirror', [False, True])
+@pytest.mark.parametrize('rotation', ROTATIONS)
+def test_bgr_orientation(rotation, mirror):
+    transform = FrameTransform(rotation, mirror)
+    frame = _bgr()
+    width, height = transform.output_size(WIDTH, HEIGHT)
+    assert (width, height) == ((HEIGHT, WIDTH) if rotation in (90, 270) else (WIDTH, HEIGHT))
+    result = transform.apply(frame, width, height)
+    assert result.shape == (height, width, 3)
+    np.testing.assert_array_equal(result, _oriented(frame, rotation, mirror))
+
+
+@pytest.mark.parametrize('mirror', [False, True])
+@pytest.mark.parametrize('rotation', ROTATIONS)
+def test_nv12_orientation(rotation, mirror):
+    transform = FrameTransform(rotation, mirror)
+    frame = _nv12()
+    width, height = transform.output_size(WIDTH, HEIGHT)
+    result = transform.apply(frame, width, height)
+    assert result.shape == (height * 3 // 2, width)
+    y, uv = _nv12_planes(frame, WIDTH, HEIGHT)
+    result_y, result_uv = _nv12_planes(result, width, height)
+    np.testing.assert_array_equal(result_y, _oriented(y, rotation, mirror))
+    # Пары U,V поворачиваются вместе, порядок внутри пары сохраняется.
+    np.testing.assert_array_equal(result_uv, _oriented(uv, rotation, mirror))
+
+
+def test_unchanged_frame_is_returned_as_is():
+    frame = _bgr()
+    assert FrameTransform().apply(frame, WIDTH, HEIGHT) is frame
+
+
+def test_fit_centers_rotated_frame_with_bars():
+    """Кадр 8x6, повернутый на 90, в камере 10x8: содержимое 6x8 по центру, по бокам поля по 2 точки."""
+    transform = FrameTransform(90, scale_mode='fit')
+    frame = _nv12()
+    result = transform.apply(frame, 10, 8)
+    y, uv = _nv12_planes(result, 10, 8)
+    source_y, source_uv = _nv12_planes(frame, WIDTH, HEIGHT)
+    np.testing.assert_array_equal(y[:, 2:8], _oriented(source_y, 90, False))
+    np.testing.assert_array_equal(uv[:, 1:4], _oriented(source_uv, 90, False))
+    assert (y[:, :2] == BORDER_Y).all() and (y[:, 8:] == BORDER_Y).all()
+    assert (uv[:, :1] == BORDER_UV).all() and (uv[:, 4:] == BORDER_UV).all()
+    bgr = transform.apply(_bgr(), 10, 8)
+    assert bgr.shape == (8, 10, 3)
+    assert not bgr[:, :2].any() and not bgr[:, 8:].any()
+    np.testing.assert_array_equal(bgr[:, 2:8], _oriented(_bgr(), 90, False))
+
+
+def test_crop_selects_region():
+    transform = FrameTransform(180, crop=(0.5, 0.0, 0.5, 1.0))
+    frame = _bgr()
+    width, height = transform.output_size(WIDTH, HEIGHT)
+    assert (width, height) == (WIDTH // 2, HEIGHT)
+    np.testing.assert_array_equal(transform.apply(frame, width, height),
+                                  _oriented(frame[:, WIDTH // 2:], 180, False))
+
+
+def test_plan_is_rebuilt_when_input_size_changes():
+    transform = FrameTransform(90, mirror=True, buffers=2)
+    first = _nv12()
+    out_width, out_height = transform.output_size(WIDTH, HEIGHT)
+    transform.apply(first, out_width, out_height)
+    transform.apply(_nv12(seed=1), out_width, out_height)
+    assert len(transform._plans) == 1
+
+    # Телефон сменил разрешение: тот же размер камеры, новый план для нового кадра.
+    smaller = _nv12(4, 6, seed=2)
+    result = transform.apply(smaller, out_width, out_height)
+    assert len(transform._plans) == 2
+    assert result.shape == (out_height * 3 // 2, out_width)
+    y, _ = _nv12_planes(result, out_width, out_height)
+    # 4x6 после поворота - 6x4, в камере 6x8 с сохранением пропорций: 6x4 по центру.
+    np.testing.assert_array_equal(y[2:6], _oriented(smaller[:6], 90, True))
+    assert (y[:2] == BORDER_Y).all() and (y[6:] == BORDER_Y).all()
+    assert (result[out_height:out_height + 1] == BORDER_UV).all()
+
+    # Возврат к прежнему размеру использует сохраненный план.
+    np.testing.assert_array_equal(_nv12_planes(transform.apply(first, out_width, out_height),
+                                               out_width, out_height)[0],
+                                  _oriented(first[:HEIGHT], 90, True))
+    assert len(transform._plans) == 2
@@ -0,0 +1,211 @@
+"""
+Сборка кадров из фрагментов UDP: потери, перестановки, повторы и некорректные фрагменты;
+прием от phone_simulator.py по loopback с потерями и перестановками датаграмм.
+"""
+import asyncio
+import os
+import socket
+
+import pytest
+
+from buffer_pool import BufferPool
+from frame_reader import FrameReader
+from protocol import (CODEC_CONTROL, FRAGMENT_HEADER, fragment_message, hello_command, parse_reply,
+                      tag_command, transport_command)
+from udp_transport import REASSEMBLY_TIMEOUT, FrameAssembler, UdpFrameReceiver
+
+FRAGMENT_SIZE = 100
+
+
+def fragments(message, sequence, fragment_size=FRAGMENT_SIZE):
+    """(номер, смещение, размер, индекс, число, данные) для каждой датаграммы сообщения."""
+    result = []
+    for datagram in fragment_message(message, sequence, fragment_size):
+        _, seq, offset, size, index, count = FRAGMENT_HEADER.unpack_from(datagram)
+        result.append((seq, offset, size, index, count, datagram[FRAGMENT_HEADER.size:]))
+    return result
+
+
+def feed(assembler, items, now=0.0):
+    """Подает фрагменты; возвращает собранные сообщения (bytes) по порядку."""
+    done = []
+    for item in items:
+        partial = assembler.add(*item, now)
+        if partial is not None:
+            done.append(bytes(partial.view))
+            assembler.pool.release(partial.buffer)
+    return done
+
+
+@pytest.fixture
+def assembler():
+    return FrameAssembler(BufferPool(), timeout=0.1)
+
+
+def test_complete_in_order(assembler):
+    message = os.urandom(350)
+    assert feed(assembler, fragments(message, 0)) == [message]
+    assert assembler.frames == 1 and assembler.fragments == 4
+
+
+def test_reordered_fragments(assembler):
+    message = os.urandom(350)
+    assert feed(assembler, reversed(fragments(message, 0))) == [message]
+
+
+def test_fragments_of_neighbouring_frames_interleaved(assembler):
+    first, second = os.urandom(250), os.urandom(250)
+    a, b = fragments(first, 0), fragments(second, 1)
+    assert feed(assembler, [a[0], b[0], a[1], b[1], a[2], b[2]]) == [first, second]
+
+
+def test_duplicate_fragment_is_ignored(assembler):
+    message = os.urandom(250)
+    items = fragments(message, 0)
+    assert feed(assembler, [items[0], items[0], items[1], items[2]]) == [message]
+    assert assembler.duplicates == 1
+
+
+def test_lost_fragment_drops_frame_when_newer_completes(assembler):
+    lost, next_frame = os.urandom(250), os.urandom(150)
+    items = fragments(lost, 0)
+    assert feed(assembler, items[:2] + fragments(next_frame, 1)) == [next_frame]
+    assert assembler.incomplete_frames == 1 and assembler.lost_fragments == 1
+    # Опоздавший фрагмент выброшенного кадра не принимается.
+    assert feed(assembler, items[2:]) == []
+    assert assembler.late_fragments == 1
+
+
+def test_incomplete_frame_expires(assembler):
+    items = fragments(os.urandom(250), 0)
+    feed(assembler, items[:1], now=1.0)
+    assembler.expire(1.05)
+    assert assembler.stats()['pending'] == 1
+    assembler.expire(1.2)
+    assert assembler.stats()['pending'] == 0 and assembler.incomplete_frames == 1
+
+
+def test_missing_frames_are_counted(assembler):
+    feed(assembler, fragments(b'a' * 10, 0))
+    feed(assembler, fragments(b'b' * 10, 3))
+    assert assembler.missing_frames == 2
+
+
+def test_sequence_wraparound(assembler):
+    messages = [os.urandom(120) for _ in range(3)]
+    items = [item for seq, message in zip((0xFFFFFFFE, 0xFFFFFFFF, 0), messages) for item in fragments(message, seq)]
+    assert feed(assembler, items) == messages
+
+
+def test_offset_not_matching_index_is_rejected(assembler):
+    """Фрагменты с нужными индексами, но не на своих местах, не должны собрать кадр с дырой."""
+    stale = b'x' * 300
+    feed(assembler, fragments(stale, 0))
+    # Тот же буфер из пула, но второй фрагмент смещен: байты 100-149 остались бы от прошлого кадра.
+    message = b'y' * 300
+    items = fragments(message, 1)
+    seq, offset, size, index, count, data = items[1]
+    items[1] = (seq, offset + 50, size, index, count, data[:50])
+    assert feed(assembler, items) == []
+    assert assembler.invalid == 1 and assembler.frames == 1
+
+
+def test_short_middle_fragment_is_rejected(assembler):
+    items = fragments(os.urandom(300), 0)
+    seq, offset, size, index, count, data = items[1]
+    items[1] = (seq, offset, size, index, count, data[:60])
+    assert feed(assembler, items) == []
+    assert assembler.invalid == 1
+
+
+def test_last_fragment_must_end_the_message(assembler):
+    items = fragments(os.urandom(250), 0)
+    seq, offset, size, index, count, data = items[2]
+    items[2] = (seq, offset, size, index, count, data[:10])
+    assert feed(assembler, items) == []
+    assert assembler.invalid == 1
+
+
+def test_inconsistent_header_is_rejected(assembler):
+    items = fragments(os.urandom(250), 0)
+    seq, offset, size, index, count, data = items[0]
+    assert feed(assembler, [(seq, offset, size, count, count, data),        # индекс вне числа фрагментов
+                            (seq, offset, 10, index, count, data)]) == []    # данные длиннее сообщения
+    assert assembler.invalid == 2
+
+
+async def _udp_session(simulator):
+    """
+    Клиент v3 против симулятора: CMD:TRANSPORT=UDP, прием кадров через UdpFrameReceiver
+    до закрытия соединения телефоном. Возвращает (ответ на команду, номера кадров TCP, номера
+    кадров UDP, приемник).
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket()
+    sock.setblocking(False)
+    await loop.sock_connect(sock, ('127.0.0.1', simulator.port))
+    reader = FrameReader(sock)
+    receiver = UdpFrameReceiver(reader.pool, host='127.0.0.1', peer='127.0.0.1')
+    sequences = []
+    tcp_sequences = []
+
+    async def collect():
+        while True:
+            payload = await receiver.read_frame_async()
+            assert bytes(payload.view[:2]) == b'\xff\xd8'
+            sequences.append(payload.info.sequence)
+            receiver.release(payload)
+
+    collector = asyncio.ensure_future(collect())
+    reply = None
+    try:
+        await loop.sock_sendall(sock, (hello_command(3) + '\n').encode('utf-8'))
+        await asyncio.wait_for(reader.read_handshake_async(), 5)
+        port = receiver.start(loop)
+        await loop.sock_sendall(sock, (tag_command(transport_command(port), 1) + '\n').encode('utf-8'))
+        while True:
+            try:
+                payload = await asyncio.wait_for(reader.read_frame_async(), 10)
+            except ConnectionAbortedError:
+                break
+            if payload.info.codec == CODEC_CONTROL:
+                reply = parse_reply(bytes(payload.view).decode('utf-8'))
+            else:
+                tcp_sequences.append(payload.info.sequence)
+            reader.release(payload)
+        # Телефон отправил все датаграммы до закрытия TCP; недособранный последний кадр
+        # выбрасывается по REASSEMBLY_TIMEOUT.
+        await asyncio.sleep(REASSEMBLY_TIMEOUT * 3)
+    finally:
+        receiver.close()
+        collector.cancel()
+        sock.close()
+    return reply, tcp_sequences, sequences, receiver
+
+
+@pytest.mark.parametrize('loss, reorder', [(0.0, 0.05), (0.03, 0.0), (0.03, 0.05)])
+def test_simulator_over_udp(start_simulator, loss, reorder):
+    simulator = start_simulator(resolution=(320, 240), fps=60, frames=120, seed=1,
+                                udp_loss=loss, udp_reorder=reorder)
+    reply, tcp_sequences, sequences, receiver = asyncio.run(_udp_session(simulator))
+    stats = receiver.stats()
+    assert reply == (True, 1, 'UDP')
+    assert sequences and sequences == sorted(set(sequences))
+    # Кадры до переключения шли по TCP, остальные - по UDP: каждый из них собран или выброшен.
+    assert tcp_sequences == list(range(len(tcp_sequences)))
+    udp_frames = 120 - len(tcp_sequences)
+    assert stats['frames'] + stats['incomplete_frames'] == udp_frames
+    assert stats['frames'] == len(sequences) and receiver.dropped == 0
+    # Каждая отправленная датаграмма принята, каждая потерянная учтена в недособранных кадрах.
+    assert stats['fragments'] == simulator.udp_sent
+    assert stats['lost_fragments'] == simulator.udp_lost
+    assert stats['missing_frames'] == 0 and stats['pending'] == 0
+    # Переставленные фрагменты приходят, пока кадр еще собирается, - не опоздавшие.
+    assert stats['late_fragments'] == stats['duplicates'] == stats['invalid'] == 0
+    if reorder:
+        assert simulator.udp_reordered > 0
+    if loss:
+        # Кадр с потерянным фрагментом выбрасывается, а следующие выводятся: пропуски в номерах.
+        assert simulator.udp_lost > 0 and stats['incomplete_frames'] > 0
+    else:
+        assert sequences == list(range(len(tcp_sequences), 120))
@@ -0,0 +1,201 @@
+"""
+Трассировка потока кадров и сэмплы cProfile - для разбора жалоб "видео тормозит".
+
+Tracer записывает интервалы (начало, длительность, поток) стадий каждого кадра: прием заголовка
+и данных, декодирование, преобразование, превью, cam.send, ожидание темпа - и события потока
+(разрыв связи, запрос ключевого кадра). Запись сохраняется в формате Chrome trace (JSON):
+файл открывается в ui.perfetto.dev или chrome://tracing, где на временной шкале по потокам
+видны задержки сети, простои, конкуренция за GIL и блокировки потока GUI.
+
+Трассировка выключена, пока трассировщика нет (tracer = None): в горячем пути остается только
+проверка атрибута. Включенная - одна запись кортежа в кольцевой буфер на интервал; разбор
+в JSON - только при сохранении.
+
+ProfileSampler раз в interval секунд на duration секунд включает cProfile в каждом потоке,
+который вызывает tick() (поток asyncio, декодирования, вывода), и сохраняет снимки .prof
+(смотреть: python -m pstats <файл> или snakeviz).
+"""
+import collections
+import cProfile
+import json
+import os
+import threading
+import time
+
+# Сколько последних интервалов хранит трассировщик (~80 интервалов на кадр: 30 к/с - около минуты).
+TRACE_MAX_EVENTS = 200000
+# Сэмплы cProfile: период и длительность, секунды.
+PROFILE_INTERVAL = 30.0
+PROFILE_DURATION = 2.0
+
+_SPAN = 'X'
+_INSTANT = 'i'
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'started')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ended = time.perf_counter()
+        self.tracer.complete(self.name, ended - self.started, ended, self.args)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(tracer, name, args=None):
+    """Контекстный менеджер интервала; при tracer = None ничего не записывает."""
+    return tracer.span(name, args) if tracer is not None else _NULL_SPAN
+
+
+class Tracer:
+    """
+    Кольцевой буфер интервалов и событий из любых потоков. complete() - интервал, который
+    только что закончился (время уже измерено - как у StreamMetrics.record), span() -
+    контекстный менеджер, instant() - мгновенное событие.
+    """
+
+    def __init__(self, max_events=TRACE_MAX_EVENTS):
+        # deque.append потокобезопасен: блокировка в горячем пути не нужна.
+        self._events = collections.deque(maxlen=max_events)
+        self._threads = {}
+        self._origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def _thread_id(self):
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        return tid
+
+    def complete(self, name, duration, end=None, args=None):
+        if end is None:
+            end = time.perf_counter()
+        self._events.append((_SPAN, name, end - duration, duration, self._thread_id(), args))
+
+    def span(self, name, args=None):
+        return _Span(self, name, args)
+
+    def instant(self, name, args=None):
+        self._events.append((_INSTANT, name, time.perf_counter(), 0.0, self._thread_id(), args))
+
+    def __len__(self):
+        return len(self._events)
+
+    def events(self):
+        """События в формате Chrome trace (время в микросекундах от создания трассировщика)."""
+        origin = self._origin
+        pid = self.pid
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in list(self._threads.items())]
+        for phase, name, started, duration, tid, args in list(self._events):
+            event = {'name': name, 'ph': phase, 'ts': (started - origin) * 1e6, 'pid': pid, 'tid': tid}
+            if phase == _SPAN:
+                event['dur'] = duration * 1e6
+            else:
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            events.append(event)
+        return events
+
+    def save(self, path):
+        """Сохраняет запись в JSON (Chrome trace); возвращает число событий."""
+        events = self.events()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+
+class ProfileSampler:
+    """
+    Сэмплы cProfile по окнам: окно k начинается через k * interval секунд после создания
+    и длится duration секунд. Поток, вызвавший tick() в окне, профилируется до его конца,
+    снимок сохраняется в directory/<имя потока>-<k>.prof. cProfile работает на уровне
+    потока, поэтому tick() вызывается из каждого интересного потока (достаточно раз в кадр).
+    """
+
+    def __init__(self, directory, interval=PROFILE_INTERVAL, duration=PROFILE_DURATION):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+        self.duration = min(duration, interval)
+        self.snapshots = 0
+        self._started = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Включенные профили: поток -> (профиль, окно) - чтобы сохранить их при close().
+        self._active = {}
+        self._closed = False
+
+    def tick(self):
+        local = self._local
+        profile = getattr(local, 'profile', None)
+        elapsed = time.perf_counter() - self._started
+        window = int(elapsed // self.interval)
+        in_window = elapsed - window * self.interval < self.duration
+        if profile is not None:
+            if not in_window or window != local.window:
+                self._finish(local)
+            return
+        if in_window and window != getattr(local, 'window', None) and not self._closed:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Python 3.12+: профилировщик может быть только один на процесс.
+                print(f"[!] cProfile в потоке '{threading.current_thread().name}' недоступен: {e}")
+                local.window = window
+                return
+            local.profile = profile
+            local.window = window
+            with self._lock:
+                self._active[threading.get_ident()] = (profile, window)
+
+    def _finish(self, local):
+        profile, local.profile = local.profile, None
+        profile.disable()
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        self._dump(profile, threading.current_thread().name, local.window)
+
+    def _dump(self, profile, thread_name, window):
+        safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in thread_name)
+        path = os.path.join(self.directory, f"{safe_name}-{window:03d}.prof")
+        try:
+            profile.dump_stats(path)
+        except Exception as e:
+            print(f"[!] Не удалось сохранить профиль {path}: {e}")
+            return
+        self.snapshots += 1
+        print(f"[*] Профиль сохранен: {path}")
+
+    def close(self):
+        """Сохраняет незаконченные сэмплы (тех потоков, что больше не вызывают tick())."""
+        self._closed = True
+        local = self._local
+        if getattr(local, 'profile', None) is not None:
+            self._finish(local)
+        with self._lock:
+            active, self._active = self._active, {}
+        for tid, (profile, window) in active.items():
+            thread = next((t for t in threading.enumerate() if t.ident == tid), None)
+            self._dump(profile, thread.name if thread else str(tid), window)
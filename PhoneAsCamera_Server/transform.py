@@ -0,0 +1,219 @@
+"""
+Преобразование кадров перед выводом в вирт. камеру: обрезка, поворот, зеркало и
+приведение к постоянному размеру камеры.
+
+Камера открывается один раз, а телефон может сменить разрешение или ориентацию
+(фронтальная/основная камера, CMD:MAX_RES). FrameTransform приводит каждый кадр
+к размеру камеры с сохранением пропорций ('fit' - с черными полями, 'fill' -
+с обрезкой краев) или растягиванием ('stretch').
+
+Для каждого сочетания "размер кадра -> размер камеры" план строится один раз:
+обрезка - срез массива без копирования, затем cv2.resize и/или cv2.rotate/flip/transpose
+с dst= прямо в заранее выделенный буфер (для NV12 - отдельно плоскости Y и UV).
+Обычно это один проход по кадру, с поворотом и масштабированием - два, и без
+новых выделений памяти. Таблицы cv2.remap сделали бы все за один проход, но при
+повороте читают кадр по столбцам и на слабом CPU в 3-4 раза медленнее.
+Кадр нужного размера без поворота и обрезки возвращается как есть.
+"""
+import cv2
+import numpy as np
+
+from buffer_pool import FramePool, acquire
+from decoders import frame_size
+
+ROTATIONS = (0, 90, 180, 270)
+SCALE_MODES = ('fit', 'fill', 'stretch')
+# Цвет полей: черный для BGR/RGB и для NV12 (Y=16, U=V=128).
+BORDER_BGR = 0
+BORDER_Y = 16
+BORDER_UV = 128
+
+# Поворот по часовой стрелке и зеркало -> операции над уменьшенным кадром.
+_ORIENTATION_OPS = {
+    (0, False): (),
+    (0, True): (('flip', 1),),
+    (90, False): (('rotate', cv2.ROTATE_90_CLOCKWISE),),
+    (90, True): (('transpose', None),),
+    (180, False): (('flip', -1),),
+    (180, True): (('flip', 0),),
+    (270, False): (('rotate', cv2.ROTATE_90_COUNTERCLOCKWISE),),
+    (270, True): (('transpose', None), ('flip', -1)),
+}
+
+
+def _even(value):
+    return int(value) // 2 * 2
+
+
+def _even_size(value):
+    return max(2, _even(value))
+
+
+def _orient(ops, src, dst):
+    """Выполняет операции поворота/отражения из src в dst (вторая - на месте в dst)."""
+    for name, code in ops:
+        if name == 'flip':
+            cv2.flip(src, code, dst=dst)
+        elif name == 'rotate':
+            cv2.rotate(src, code, dst=dst)
+        else:
+            cv2.transpose(src, dst=dst)
+        src = dst
+
+
+class FrameTransform:
+    """
+    rotation   - поворот по часовой стрелке (0/90/180/270);
+    mirror     - зеркальное отражение по горизонтали (после поворота);
+    crop       - (x, y, ширина, высота) в долях кадра с телефона или None;
+    scale_mode - 'fit', 'fill' или 'stretch';
+    buffers    - сколько выходных буферов используется по кругу: кадр, который вернул
+                 apply(), остается неизменным, пока не преобразованы следующие buffers - 1 кадров.
+    apply() вызывается из одного потока (стадии вывода).
+    """
+
+    def __init__(self, rotation=0, mirror=False, crop=None, scale_mode='fit', buffers=4):
+        if rotation not in ROTATIONS:
+            raise ValueError(f"Поворот должен быть одним из {ROTATIONS}, получено {rotation}")
+        if scale_mode not in SCALE_MODES:
+            raise ValueError(f"Неизвестный режим масштабирования: {scale_mode}")
+        if crop is not None:
+            x, y, width, height = crop
+            if not (0 <= x < 1 and 0 <= y < 1 and 0 < width <= 1 - x and 0 < height <= 1 - y):
+                raise ValueError(f"Обрезка должна быть внутри кадра (доли 0..1), получено {crop}")
+        self.rotation = rotation
+        self.mirror = mirror
+        self.crop = tuple(crop) if crop is not None else None
+        self.scale_mode = scale_mode
+        self.buffers = max(2, buffers)
+        self._ops = _ORIENTATION_OPS[(rotation, bool(mirror))]
+        self._plans = {}
+        self.pool = FramePool(self.buffers)
+
+    @property
+    def turned(self):
+        return self.rotation in (90, 270)
+
+    def output_size(self, width, height):
+        """Размер кадра width x height после обрезки и поворота (четный - для NV12)."""
+        if self.crop:
+            width, height = width * self.crop[2], height * self.crop[3]
+        if self.turned:
+            width, height = height, width
+        return _even_size(width), _even_size(height)
+
+    def source_size(self, output_size):
+        """
+        Наименьший размер кадра с телефона, который после обрезки и поворота не меньше
+        output_size - до него декодер может уменьшать кадр прямо при декодировании.
+        """
+        width, height = output_size
+        if self.turned:
+            width, height = height, width
+        if self.crop:
+            width, height = width / self.crop[2], height / self.crop[3]
+        return int(np.ceil(width)), int(np.ceil(height))
+
+    def apply(self, frame, width, height):
+        """Кадр BGR/RGB или NV12 -> кадр width x height в том же формате."""
+        src_width, src_height = frame_size(frame)
+        key = (src_width, src_height, frame.ndim, width, height)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = self._plan(src_width, src_height, frame.ndim == 2, width, height)
+        if plan is None:
+            return frame
+        dst = self._next_buffer(frame, width, height)
+        plan(frame, dst)
+        return dst
+
+    def _next_buffer(self, frame, width, height):
+        shape = (height * 3 // 2, width) if frame.ndim == 2 else (height, width, frame.shape[2])
+        return acquire(self.pool, shape)
+
+    def _geometry(self, src_width, src_height, width, height):
+        """
+        Геометрия для размеров полного кадра: область исходного кадра (x, y, w, h) и
+        область результата (x, y, w, h), куда она попадает. Все значения четные (для NV12).
+        """
+        crop_x, crop_y, crop_width, crop_height = self.crop or (0.0, 0.0, 1.0, 1.0)
+        src_x, src_w = crop_x * src_width, crop_width * src_width
+        src_y, src_h = crop_y * src_height, crop_height * src_height
+        # Размер обрезанного кадра после поворота.
+        oriented_w, oriented_h = (src_h, src_w) if self.turned else (src_w, src_h)
+
+        out_w, out_h = width, height
+        if self.scale_mode == 'fit':
+            scale = min(width / oriented_w, height / oriented_h)
+            out_w = min(width, _even_size(oriented_w * scale + 1))
+            out_h = min(height, _even_size(oriented_h * scale + 1))
+        elif self.scale_mode == 'fill':
+            # Видимая часть повернутого кадра с пропорциями результата, по центру.
+            scale = max(width / oriented_w, height / oriented_h)
+            visible_w, visible_h = width / scale, height / scale
+            if self.turned:
+                visible_w, visible_h = visible_h, visible_w
+            src_x += (src_w - visible_w) / 2
+            src_y += (src_h - visible_h) / 2
+            src_w, src_h = visible_w, visible_h
+        source = (_even(src_x), _even(src_y), _even_size(src_w), _even_size(src_h))
+        target = (_even((width - out_w) / 2), _even((height - out_h) / 2), out_w, out_h)
+        return source, target
+
+    def _plan(self, src_width, src_height, nv12, width, height):
+        """Функция plan(frame, dst) для одного сочетания размеров или None (кадр не меняется)."""
+        source, target = self._geometry(src_width, src_height, width, height)
+        if not self._ops and source == (0, 0, src_width, src_height) and target == (0, 0, width, height) \
+                and (src_width, src_height) == (width, height):
+            return None
+        if not nv12:
+            plane = self._plane_plan(source, target, width, height, BORDER_BGR)
+
+            def transform(frame, dst):
+                plane(frame, dst)
+            return transform
+
+        half = lambda rect: tuple(value // 2 for value in rect)
+        y_plane = self._plane_plan(source, target, width, height, BORDER_Y)
+        uv_plane = self._plane_plan(half(source), half(target), width // 2, height // 2, BORDER_UV)
+
+        def transform_nv12(frame, dst):
+            y_plane(frame[:src_height], dst[:height])
+            uv_plane(frame[src_height:].reshape(src_height // 2, src_width // 2, 2),
+                     dst[height:].reshape(height // 2, width // 2, 2))
+        return transform_nv12
+
+    def _plane_plan(self, source, target, width, height, border):
+        """План для одной плоскости: срез, масштабирование и поворот в область target буфера."""
+        src_x, src_y, src_w, src_h = source
+        out_x, out_y, out_w, out_h = target
+        ops = self._ops
+        # Размер до поворота: поворот на 90/270 меняет ширину и высоту местами.
+        resized_w, resized_h = (out_h, out_w) if self.turned else (out_w, out_h)
+        interpolation = cv2.INTER_AREA if resized_w < src_w else cv2.INTER_LINEAR
+        needs_resize = (src_w, src_h) != (resized_w, resized_h)
+        scratch = {}
+        bars = (out_x, out_y, out_w, out_h) != (0, 0, width, height)
+
+        def plan(frame, dst):
+            view = frame[src_y:src_y + src_h, src_x:src_x + src_w]
+            content = dst[out_y:out_y + out_h, out_x:out_x + out_w]
+            if bars:
+                dst[:out_y] = border
+                dst[out_y + out_h:] = border
+                dst[out_y:out_y + out_h, :out_x] = border
+                dst[out_y:out_y + out_h, out_x + out_w:] = border
+            if not ops:
+                if needs_resize:
+                    cv2.resize(view, (out_w, out_h), dst=content, interpolation=interpolation)
+                else:
+                    np.copyto(content, view)
+                return
+            if needs_resize:
+                resized = scratch.get('resized')
+                if resized is None:
+                    resized = scratch['resized'] = np.empty((resized_h, resized_w) + frame.shape[2:], np.uint8)
+                cv2.resize(view, (resized_w, resized_h), dst=resized, interpolation=interpolation)
+                view = resized
+            _orient(ops, view, content)
+        return plan
@@ -0,0 +1,331 @@
+"""
+Прием кадров по UDP (Wi-Fi): сборка фрагментов в кадры с допуском потерь (см. protocol.py).
+
+По TCP один потерянный пакет Wi-Fi задерживает все следующие кадры, пока его не перешлют;
+по UDP потерянный фрагмент стоит только своего кадра. FrameAssembler собирает фрагменты
+прямо в буфер кадра из пула (buffer_pool.BufferPool - того же, что у FrameReader) и отдает
+кадры строго по возрастанию номера: недособранный кадр выбрасывается, как только собран
+более новый, истек REASSEMBLY_TIMEOUT или недособранных кадров больше MAX_PENDING_FRAMES,
+а фрагменты уже закрытых кадров (опоздавшие) не принимаются.
+
+UdpFrameReceiver читает датаграммы в отдельном потоке (recv_into в один буфер, без выделений
+на датаграмму) и передает собранные кадры в цикл asyncio - для конвейера он выглядит как
+FrameReader (read_frame_async, release). Кадры, которые телефон успел отправить по TCP
+до переключения (или после отказа от UDP), подкладываются через put().
+"""
+import asyncio
+import socket
+import threading
+import time
+
+from frame_reader import MAX_FRAME_SIZE, FramePayload
+from protocol import CODEC_CONTROL, FRAGMENT_HEADER, FRAGMENT_MAGIC, FRAME_HEADER_V2, FrameInfo
+
+# Сколько ждать недостающие фрагменты кадра с прихода первого, секунды: дольше кадр все равно
+# опоздал бы (по Wi-Fi кадр 720p JPEG передается за 10-40 мс).
+REASSEMBLY_TIMEOUT = 0.1
+# Сколько кадров собирается одновременно (фрагменты соседних кадров могут перемешаться).
+MAX_PENDING_FRAMES = 4
+# Сколько собранных кадров ждут конвейер; при переполнении выбрасывается самый старый.
+MAX_READY_FRAMES = 4
+# Буфер приема сокета (SO_RCVBUF): несколько кадров 1080p JPEG, пока поток приема ждет GIL.
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+# Таймаут recv в потоке приема, секунды: как часто проверяются истекшие кадры и остановка.
+POLL_INTERVAL = 0.02
+
+_SEQUENCE_MASK = 0xFFFFFFFF
+_HALF_RANGE = 0x80000000
+
+
+class _Partial:
+    """
+    Кадр в сборке: буфер из пула и отметки принятых фрагментов. fragment_size - длина всех
+    фрагментов, кроме последнего (известна по первому принятому фрагменту).
+    """
+    __slots__ = ('buffer', 'view', 'size', 'count', 'received', 'remaining', 'started', 'fragment_size')
+
+    def __init__(self, buffer, size, count, started):
+        self.buffer = buffer
+        self.view = memoryview(buffer)[:size]
+        self.size = size
+        self.count = count
+        self.received = bytearray(count)
+        self.remaining = count
+        self.started = started
+        self.fragment_size = None
+
+    def fits(self, offset, index, length):
+        """
+        Лежит ли фрагмент на своем месте: фрагменты одной длины идут встык по номерам,
+        последний заканчивается ровно на конце сообщения. Так принятые count фрагментов
+        покрывают сообщение целиком, без дыр со старыми данными переиспользуемого буфера.
+        """
+        fragment_size = self.fragment_size
+        if fragment_size is None:
+            if index < self.count - 1:
+                fragment_size = length
+            elif index:
+                fragment_size, remainder = divmod(offset, index)
+                if remainder:
+                    return False
+            else:
+                fragment_size = self.size
+            if not fragment_size or not (self.count - 1) * fragment_size < self.size <= self.count * fragment_size:
+                return False
+        if offset != index * fragment_size:
+            return False
+        if index < self.count - 1:
+            if length != fragment_size:
+                return False
+        elif offset + length != self.size:
+            return False
+        self.fragment_size = fragment_size
+        return True
+
+
+class FrameAssembler:
+    """
+    Сборка сообщений из фрагментов (не потокобезопасна - работает в потоке приема).
+    add() возвращает собранный _Partial (буфер нужно вернуть в пул после использования)
+    или None. Номера сообщений сравниваются по модулю 2^32.
+
+    Счетчики: fragments - принятые фрагменты, duplicates - повторы, late_fragments - фрагменты
+    уже закрытых кадров, invalid - некорректные заголовки и фрагменты не на своем месте,
+    frames - собранные кадры, incomplete_frames - выброшенные недособранные, missing_frames -
+    номера, от которых не пришло ни одного фрагмента, lost_fragments - недостающие фрагменты
+    выброшенных кадров.
+    """
+
+    def __init__(self, pool, timeout=REASSEMBLY_TIMEOUT, max_pending=MAX_PENDING_FRAMES,
+                 max_frame_size=MAX_FRAME_SIZE):
+        self.pool = pool
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.max_frame_size = max_frame_size
+        self._pending = {}
+        # Последний закрытый номер (собран или выброшен): все номера не новее него закрыты.
+        self._closed = None
+        self.fragments = 0
+        self.duplicates = 0
+        self.late_fragments = 0
+        self.invalid = 0
+        self.frames = 0
+        self.incomplete_frames = 0
+        self.missing_frames = 0
+        self.lost_fragments = 0
+
+    def _distance(self, sequence):
+        return (sequence - self._closed) & _SEQUENCE_MASK
+
+    def add(self, sequence, offset, size, index, count, data, now):
+        if not (0 < size <= self.max_frame_size and index < count and offset + len(data) <= size):
+            self.invalid += 1
+            return None
+        if self._closed is None:
+            self._closed = (sequence - 1) & _SEQUENCE_MASK
+        if not 0 < self._distance(sequence) < _HALF_RANGE:
+            self.late_fragments += 1
+            return None
+        partial = self._pending.get(sequence)
+        if partial is None:
+            if len(self._pending) >= self.max_pending:
+                self._close_through(min(self._pending, key=self._distance))
+                if not 0 < self._distance(sequence) < _HALF_RANGE:
+                    self.late_fragments += 1
+                    return None
+            partial = self._pending[sequence] = _Partial(self.pool.acquire(size), size, count, now)
+        elif partial.size != size or partial.count != count:
+            self.invalid += 1
+            return None
+        if partial.received[index]:
+            self.duplicates += 1
+            return None
+        if not partial.fits(offset, index, len(data)):
+            self.invalid += 1
+            return None
+        partial.view[offset:offset + len(data)] = data
+        partial.received[index] = 1
+        partial.remaining -= 1
+        self.fragments += 1
+        if partial.remaining:
+            return None
+        del self._pending[sequence]
+        self.frames += 1
+        self._close_through(sequence, completed=True)
+        return partial
+
+    def _close_through(self, sequence, completed=False):
+        """Закрывает номера до sequence включительно: недособранные кадры среди них выбрасываются."""
+        limit = self._distance(sequence)
+        stale = [seq for seq in self._pending if self._distance(seq) <= limit]
+        for seq in stale:
+            partial = self._pending.pop(seq)
+            self.incomplete_frames += 1
+            self.lost_fragments += partial.remaining
+            self.pool.release(partial.buffer)
+        self.missing_frames += limit - len(stale) - (1 if completed else 0)
+        self._closed = sequence
+
+    def expire(self, now):
+        """Выбрасывает кадры, которые собираются дольше timeout (и все более старые)."""
+        expired = [seq for seq, partial in self._pending.items() if now - partial.started > self.timeout]
+        if expired:
+            self._close_through(max(expired, key=self._distance))
+
+    def clear(self):
+        for partial in self._pending.values():
+            self.pool.release(partial.buffer)
+        self._pending.clear()
+
+    def stats(self):
+        return {'fragments': self.fragments, 'duplicates': self.duplicates,
+                'late_fragments': self.late_fragments, 'invalid': self.invalid,
+                'frames': self.frames, 'incomplete_frames': self.incomplete_frames,
+                'missing_frames': self.missing_frames, 'lost_fragments': self.lost_fragments,
+                'pending': len(self._pending)}
+
+
+class UdpFrameReceiver:
+    """
+    Источник кадров транспорта UDP для конвейера движка. start() открывает порт (port = 0 -
+    любой свободный) и возвращает его номер для команды телефону. Принимаются только датаграммы
+    с адреса peer (адрес телефона из TCP-соединения), если он задан.
+
+    pool - пул буферов FrameReader этого соединения: кадры обоих транспортов возвращаются
+    в него одним FrameReader.release(). Если передан metrics, для каждого кадра записываются
+    время сборки (стадия payload_recv - от первого фрагмента до последнего) и размер.
+    """
+
+    def __init__(self, pool, host='', port=0, peer=None, metrics=None, timeout=REASSEMBLY_TIMEOUT,
+                 max_ready=MAX_READY_FRAMES):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.peer = peer
+        self.metrics = metrics
+        self.assembler = FrameAssembler(pool, timeout)
+        self.dropped = 0
+        self.foreign = 0
+        self._sock = None
+        self._thread = None
+        self._running = False
+        self._loop = None
+        self._ready = asyncio.Queue(max_ready)
+
+    def start(self, loop, family=socket.AF_INET):
+        self._loop = loop
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+            sock.bind((self.host, self.port))
+            sock.settimeout(POLL_INTERVAL)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self.port = sock.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, name='udp-receive', daemon=True)
+        self._thread.start()
+        return self.port
+
+    def _receive_loop(self):
+        sock = self._sock
+        assembler = self.assembler
+        header_size = FRAGMENT_HEADER.size
+        # Датаграмма UDP не длиннее 64 КБ.
+        datagram = bytearray(65536)
+        view = memoryview(datagram)
+        while self._running:
+            try:
+                count, address = sock.recvfrom_into(datagram)
+            except socket.timeout:
+                assembler.expire(time.perf_counter())
+                continue
+            except OSError:
+                break
+            now = time.perf_counter()
+            if self.peer is not None and address[0] != self.peer:
+                self.foreign += 1
+                continue
+            if count < header_size or datagram[:2] != FRAGMENT_MAGIC:
+                assembler.invalid += 1
+                continue
+            _, sequence, offset, size, index, fragments = FRAGMENT_HEADER.unpack_from(datagram)
+            partial = assembler.add(sequence, offset, size, index, fragments, view[header_size:count], now)
+            if partial is None:
+                assembler.expire(now)
+                continue
+            payload = self._parse(partial)
+            if payload is None:
+                continue
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, payload, now - partial.started)
+            except RuntimeError:
+                # Цикл asyncio уже закрыт.
+                self.pool.release(partial.buffer)
+                break
+        assembler.clear()
+
+    def _parse(self, partial):
+        """Собранное сообщение -> FramePayload (заголовок v2 + данные) или None, если заголовок неверный."""
+        size = partial.size
+        if size >= FRAME_HEADER_V2.size:
+            header_size, data_size, sequence, capture_us, codec, camera_id, width, height = \
+                FRAME_HEADER_V2.unpack_from(partial.buffer)
+            if FRAME_HEADER_V2.size <= header_size and header_size + data_size == size and data_size \
+                    and codec != CODEC_CONTROL:
+                info = FrameInfo(sequence, capture_us, codec, camera_id, width, height)
+                return FramePayload(partial.view[header_size:], partial.buffer, info)
+        self.assembler.invalid += 1
+        self.pool.release(partial.buffer)
+        return None
+
+    def _deliver(self, payload, assembly_time):
+        """В цикле asyncio: кадр в очередь конвейера."""
+        if self.metrics:
+            self.metrics.record('payload_recv', assembly_time, frame=payload.info.sequence)
+            self.metrics.frame_received(len(payload))
+        self.put(payload)
+
+    def put(self, payload):
+        """Кадр в очередь (в цикле asyncio); при переполнении выбрасывается самый старый."""
+        if self._ready.full():
+            self.release(self._ready.get_nowait())
+            self.dropped += 1
+        self._ready.put_nowait(payload)
+
+    async def read_frame_async(self):
+        return await self._ready.get()
+
+    def release(self, payload):
+        if payload is None or payload.buffer is None:
+            return
+        buffer = payload.buffer
+        payload.buffer = None
+        self.pool.release(buffer)
+
+    @property
+    def active(self):
+        return self._sock is not None
+
+    def close(self):
+        """Закрывает порт UDP; очередь продолжает принимать кадры TCP (put)."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def clear(self):
+        """Возвращает в пул кадры, которые так и не забрал конвейер."""
+        while not self._ready.empty():
+            self.release(self._ready.get_nowait())
+
+    def stats(self):
+        stats = self.assembler.stats()
+        stats.update({'port': self.port, 'active': self.active, 'dropped': self.dropped,
+                      'foreign': self.foreign})
+        return stats
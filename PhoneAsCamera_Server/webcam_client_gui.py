@@ -1,291 +1,100 @@
 import sys
 import time
-import socket
-import struct
+
+# Отсчет времени до появления окна (цель WINDOW_TARGET_MS) - до импорта Qt.
+STARTED = time.perf_counter()
+
+import asyncio
+import functools
 import threading
-import queue
-import traceback
-import os
-import subprocess
-
-import cv2
-import numpy as np
-import pyvirtualcam
+
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QLineEdit, QRadioButton, QGroupBox, QMessageBox,
-    QSizePolicy, QFrame
+    QSizePolicy, QFrame, QCheckBox
 )
-from PySide6.QtCore import Qt, QThread, Signal, Slot
+from PySide6.QtCore import Qt, QThread, Signal, Slot, QTimer, QEvent
 from PySide6.QtGui import QPalette, QColor, QImage, QPixmap
 
-TARGET_FPS = 30
-PORT = 8888
+from adb_tools import AdbPreflight, track_devices
+from tracing import span
+# Движок (stream_engine: cv2, numpy, pyvirtualcam, PyAV), превью и метрики импортируются не здесь,
+# а в фоне после открытия окна (см. WebcamClientGUI._load_engine) или при первом обращении.
 
-script_dir = os.path.dirname(os.path.abspath(__file__))
-ADB_FOLDER = os.path.join(script_dir, 'adb_files')
-ADB_PATH = os.path.join(ADB_FOLDER, 'adb.exe')
+# Ограничение частоты обновления превью в GUI (кадров в секунду).
+PREVIEW_FPS = 10
+# Порт локального HTTP-эндпоинта со статистикой (http://127.0.0.1:<порт>/stats); None - выключен.
+STATS_HTTP_PORT = None
+# Цели по времени (мс): окно - от запуска скрипта до первого цикла событий Qt, первый кадр -
+# от нажатия "Подключиться" до запуска вирт. камеры по первому кадру. Замеры выводятся в консоль.
+WINDOW_TARGET_MS = 1000
+FIRST_FRAME_TARGET_MS = 1500
 
-def run_adb_command(args):
-    """
-    Выполняет команду ADB из папки adb_files.
-    Возвращает кортеж: (success: bool, stdout: str, stderr: str)
-    """
-    if not os.path.exists(ADB_PATH):
-        return False, "", f"Ошибка: Файл adb.exe не найден по пути '{ADB_PATH}'"
-
-    command = [ADB_PATH] + args
-    print(f"[*] Выполнение ADB: {' '.join(command)}")
-
-    try:
-        startupinfo = None
-        if sys.platform == "win32":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        process = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=False,
-            startupinfo=startupinfo
-        )
-
-        print(f"    Код возврата: {process.returncode}")
-        if process.stdout: 
-            print(f"    Stdout: {process.stdout.strip()}")
-        if process.stderr: 
-            print(f"    Stderr: {process.stderr.strip()}")
-
-        success = process.returncode == 0
-        is_daemon_msg = "daemon started successfully" in process.stderr.lower()
-        if is_daemon_msg and not process.stdout.strip():
-             print("[*] ADB демон только что стартовал, ждем секунду...")
-             time.sleep(1)
-             return run_adb_command(args)
-
-        if args == ['devices']:
-            success = success and process.stdout.strip() != ""
-        elif "error" in process.stderr.lower() and not is_daemon_msg:
-             success = False
-
-
-        return success, process.stdout.strip(), process.stderr.strip()
-
-    except FileNotFoundError:
-        return False, "", f"Ошибка: Команда '{ADB_PATH}' не найдена. Убедитесь, что ADB находится в папке adb_files."
-    except Exception as e:
-        return False, "", f"Неожиданная ошибка при выполнении ADB: {e}"
+
+def report_time(what, elapsed_ms, target_ms):
+    """Печатает замер времени и сравнение с целью."""
+    marker = "[*]" if elapsed_ms <= target_ms else "[!]"
+    print(f"{marker} {what}: {elapsed_ms:.0f} мс (цель - не более {target_ms} мс)")
 
 class WebcamWorker(QThread):
     """
-    Рабочий поток для обработки сетевого соединения, получения кадров
-    и отправки их в виртуальную камеру.
+    Поток Qt, в котором работает StreamEngine (asyncio).
+    События движка превращаются в сигналы для GUI.
     """
     status_update = Signal(str)
     connection_successful = Signal(str)
     connection_failed = Signal(str)
     disconnected = Signal()
-    frame_update = Signal(np.ndarray)
+    stats_update = Signal(dict)
 
-    def __init__(self, host, port, target_fps):
+    def __init__(self, host, port, config=None, preview=None, prepare_connection=None):
         super().__init__()
-        self.host = host
-        self.port = port
-        self.target_fps = target_fps
-        self.running = False
-        self.client_socket = None
-        self.cam = None
-        self.command_queue = queue.Queue()
-
-    def send_command_to_phone(self, command):
-        """Безопасно добавляет команду в очередь для отправки."""
-        self.command_queue.put(command)
-
-    def _send_command_internal(self, command):
-        """Внутренний метод для отправки команды из потока."""
-        if not self.client_socket:
-            self.status_update.emit("Ошибка: Нет соединения для отправки команды")
-            return
-        try:
-            if not command.endswith('\n'):
-                command += '\n'
-            self.client_socket.sendall(command.encode('utf-8'))
-            self.status_update.emit(f"Команда отправлена: {command.strip()}")
-        except socket.error as e:
-            self.status_update.emit(f"Ошибка отправки команды: {e}")
-            self.running = False
-        except Exception as e:
-            self.status_update.emit(f"Неизвестная ошибка отправки: {e}")
-            self.running = False
+        from stream_engine import StreamEngine
+        self.engine = StreamEngine(host, port, config, listener=self, preview=preview,
+                                   prepare_connection=prepare_connection)
 
     def run(self):
-        """Основная функция потока."""
-        self.running = True
-        first_frame = True
-        frame_height, frame_width = 0, 0
+        """Основная функция потока: цикл asyncio с сессией движка."""
+        asyncio.run(self.engine.run())
 
-        try:
-            self.status_update.emit(f"Подключение к {self.host}:{self.port}...")
-            self.client_socket = socket.create_connection((self.host, self.port), timeout=10)
-            self.status_update.emit("Подключено!")
-
-            while self.running:
-                try:
-                    command = self.command_queue.get_nowait()
-                    if command == "STOP":
-                         self.running = False
-                         self.status_update.emit("Остановка по команде GUI...")
-                         break
-                    elif command == "CMD:SWITCH_CAM":
-                         self._send_command_internal(command)
-                except queue.Empty:
-                    pass
-
-                try:
-                    packed_msg_size = self._receive_all_internal(4)
-                    if not packed_msg_size: break
-                except ConnectionAbortedError as e:
-                    self.status_update.emit(f"Соединение разорвано (размер): {e}")
-                    break
-                except socket.timeout:
-                    self.status_update.emit("Таймаут ожидания размера кадра.")
-                    break
-                except Exception as e:
-                     self.status_update.emit(f"Ошибка чтения размера: {e}")
-                     break
-
-                msg_size = struct.unpack('>I', packed_msg_size)[0]
-                if msg_size == 0:
-                    self.status_update.emit("Сервер прислал нулевой размер.")
-                    break
-
-                try:
-                    jpeg_data = self._receive_all_internal(msg_size)
-                    if not jpeg_data: break
-                except ConnectionAbortedError as e:
-                    self.status_update.emit(f"Соединение разорвано (данные): {e}")
-                    break
-                except socket.timeout:
-                    self.status_update.emit("Таймаут ожидания данных кадра.")
-                    break
-                except Exception as e:
-                     self.status_update.emit(f"Ошибка чтения данных ({msg_size} байт): {e}")
-                     break
-
-                frame = cv2.imdecode(np.frombuffer(jpeg_data, dtype=np.uint8), cv2.IMREAD_COLOR)
-                if frame is None:
-                    self.status_update.emit("Ошибка декодирования кадра.")
-                    continue
-
-                try:
-                    if self.running:
-                        self.frame_update.emit(frame.copy())
-                except Exception as emit_err:
-                     print(f"[!] Ошибка при отправке сигнала frame_update: {emit_err}")
-
-                if first_frame:
-                    frame_height, frame_width, _ = frame.shape
-                    self.status_update.emit(f"Первый кадр: {frame_width}x{frame_height}. Запуск вирт. камеры...")
-                    try:
-                        self.cam = pyvirtualcam.Camera(width=frame_width, height=frame_height, fps=self.target_fps,
-                                                  backend='obs', fmt=pyvirtualcam.PixelFormat.RGB)
-                        self.connection_successful.emit(f"{self.cam.device} ({self.cam.width}x{self.cam.height} @ {self.cam.fps}fps)")
-                        first_frame = False
-                    except Exception as e_cam:
-                        self.status_update.emit(f"КРИТИЧЕСКАЯ ОШИБКА: Не удалось запустить вирт. камеру: {e_cam}")
-                        self.connection_failed.emit(f"Ошибка вирт. камеры: {e_cam}")
-                        self.running = False
-                        break
-
-                if self.cam and self.running:
-                    try:
-                        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                        self.cam.send(frame_rgb)
-                        self.cam.sleep_until_next_frame()
-                    except Exception as send_err:
-                        if self.running:
-                            self.status_update.emit(f"Ошибка отправки в вирт. камеру: {send_err}")
-                            self.running = False
-                        break
-                elif not self.cam and not first_frame:
-                     self.status_update.emit("Внутренняя ошибка: Камера не инициализирована.")
-                     self.running = False
-                     break
-
-        except socket.timeout:
-            if self.running:
-                self.connection_failed.emit("Не удалось подключиться (таймаут).")
-        except ConnectionRefusedError:
-             if self.running:
-                 self.connection_failed.emit("Connection refused. Проверьте сервер/adb forward.")
-        except socket.error as e:
-             if self.running:
-                  self.connection_failed.emit(f"Ошибка сокета: {e}")
-        except Exception as e:
-            if self.running:
-                err_msg = f"Непредвиденная ошибка в потоке: {e}\n{traceback.format_exc()}"
-                print(f"[!] {err_msg}")
-                self.connection_failed.emit(f"Ошибка в потоке: {e}")
-        finally:
-             self.cleanup()
-
-    def _receive_all_internal(self, count):
-        """Внутренний метод для надежного получения данных."""
-        buf = b''
-        if not self.client_socket:
-             raise ConnectionAbortedError("Сокет не инициализирован")
-        while len(buf) < count and self.running:
-            try:
-                chunk = self.client_socket.recv(count - len(buf))
-                if not chunk:
-                    raise ConnectionAbortedError("Сокет закрыт удаленно")
-                buf += chunk
-            except socket.timeout:
-                 raise socket.timeout("Таймаут операции чтения сокета")
-            except OSError as e:
-                 if self.running:
-                      raise ConnectionAbortedError(f"Ошибка сокета при чтении: {e}")
-                 else:
-                      break
-        if not self.running and len(buf) < count:
-             raise ConnectionAbortedError("Операция прервана")
-        return buf
+    def send_command_to_phone(self, command):
+        """Безопасно ставит команду в очередь отправки."""
+        self.engine.send_command(command)
 
     def stop(self):
         """Метод для запроса остановки потока извне."""
-        if self.running:
-            self.status_update.emit("Запрос на остановку...")
-            self.command_queue.put("STOP")
-        else:
-             print("[*] Поток уже остановлен или не запущен.")
-
-
-    def cleanup(self):
-         """Освобождает ресурсы."""
-         was_running = self.running
-         self.running = False
-         if self.client_socket:
-             print("[*] Закрытие сокета клиента...")
-             try:
-                 self.client_socket.shutdown(socket.SHUT_RDWR)
-             except (OSError, socket.error): pass
-             finally:
-                self.client_socket.close()
-                self.client_socket = None
-         if self.cam:
-             print("[*] Остановка виртуальной камеры...")
-             self.cam.close()
-             self.cam = None
-         if was_running:
-              self.status_update.emit("Отключено")
-              self.disconnected.emit()
-         print("[*] Ресурсы потока очищены.")
+        self.engine.stop()
+
+    # События StreamEngine (вызываются из потоков движка).
+    def on_status(self, message):
+        self.status_update.emit(message)
+
+    def on_connected(self, device_info):
+        self.connection_successful.emit(device_info)
+
+    def on_failed(self, message):
+        self.connection_failed.emit(message)
+
+    def on_disconnected(self):
+        self.disconnected.emit()
+
+    def on_stats(self, stats):
+        self.stats_update.emit(stats)
+
+    def on_command_result(self, command, ok, detail, rtt):
+        # Отказ и таймаут движок уже сообщил через on_status; молча теряются только команды,
+        # ответ на которые не пришел до разрыва связи.
+        if not ok and detail == 'disconnected':
+            self.status_update.emit(f"Команда {command} не выполнена: связь с телефоном потеряна")
 
 class WebcamClientGUI(QMainWindow):
+    # Список устройств ADB изменился (из потока отслеживания adb_client.DeviceTracker).
+    devices_changed = Signal(dict)
+    # Движок загружен в фоне (аргумент - доступен ли H.264).
+    engine_loaded = Signal(bool)
+    # Фоновая подготовка подключения закончена: (заголовок, текст) ошибки или две пустые строки.
+    connection_prepared = Signal(str, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Телефон как Веб-камера (Клиент)")
@@ -293,10 +102,42 @@ class WebcamClientGUI(QMainWindow):
 
         self.worker_thread = None
         self.is_connected = False
+        # Превью (cv2) создается при первом подключении.
+        self.preview = None
+        self.pixel_format = None
+        self.engine_ready = False
+        self.h264_supported = False
+        # Режим и адрес подключения, которое готовится в фоне, и время нажатия "Подключиться".
+        self.pending_connection = None
+        self.connect_started = None
+        self.adb_preflight = AdbPreflight()
 
         self.initUI()
         self.applyStyles()
 
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setInterval(int(1000 / PREVIEW_FPS))
+        self.preview_timer.timeout.connect(self.refresh_preview)
+
+        self.devices_changed.connect(self.on_devices_changed)
+        track_devices(self.devices_changed.emit)
+        self.engine_loaded.connect(self.on_engine_loaded)
+        self.connection_prepared.connect(self.on_connection_prepared)
+        # Медленное - в фоне, пока открывается окно: проверка ADB (запуск сервера, устройства)
+        # и загрузка движка со стартовым бенчмарком декодеров.
+        self.adb_preflight.start()
+        threading.Thread(target=self._load_engine, name='engine-loader', daemon=True).start()
+
+        self.stats_server = None
+        if STATS_HTTP_PORT is not None:
+            from metrics import StatsServer
+            self.stats_server = StatsServer(self.current_stats, STATS_HTTP_PORT)
+            try:
+                self.stats_server.start()
+            except OSError as e:
+                print(f"[!] Не удалось запустить HTTP-эндпоинт статистики: {e}")
+                self.stats_server = None
+
     def initUI(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -323,6 +164,25 @@ class WebcamClientGUI(QMainWindow):
         mode_groupbox.setLayout(mode_layout)
         main_layout.addWidget(mode_groupbox)
 
+        # Флажки, зависящие от движка, включаются, когда он загрузится (on_engine_loaded).
+        self.latest_frame_checkbox = QCheckBox("Минимальная задержка (пропускать устаревшие кадры)")
+        self.latest_frame_checkbox.setEnabled(False)
+        main_layout.addWidget(self.latest_frame_checkbox)
+
+        self.mirror_checkbox = QCheckBox("Зеркальное изображение")
+        main_layout.addWidget(self.mirror_checkbox)
+
+        self.h264_checkbox = QCheckBox("H.264 по Wi-Fi (меньше трафика)")
+        self.h264_checkbox.setEnabled(False)
+        main_layout.addWidget(self.h264_checkbox)
+
+        self.udp_checkbox = QCheckBox("Кадры по UDP через Wi-Fi (потери не задерживают поток)")
+        main_layout.addWidget(self.udp_checkbox)
+
+        self.preview_checkbox = QCheckBox("Показывать превью")
+        self.preview_checkbox.setChecked(True)
+        main_layout.addWidget(self.preview_checkbox)
+
         self.ip_layout = QHBoxLayout()
         self.ip_label = QLabel("IP Адрес Телефона:")
         self.ip_input = QLineEdit()
@@ -351,34 +211,95 @@ class WebcamClientGUI(QMainWindow):
         self.status_label.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Fixed)
         main_layout.addWidget(self.status_label)
 
+        self.stats_label = QLabel("")
+        self.stats_label.setObjectName("stats_label")
+        self.stats_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.stats_label.setWordWrap(True)
+        main_layout.addWidget(self.stats_label)
+
         self.rb_wifi.toggled.connect(self.toggle_ip_input_visibility)
         self.rb_usb.toggled.connect(self.toggle_ip_input_visibility)
         self.connect_button.clicked.connect(self.toggle_connection)
         self.switch_button.clicked.connect(self.switch_camera)
+        self.preview_checkbox.toggled.connect(self.toggle_preview)
 
-    @Slot(np.ndarray)
-    def update_preview(self, frame_bgr):
-        """Обновляет QLabel с превью кадра."""
+    def _load_engine(self):
+        """Фоновый поток: импорт движка и стартовый бенчмарк декодеров (результат кешируется для подключения)."""
+        started = time.perf_counter()
         try:
-            if not self.is_connected or not self.preview_label.isVisible():
-                 return
-
-            frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
+            import stream_engine
+            from decoders import create_decoder
+            from h264 import is_available as h264_available
+        except ImportError as e:
+            # Ошибку покажет подключение (_prepare_connection).
+            print(f"[!] Не удалось загрузить движок: {e}")
+            return
+        try:
+            create_decoder(stream_engine.DECODER_BACKEND, stream_engine.PIXEL_FORMAT)
+        except Exception as e:
+            print(f"[!] Не удалось заранее выбрать декодер: {e}")
+        print(f"[*] Движок загружен в фоне за {(time.perf_counter() - started) * 1000:.0f} мс")
+        self.engine_loaded.emit(h264_available())
+
+    @Slot(bool)
+    def on_engine_loaded(self, h264_supported):
+        """Движок загружен: значения по умолчанию из него и флажки, которые от него зависят."""
+        if self.engine_ready:
+            return
+        from stream_engine import LATEST_FRAME_MODE
+        self.engine_ready = True
+        self.h264_supported = h264_supported
+        self.latest_frame_checkbox.setChecked(LATEST_FRAME_MODE)
+        if not h264_supported:
+            self.h264_checkbox.setToolTip("Нужен пакет PyAV: pip install av")
+        # Переключатели режима доступны, только пока нет подключения и его подготовки.
+        self.set_connection_controls_enabled(self.rb_usb.isEnabled())
 
-            qt_pixmap = QPixmap.fromImage(qt_image)
+    @Slot()
+    def refresh_preview(self):
+        """По таймеру забирает из общего буфера последний кадр превью (уже уменьшенный рабочим потоком)."""
+        try:
+            if not self.is_connected:
+                 return
+            # В трассировке (TRACE_FILE в stream_engine.py) видно, сколько занимает поток GUI.
+            with span(self.tracer(), 'gui_preview'):
+                self.preview.consume(self._show_preview_frame)
+        except Exception as e:
+            print(f"[!] Ошибка обновления превью: {e}")
 
-            scaled_pixmap = qt_pixmap.scaled(self.preview_label.size(),
-                                             Qt.AspectRatioMode.KeepAspectRatio,
-                                             Qt.TransformationMode.SmoothTransformation)
+    def _show_preview_frame(self, frame):
+        """Показывает кадр превью (в формате кадров движка, без cvtColor и масштабирования в GUI)."""
+        h, w, ch = frame.shape
+        bytes_per_line = ch * w
+        image_format = QImage.Format.Format_BGR888 if self.pixel_format == 'BGR' else QImage.Format.Format_RGB888
+        qt_image = QImage(frame.data, w, h, bytes_per_line, image_format)
+        self.preview_label.setPixmap(QPixmap.fromImage(qt_image))
+
+    def update_preview_state(self):
+        """Включает работу превью, только если оно видно пользователю."""
+        if self.preview is None:
+            return
+        visible = self.preview_checkbox.isChecked() and not self.isMinimized()
+        self.preview.set_enabled(visible)
+        area = self.preview_label.contentsRect()
+        self.preview.set_target_size(area.width(), area.height())
+
+    @Slot(bool)
+    def toggle_preview(self, checked):
+        """Включает/выключает превью."""
+        self.update_preview_state()
+        if not checked:
+            self.preview_label.clear()
+            self.preview_label.setText("Превью отключено")
 
-            self.preview_label.setPixmap(scaled_pixmap)
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_preview_state()
 
-        except Exception as e:
-            print(f"[!] Ошибка обновления превью: {e}")
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.update_preview_state()
 
     @Slot()
     def toggle_ip_input_visibility(self):
@@ -394,76 +315,22 @@ class WebcamClientGUI(QMainWindow):
         if not self.is_connected:
             connection_mode = 'usb' if self.rb_usb.isChecked() else 'wifi'
             host = '127.0.0.1'
-
-            if connection_mode == 'usb':
-                self.status_label.setText("Статус: Проверка ADB...")
-                QApplication.processEvents()
-
-                adb_ok, _, adb_err = run_adb_command(['version'])
-                if not adb_ok:
-                    self.show_error_message("Ошибка ADB", f"Не удалось выполнить команду ADB.\nУбедитесь, что файлы ADB находятся в папке 'adb_files'.\nОшибка: {adb_err}")
-                    self.reset_ui_to_disconnected()
-                    return
-
-                self.status_label.setText("Статус: Поиск устройства...")
-                QApplication.processEvents()
-                devices_ok, devices_out, devices_err = run_adb_command(['devices'])
-                lines = devices_out.strip().splitlines()
-                connected_devices = []
-                if len(lines) > 1:
-                    for line in lines[1:]:
-                        parts = line.split()
-                        if len(parts) == 2 and parts[1] == 'device':
-                            connected_devices.append(parts[0])
-                        elif len(parts) == 2 and parts[1] == 'unauthorized':
-                            self.show_error_message("Ошибка ADB", "Устройство не авторизовано.\nПожалуйста, разрешите отладку по USB на экране вашего телефона.")
-                            self.reset_ui_to_disconnected()
-                            return
-
-                if not connected_devices:
-                    self.show_error_message("Ошибка ADB", "Подключенное авторизованное Android-устройство не найдено.\nУбедитесь, что телефон подключен по USB и отладка разрешена.")
-                    self.reset_ui_to_disconnected()
-                    return
-                elif len(connected_devices) > 1:
-                    self.show_error_message("Ошибка ADB", f"Обнаружено несколько устройств:\n{', '.join(connected_devices)}\nПожалуйста, оставьте подключенным только одно устройство.")
-                    self.reset_ui_to_disconnected()
-                    return
-                self.status_label.setText(f"Статус: Устройство найдено ({connected_devices[0]}). Настройка порта...")
-                QApplication.processEvents()
-
-                forward_ok, _, forward_err = run_adb_command(['forward', f'tcp:{PORT}', f'tcp:{PORT}'])
-                if not forward_ok:
-                    if "cannot bind listener" in forward_err or "already in use" in forward_err:
-                         print("[*] Порт занят, пытаемся удалить старый форвардинг...")
-                         run_adb_command(['forward', '--remove', f'tcp:{PORT}'])
-                         forward_ok, _, forward_err = run_adb_command(['forward', f'tcp:{PORT}', f'tcp:{PORT}'])
-
-                    if not forward_ok:
-                         self.show_error_message("Ошибка ADB Forward", f"Не удалось настроить проброс порта {PORT}.\nОшибка: {forward_err}")
-                         self.reset_ui_to_disconnected()
-                         return
-                print(f"[*] ADB Forward tcp:{PORT} -> tcp:{PORT} настроен.")
-
-            elif connection_mode == 'wifi':
+            if connection_mode == 'wifi':
                 host = self.ip_input.text().strip()
                 if not host:
                     self.show_error_message("Ошибка", "Введите IP адрес телефона для режима Wi-Fi.")
                     self.reset_ui_to_disconnected()
                     return
 
+            # Проверка ADB и загрузка движка - в фоне (обычно уже готовы к этому моменту),
+            # подключение продолжится в on_connection_prepared.
+            self.connect_started = time.perf_counter()
+            self.pending_connection = (connection_mode, host)
             self.set_ui_connecting_state(True)
-            self.status_label.setText("Статус: Подключение к телефону...")
-            self.preview_label.clear()
-            self.preview_label.setText("Подключение...")
-            self.preview_label.setStyleSheet("background-color: black; color: grey;")
-
-            self.worker_thread = WebcamWorker(host, PORT, TARGET_FPS)
-            self.worker_thread.status_update.connect(self.update_status_label)
-            self.worker_thread.connection_successful.connect(self.on_connection_successful)
-            self.worker_thread.connection_failed.connect(self.on_connection_failed)
-            self.worker_thread.disconnected.connect(self.on_disconnected)
-            self.worker_thread.frame_update.connect(self.update_preview)
-            self.worker_thread.start()
+            self.status_label.setText("Статус: Поиск устройства..." if connection_mode == 'usb'
+                                      else "Статус: Подготовка подключения...")
+            threading.Thread(target=self._prepare_connection, args=(connection_mode,),
+                             name='connection-preflight', daemon=True).start()
 
         else:
             self.status_label.setText("Статус: Отключение...")
@@ -472,9 +339,100 @@ class WebcamClientGUI(QMainWindow):
             else:
                 print("[?] Попытка отключения, но поток не найден или не запущен.")
                 self.reset_ui_to_disconnected()
-            if self.rb_usb.isChecked():
-                 print("[*] Попытка удалить ADB forward...")
-                 run_adb_command(['forward', '--remove', f'tcp:{PORT}'])
+            # Проброс порта остается (и кешируется) до закрытия окна: следующее подключение
+            # не настраивает его заново.
+
+    def _prepare_connection(self, connection_mode):
+        """
+        Фоновый поток после нажатия "Подключиться": дожидается загрузки движка и (по USB)
+        проверки ADB из кеша AdbPreflight, настраивает проброс порта. Итог - сигнал connection_prepared.
+        """
+        try:
+            from stream_engine import PORT
+            if connection_mode == 'usb':
+                connected_devices, unauthorized, adb_err = self.adb_preflight.devices()
+                if adb_err:
+                    self.connection_prepared.emit("Ошибка ADB", f"Не удалось выполнить команду ADB.\nУбедитесь, что файлы ADB находятся в папке 'adb_files'.\nОшибка: {adb_err}")
+                    return
+                if unauthorized:
+                    self.connection_prepared.emit("Ошибка ADB", "Устройство не авторизовано.\nПожалуйста, разрешите отладку по USB на экране вашего телефона.")
+                    return
+                if not connected_devices:
+                    self.connection_prepared.emit("Ошибка ADB", "Подключенное авторизованное Android-устройство не найдено.\nУбедитесь, что телефон подключен по USB и отладка разрешена.")
+                    return
+                elif len(connected_devices) > 1:
+                    self.connection_prepared.emit("Ошибка ADB", f"Обнаружено несколько устройств:\n{', '.join(connected_devices)}\nПожалуйста, оставьте подключенным только одно устройство.\nДля нескольких телефонов одновременно используйте:\npython -m webcam_headless --usb --all-devices")
+                    return
+                forward_ok, forward_err = self.adb_preflight.ensure_forward(PORT)
+                if not forward_ok:
+                    self.connection_prepared.emit("Ошибка ADB Forward", f"Не удалось настроить проброс порта {PORT}.\nОшибка: {forward_err}")
+                    return
+        except Exception as e:
+            self.connection_prepared.emit("Ошибка", f"Не удалось подготовить подключение: {e}")
+            return
+        self.connection_prepared.emit("", "")
+
+    @Slot(str, str)
+    def on_connection_prepared(self, error_title, error_message):
+        """Подготовка закончена: ошибка или запуск рабочего потока с движком."""
+        if error_title:
+            self.show_error_message(error_title, error_message)
+            self.reset_ui_to_disconnected()
+            return
+        from h264 import is_available as h264_available
+        from preview import PreviewPublisher
+        from stream_engine import PORT, StreamConfig
+        # Подготовка могла закончиться раньше, чем сигнал фоновой загрузки дошел до окна.
+        self.on_engine_loaded(h264_available())
+        connection_mode, host = self.pending_connection
+        if self.preview is None:
+            self.preview = PreviewPublisher(PREVIEW_FPS)
+
+        self.status_label.setText("Статус: Подключение к телефону...")
+        self.preview_label.clear()
+        self.preview_label.setText("Подключение...")
+        self.preview_label.setStyleSheet("background-color: black; color: grey;")
+
+        self.stats_label.setText("")
+        config = StreamConfig(latest_only=self.latest_frame_checkbox.isChecked(),
+                              output_mirror=self.mirror_checkbox.isChecked())
+        if connection_mode == 'wifi' and self.h264_checkbox.isChecked():
+            config.transport_codec = 'h264'
+        # adb forward пропускает только TCP.
+        config.udp_transport = connection_mode == 'wifi' and self.udp_checkbox.isChecked()
+        self.pixel_format = config.pixel_format
+        # По USB перед каждым переподключением проверяется проброс порта: после переподключения
+        # кабеля adb forward теряется, и AdbPreflight настраивает его заново.
+        prepare_connection = (functools.partial(self.adb_preflight.ensure_forward, PORT)
+                              if connection_mode == 'usb' else None)
+        self.worker_thread = WebcamWorker(host, PORT, config, preview=self.preview,
+                                          prepare_connection=prepare_connection)
+        self.worker_thread.status_update.connect(self.update_status_label)
+        self.worker_thread.connection_successful.connect(self.on_connection_successful)
+        self.worker_thread.connection_failed.connect(self.on_connection_failed)
+        self.worker_thread.disconnected.connect(self.on_disconnected)
+        self.worker_thread.stats_update.connect(self.update_stats)
+        self.preview.reset()
+        self.update_preview_state()
+        self.worker_thread.start()
+
+    @Slot(dict)
+    def on_devices_changed(self, devices):
+        """Подключение/отключение телефона по USB видно сразу, без нажатия "Подключиться"."""
+        if not self.rb_usb.isChecked():
+            return
+        ready = [serial for serial, state in devices.items() if state == 'device']
+        unauthorized = [serial for serial, state in devices.items() if state == 'unauthorized']
+        if self.is_connected:
+            if not ready:
+                self.update_status_label("Телефон отключен от USB.")
+            return
+        if ready:
+            self.status_label.setText(f"Статус: Устройство подключено ({', '.join(ready)})")
+        elif unauthorized:
+            self.status_label.setText("Статус: Разрешите отладку по USB на экране телефона")
+        else:
+            self.status_label.setText("Статус: Подключите телефон по USB")
 
     @Slot()
     def switch_camera(self):
@@ -490,9 +448,30 @@ class WebcamClientGUI(QMainWindow):
         if message.startswith("Статус: "): message = message[len("Статус: "):]
         self.status_label.setText(f"Статус: {message}")
 
+    @Slot(dict)
+    def update_stats(self, stats):
+        """Показывает FPS, пропускную способность, времена стадий и число выброшенных кадров."""
+        from metrics import format_stats
+        with span(self.tracer(), 'gui_stats'):
+            self.stats_label.setText(format_stats(stats))
+
+    def tracer(self):
+        """Трассировщик текущего потока (tracing.Tracer) или None, если трассировка выключена."""
+        worker = self.worker_thread
+        return worker.engine.tracer if worker else None
+
+    def current_stats(self):
+        """Статистика текущего потока для HTTP-эндпоинта (вызывается из его потока)."""
+        worker = self.worker_thread
+        return worker.engine.stats() if worker else {}
+
     @Slot(str)
     def on_connection_successful(self, device_info):
         """Обработка успешного подключения."""
+        if self.connect_started is not None:
+            report_time("Первый кадр после нажатия \"Подключиться\"",
+                        (time.perf_counter() - self.connect_started) * 1000, FIRST_FRAME_TARGET_MS)
+            self.connect_started = None
         self.is_connected = True
         self.connect_button.setText("Отключиться")
         self.connect_button.setEnabled(True)
@@ -500,6 +479,7 @@ class WebcamClientGUI(QMainWindow):
         self.set_connection_controls_enabled(False)
         self.update_status_label(f"Подключено ({device_info})")
         self.preview_label.setText("")
+        self.preview_timer.start()
 
     @Slot(str)
     def on_connection_failed(self, error_message):
@@ -520,6 +500,8 @@ class WebcamClientGUI(QMainWindow):
          """Сбрасывает UI в состояние 'Отключено'."""
          print("[*] Сброс UI в состояние 'Отключено'.")
          self.is_connected = False
+         self.connect_started = None
+         self.preview_timer.stop()
          self.connect_button.setText("Подключиться")
          self.connect_button.setEnabled(True)
          self.switch_button.setEnabled(False)
@@ -539,6 +521,10 @@ class WebcamClientGUI(QMainWindow):
          """Включает/выключает элементы управления режимом и IP."""
          self.rb_wifi.setEnabled(enabled)
          self.rb_usb.setEnabled(enabled)
+         self.latest_frame_checkbox.setEnabled(enabled and self.engine_ready)
+         self.mirror_checkbox.setEnabled(enabled)
+         self.h264_checkbox.setEnabled(enabled and self.h264_supported)
+         self.udp_checkbox.setEnabled(enabled)
          is_wifi_selected_and_controls_enabled = enabled and self.rb_wifi.isChecked()
          self.ip_input.setEnabled(is_wifi_selected_and_controls_enabled)
          self.ip_label.setEnabled(is_wifi_selected_and_controls_enabled)
@@ -582,6 +568,7 @@ class WebcamClientGUI(QMainWindow):
                 border: 1px solid #007AFF; background-color: #007AFF; border-radius: 7px;
             }
              QLabel#status_label { font-size: 9pt; color: #CCCCCC; }
+             QLabel#stats_label { font-size: 8pt; color: #999999; }
              QLabel[frameShape="6"] { /* Стиль для рамки превью */
                  border: 1px solid #444444;
              }
@@ -590,9 +577,10 @@ class WebcamClientGUI(QMainWindow):
     def closeEvent(self, event):
         """Обработка закрытия окна."""
         print("[*] Окно закрывается...")
-        if self.is_connected and self.rb_usb.isChecked():
-             print("[*] Попытка удалить ADB forward при закрытии...")
-             run_adb_command(['forward', '--remove', f'tcp:{PORT}'])
+        if self.stats_server:
+            self.stats_server.stop()
+        print("[*] Удаление ADB forward при закрытии (если настроен)...")
+        self.adb_preflight.remove_forward()
 
         if self.worker_thread and self.worker_thread.isRunning():
             print("[*] Запрос на остановку рабочего потока...")
@@ -606,4 +594,7 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = WebcamClientGUI()
     window.show()
+    # Первый проход цикла событий: окно уже на экране.
+    QTimer.singleShot(0, lambda: report_time("Окно открыто", (time.perf_counter() - STARTED) * 1000,
+                                             WINDOW_TARGET_MS))
     sys.exit(app.exec())
\ No newline at end of file
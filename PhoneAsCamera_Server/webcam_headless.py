@@ -0,0 +1,263 @@
+"""
+Консольный клиент без GUI (PySide6 не импортируется).
+
+Запуск из папки PhoneAsCamera_Server:
+    python -m webcam_headless --usb
+    python -m webcam_headless --host 192.168.1.100 --latest
+    python -m webcam_headless --usb --all-devices --camera-backend unitycapture
+    python -m webcam_headless --host 192.168.1.100 192.168.1.101 --camera-devices "Cam 1,Cam 2"
+    python -m webcam_headless --usb --print-stats --stats-port 8899
+    python -m webcam_headless --usb --record session.pacr
+    python -m webcam_headless --replay session.pacr --replay-loop
+    python -m webcam_headless --usb --rotate 90 --mirror --output-resolution 1280x720
+    python -m webcam_headless --host 192.168.1.100 --mjpeg-port 8090
+    python -m webcam_headless --host 192.168.1.100 --codec h264
+    python -m webcam_headless --host 192.168.1.100 --udp --udp-port 8889
+    python -m webcam_headless --usb --trace trace.json --profile profiles
+Остановка - Ctrl+C.
+"""
+import argparse
+import asyncio
+import sys
+
+from adb_tools import list_devices
+from metrics import StatsServer, format_stats
+from recording import ReplaySource
+from session_manager import SessionManager
+from stream_engine import StreamConfig, EngineListener, PORT, TARGET_FPS, CAMERA_BACKEND
+from transform import ROTATIONS, SCALE_MODES
+
+
+class ConsoleListener(EngineListener):
+    """Печатает события движка в консоль (с именем потока, если потоков несколько)."""
+
+    def __init__(self, name=None, print_stats=False):
+        self.prefix = f"[{name}] " if name else ""
+        self.print_stats = print_stats
+        self.failed = False
+        self.dropped = 0
+
+    def on_status(self, message):
+        print(f"[*] {self.prefix}{message}")
+
+    def on_connected(self, device_info):
+        print(f"[*] {self.prefix}Вирт. камера запущена: {device_info}")
+
+    def on_failed(self, message):
+        self.failed = True
+        print(f"[!] {self.prefix}{message}")
+
+    def on_stats(self, stats):
+        if self.print_stats:
+            print(f"[*] {self.prefix}{format_stats(stats)}")
+        elif stats.get('dropped', 0) != self.dropped:
+            self.dropped = stats['dropped']
+            print(f"[*] {self.prefix}Пропущено кадров: {self.dropped}")
+
+
+def parse_resolution(value):
+    """'1280x720' -> (1280, 720)."""
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ожидается разрешение вида 1280x720, получено '{value}'")
+    return width, height
+
+
+def parse_crop(value):
+    """'0.1,0,0.8,1' -> (0.1, 0.0, 0.8, 1.0): x, y, ширина, высота в долях кадра."""
+    try:
+        x, y, width, height = (float(part) for part in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ожидается обрезка вида x,y,ширина,высота в долях кадра, получено '{value}'")
+    if not (0 <= x < 1 and 0 <= y < 1 and 0 < width <= 1 - x and 0 < height <= 1 - y):
+        raise argparse.ArgumentTypeError(f"Обрезка должна быть внутри кадра (доли 0..1), получено '{value}'")
+    return x, y, width, height
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='webcam_headless',
+                                     description="Телефон как веб-камера: консольный клиент без GUI")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--usb', action='store_true', help="подключение по USB (adb forward)")
+    mode.add_argument('--host', nargs='+', help="IP адрес(а) телефонов для режима Wi-Fi")
+    mode.add_argument('--replay', metavar='FILE', help="воспроизвести запись потока в вирт. камеру")
+    parser.add_argument('--serial', help="серийный номер устройства ADB, если подключено несколько")
+    parser.add_argument('--all-devices', action='store_true',
+                        help="USB: запустить поток для каждого подключенного устройства")
+    parser.add_argument('--port', type=int, default=PORT,
+                        help=f"порт сервера на телефоне; для нескольких USB-устройств локальные порты "
+                             f"назначаются начиная с него (по умолчанию {PORT})")
+    parser.add_argument('--fps', type=int, default=TARGET_FPS, help="частота кадров вирт. камеры")
+    parser.add_argument('--latest', action='store_true',
+                        help="минимальная задержка: выводить только самый свежий кадр")
+    parser.add_argument('--decoder', default=None, choices=('auto', 'opencv', 'turbojpeg'),
+                        help="декодер JPEG")
+    parser.add_argument('--codec', default=None, choices=('auto', 'jpeg', 'nv21', 'h264'),
+                        help="кодек кадров от телефона: auto - несжатые по USB и JPEG по Wi-Fi, h264 - "
+                             "аппаратное кодирование на телефоне (меньше трафика, нужен PyAV)")
+    parser.add_argument('--udp', action='store_true',
+                        help="Wi-Fi: кадры по UDP - потерянный пакет стоит одного кадра, а не задержки "
+                             "потока (команды остаются на TCP; по USB недоступно)")
+    parser.add_argument('--udp-port', type=int, default=0,
+                        help="локальный порт приема кадров по UDP (по умолчанию любой свободный)")
+    parser.add_argument('--output-resolution', type=parse_resolution, default=None,
+                        help="постоянное разрешение вирт. камеры, например 1280x720 (кадры другого "
+                             "размера приводятся к нему)")
+    parser.add_argument('--rotate', type=int, default=0, choices=ROTATIONS,
+                        help="повернуть изображение по часовой стрелке, градусов")
+    parser.add_argument('--mirror', action='store_true', help="зеркально отразить изображение")
+    parser.add_argument('--crop', type=parse_crop, default=None,
+                        help="обрезать кадр: x,y,ширина,высота в долях кадра, например 0.25,0,0.5,1")
+    parser.add_argument('--scale', default='fit', choices=SCALE_MODES,
+                        help="приведение к разрешению камеры: fit - с полями, fill - с обрезкой краев, "
+                             "stretch - растягиванием (по умолчанию fit)")
+    parser.add_argument('--camera-backend', default=CAMERA_BACKEND,
+                        help=f"бэкенд pyvirtualcam (по умолчанию {CAMERA_BACKEND})")
+    parser.add_argument('--camera-devices', default='',
+                        help="имена устройств вирт. камер через запятую, по одному на поток")
+    parser.add_argument('--jitter-depth', type=int, default=None,
+                        help="наибольшая глубина буфера сглаживания джиттера, кадров (больше - ровнее, "
+                             "но больше задержка; 0 - выводить кадры сразу, без часов вывода)")
+    parser.add_argument('--no-adapt', action='store_true',
+                        help="не подстраивать качество JPEG и разрешение телефона под канал и CPU")
+    parser.add_argument('--no-reconnect', action='store_true',
+                        help="не переподключаться после разрыва связи (поток завершается)")
+    parser.add_argument('--record', metavar='FILE',
+                        help="записывать принятый поток JPEG без перекодирования (для нескольких "
+                             "потоков к имени файла добавляется имя потока)")
+    parser.add_argument('--mjpeg-port', type=int, default=None,
+                        help="транслировать принятые JPEG по HTTP (MJPEG) на этом порту, для нескольких "
+                             "потоков - на следующих портах по порядку")
+    parser.add_argument('--mjpeg-host', default='0.0.0.0',
+                        help="адрес MJPEG-трансляции (по умолчанию все интерфейсы; 127.0.0.1 - только этот компьютер)")
+    parser.add_argument('--replay-fast', action='store_true',
+                        help="воспроизводить так быстро, как успевает конвейер (а не в исходном темпе)")
+    parser.add_argument('--replay-loop', action='store_true', help="воспроизводить запись по кругу")
+    parser.add_argument('--print-stats', action='store_true',
+                        help="печатать FPS, пропускную способность и времена стадий раз в секунду")
+    parser.add_argument('--stats-port', type=int, default=None,
+                        help="порт локального HTTP-эндпоинта со статистикой (GET /stats)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="записать стадии каждого кадра по потокам в файл Chrome trace (JSON, "
+                             "открывается в ui.perfetto.dev); сохраняется при остановке")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="сохранять в папку сэмплы cProfile потоков движка (раз в 30 с на 2 с)")
+    args = parser.parse_args(argv)
+    if args.udp and not args.host:
+        parser.error("--udp работает только в режиме Wi-Fi (--host): adb forward пропускает только TCP")
+    return args
+
+
+def find_usb_serials(serial=None, all_devices=False):
+    """Возвращает список серийных номеров для подключения или None при ошибке."""
+    devices, unauthorized, adb_err = list_devices()
+    if adb_err:
+        print(f"[!] Не удалось выполнить команду ADB: {adb_err}")
+        return None
+    if unauthorized:
+        print(f"[!] Устройство не авторизовано ({', '.join(unauthorized)}). "
+              f"Разрешите отладку по USB на экране телефона.")
+        if not devices:
+            return None
+    if not devices:
+        print("[!] Подключенное авторизованное Android-устройство не найдено.")
+        return None
+    if serial:
+        if serial not in devices:
+            print(f"[!] Устройство {serial} не найдено. Доступны: {', '.join(devices)}")
+            return None
+        return [serial]
+    if all_devices:
+        return devices
+    if len(devices) > 1:
+        print(f"[!] Обнаружено несколько устройств: {', '.join(devices)}. "
+              f"Укажите --serial или --all-devices.")
+        return None
+    return devices
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {'target_fps': args.fps, 'latest_only': args.latest,
+                 'camera_backend': args.camera_backend, 'adaptive_quality': not args.no_adapt,
+                 'reconnect': not args.no_reconnect, 'output_rotation': args.rotate,
+                 'output_mirror': args.mirror, 'output_crop': args.crop, 'output_scale': args.scale}
+    if args.decoder:
+        overrides['decoder_backend'] = args.decoder
+    if args.codec:
+        overrides['transport_codec'] = args.codec
+    if args.udp:
+        overrides['udp_transport'] = True
+        overrides['udp_port'] = args.udp_port
+    if args.output_resolution:
+        overrides['output_resolution'] = args.output_resolution
+    if args.record:
+        overrides['record_path'] = args.record
+    if args.mjpeg_port is not None:
+        overrides['mjpeg_port'] = args.mjpeg_port
+        overrides['mjpeg_host'] = args.mjpeg_host
+    if args.trace:
+        overrides['trace_file'] = args.trace
+    if args.profile:
+        overrides['profile_dir'] = args.profile
+    if args.jitter_depth == 0 or args.replay_fast:
+        # Без часов вывода: --replay-fast выводит кадры так быстро, как успевает конвейер.
+        overrides['output_clock'] = False
+    elif args.jitter_depth:
+        overrides['jitter_max_depth'] = args.jitter_depth
+    camera_devices = [name.strip() for name in args.camera_devices.split(',') if name.strip()]
+
+    listeners = []
+
+    def make_listener(session):
+        multiple = len(manager.sessions) > 1
+        listener = ConsoleListener(session.name if multiple else None, args.print_stats)
+        listeners.append(listener)
+        return listener
+
+    manager = SessionManager(StreamConfig(**overrides), listener_factory=make_listener)
+    if args.usb:
+        serials = find_usb_serials(args.serial, args.all_devices)
+        if not serials:
+            return 1
+        for serial, error in manager.add_usb_devices(serials, args.port, camera_devices, remote_port=args.port):
+            print(f"[!] [{serial}] Не удалось настроить проброс порта: {error}")
+    elif args.replay:
+        try:
+            source = ReplaySource(args.replay, realtime=not args.replay_fast, loop=args.replay_loop)
+        except (OSError, ValueError) as e:
+            print(f"[!] Не удалось открыть запись: {e}")
+            return 1
+        print(f"[*] Запись {args.replay}: кадров {len(source)}, {source.recording.duration:.1f} с")
+        manager.add_session(args.replay, args.replay, frame_source=source,
+                            camera_device=camera_devices[0] if camera_devices else None)
+    else:
+        for index, host in enumerate(args.host):
+            camera_device = camera_devices[index] if index < len(camera_devices) else None
+            manager.add_session(host, host, args.port, camera_device=camera_device)
+    if not manager.sessions:
+        return 1
+
+    stats_server = None
+    if args.stats_port is not None:
+        stats_server = StatsServer(manager.stats, args.stats_port)
+        try:
+            stats_server.start()
+        except OSError as e:
+            print(f"[!] Не удалось запустить HTTP-эндпоинт статистики: {e}")
+            stats_server = None
+
+    try:
+        asyncio.run(manager.run())
+    except KeyboardInterrupt:
+        print("[*] Остановка по Ctrl+C.")
+    finally:
+        if stats_server:
+            stats_server.stop()
+        manager.cleanup()
+    return 1 if any(listener.failed for listener in listeners) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
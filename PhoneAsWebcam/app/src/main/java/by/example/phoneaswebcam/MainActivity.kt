@@ -5,8 +5,15 @@ import android.content.pm.PackageManager
 import android.graphics.ImageFormat
 import android.graphics.Rect
 import android.graphics.YuvImage
+import android.media.Image
+import android.media.MediaCodec
+import android.media.MediaCodecInfo
+import android.media.MediaCodecList
+import android.media.MediaFormat
 import android.net.wifi.WifiManager
+import android.os.Build
 import android.os.Bundle
+import android.os.SystemClock
 import android.util.Log
 import android.util.Size // Добавьте этот импорт вверху файла, если его нет
 import android.widget.Toast
@@ -17,12 +24,18 @@ import androidx.core.app.ActivityCompat
 import androidx.core.content.ContextCompat
 import by.example.phoneaswebcam.databinding.ActivityMainBinding // Убедись, что имя пакета верное
 import kotlinx.coroutines.*
+import java.io.BufferedOutputStream
 import java.io.ByteArrayOutputStream
 import java.io.DataOutputStream
 import java.io.IOException
+import java.net.DatagramPacket
+import java.net.DatagramSocket
 import java.net.InetAddress // Добавлен импорт
+import java.net.InetSocketAddress
 import java.net.ServerSocket
 import java.net.Socket
+import java.net.SocketTimeoutException
+import java.nio.ByteBuffer
 import java.util.concurrent.ExecutorService
 import java.util.concurrent.Executors
 import java.io.BufferedReader
@@ -37,11 +50,37 @@ class MainActivity : AppCompatActivity() {
 
     // Сетевые переменные
     private var serverJob: Job? = null
+    private var serverSocket: ServerSocket? = null
     private var clientSocket: Socket? = null
     private var outputStream: DataOutputStream? = null
     private var isStreaming = false
     private val serverPort = 8888
     private var isUsbMode = false // Флаг режима: false = Wi-Fi, true = USB
+    // Версия протокола, согласованная с клиентом (1 - старый клиент без приветствия)
+    @Volatile private var protocolVersion = 1
+    private var frameSequence = 0
+    // Качество JPEG и разрешение анализа - клиент подстраивает их командами CMD:QUALITY / CMD:MAX_RES
+    @Volatile private var jpegQuality = DEFAULT_JPEG_QUALITY
+    private var analysisResolution = DEFAULT_RESOLUTION
+    // Кодек кадров: JPEG, несжатый NV21 (клиент включает его командой CMD:CODEC=NV21 по USB)
+    // или H.264 (CMD:CODEC=H264, аппаратный кодер MediaCodec)
+    @Volatile private var transportCodec = CODEC_JPEG
+    // Кодер H.264 создается и используется только в потоке анализатора (cameraExecutor)
+    private var encoder: MediaCodec? = null
+    private var encoderSize: Size? = null
+    private val encoderInfo = MediaCodec.BufferInfo()
+    // SPS/PPS от кодера: отправляются перед каждым ключевым кадром, чтобы клиент мог начать с любого из них
+    private var codecConfig = ByteArray(0)
+    // Новый клиент - новый поток H.264: кодер перезапускается с ключевого кадра
+    @Volatile private var encoderResetRequested = false
+    // Кадры (поток анализатора) и ответы на команды (поток сервера) пишутся в один поток вывода
+    private val outputLock = Any()
+    // Транспорт UDP (CMD:TRANSPORT=UDP:<порт>, только Wi-Fi): адрес клиента для кадров или null - кадры по TCP
+    @Volatile private var udpTarget: InetSocketAddress? = null
+    private var udpSocket: DatagramSocket? = null
+    // Номер сообщения UDP и буфер датаграммы - только в потоке анализатора
+    private var udpMessageId = 0
+    private val udpDatagram = ByteArray(FRAGMENT_HEADER_SIZE + UDP_FRAGMENT_SIZE)
 
     override fun onCreate(savedInstanceState: Bundle?) {
         super.onCreate(savedInstanceState)
@@ -110,7 +149,7 @@ class MainActivity : AppCompatActivity() {
 
             imageAnalyzer = ImageAnalysis.Builder()
                 .setBackpressureStrategy(ImageAnalysis.STRATEGY_KEEP_ONLY_LATEST)
-                .setTargetResolution(Size(1280, 720))
+                .setTargetResolution(analysisResolution)
                 .build()
                 .also {
                     it.setAnalyzer(cameraExecutor, { imageProxy -> // Исправлено: убрали ImageAnalyzer
@@ -142,31 +181,29 @@ class MainActivity : AppCompatActivity() {
         }
 
         if (image.format == ImageFormat.YUV_420_888 && image.planes.size == 3) {
-            val yBuffer = image.planes[0].buffer
-            val uBuffer = image.planes[1].buffer
-            val vBuffer = image.planes[2].buffer
-
-            val ySize = yBuffer.remaining()
-            val uSize = uBuffer.remaining()
-            val vSize = vBuffer.remaining()
-
-            val nv21 = ByteArray(ySize + uSize + vSize)
-            yBuffer.get(nv21, 0, ySize)
-            // Простой (и не всегда корректный) способ копирования U/V для NV21
-            vBuffer.get(nv21, ySize, vSize)
-            uBuffer.get(nv21, ySize + vSize, uSize)
-
-
-            val yuvImage = YuvImage(nv21, ImageFormat.NV21, image.width, image.height, null)
-            val out = ByteArrayOutputStream()
-            yuvImage.compressToJpeg(Rect(0, 0, image.width, image.height), 50, out)
-            val jpegBytes = out.toByteArray()
+            // Несжатые кадры и H.264 - только по протоколу v2 (в заголовке v1 нет ни кодека, ни размеров)
+            val codec = if (protocolVersion >= 2) transportCodec else CODEC_JPEG
+            val timestampUs = imageProxy.imageInfo.timestamp / 1000
+            if (encoder != null && (codec != CODEC_H264 || encoderResetRequested)) {
+                stopEncoder()
+            }
+            encoderResetRequested = false
 
             try {
-                outputStream?.let { stream ->
-                    stream.writeInt(jpegBytes.size)
-                    stream.write(jpegBytes)
-                    stream.flush()
+                when (codec) {
+                    CODEC_H264 -> {
+                        // Кодер может отдать кадр позже, чем получил: время съемки берется из presentationTimeUs
+                        for ((payload, ptsUs) in encodeH264(image, timestampUs)) {
+                            sendFrame(payload, CODEC_H264, ptsUs, image.width, image.height)
+                        }
+                    }
+                    CODEC_NV21 -> sendFrame(toYuv420sp(image, true), CODEC_NV21, timestampUs, image.width, image.height)
+                    else -> {
+                        val yuvImage = YuvImage(toYuv420sp(image, true), ImageFormat.NV21, image.width, image.height, null)
+                        val out = ByteArrayOutputStream()
+                        yuvImage.compressToJpeg(Rect(0, 0, image.width, image.height), jpegQuality, out)
+                        sendFrame(out.toByteArray(), CODEC_JPEG, timestampUs, image.width, image.height)
+                    }
                 }
             } catch (e: IOException) {
                 Log.e(TAG, "Ошибка отправки кадра: ${e.message}")
@@ -180,6 +217,189 @@ class MainActivity : AppCompatActivity() {
         imageProxy.close()
     }
 
+    // Один кадр или сообщение с заголовком текущей версии протокола (см. PhoneAsCamera_Server/protocol.py)
+    private fun sendFrame(payload: ByteArray, codec: Int, timestampUs: Long, width: Int, height: Int) {
+        val target = udpTarget
+        if (target != null && protocolVersion >= 2) {
+            sendFrameUdp(target, payload, codec, timestampUs, width, height)
+            frameSequence++
+            return
+        }
+        outputStream?.let { stream -> synchronized(outputLock) {
+            if (protocolVersion >= 2) {
+                stream.writeShort(FRAME_HEADER_V2_SIZE)
+                stream.writeInt(payload.size)
+                stream.writeInt(frameSequence)
+                stream.writeLong(timestampUs)
+                stream.writeByte(codec)
+                stream.writeByte(if (cameraSelector == CameraSelector.DEFAULT_FRONT_CAMERA) CAMERA_FRONT else CAMERA_BACK)
+                stream.writeShort(width)
+                stream.writeShort(height)
+            } else {
+                stream.writeInt(payload.size)
+            }
+            stream.write(payload)
+            stream.flush()
+        } }
+        frameSequence++
+    }
+
+    // Кадр по UDP: сообщение (заголовок v2 + данные) режется на датаграммы с заголовком фрагмента.
+    // Потерянные датаграммы не пересылаются - клиент выбрасывает недособранный кадр
+    private fun sendFrameUdp(target: InetSocketAddress, payload: ByteArray, codec: Int, timestampUs: Long, width: Int, height: Int) {
+        val socket = udpSocket ?: return
+        val camera = if (cameraSelector == CameraSelector.DEFAULT_FRONT_CAMERA) CAMERA_FRONT else CAMERA_BACK
+        val header = ByteBuffer.allocate(FRAME_HEADER_V2_SIZE)
+            .putShort(FRAME_HEADER_V2_SIZE.toShort()).putInt(payload.size).putInt(frameSequence)
+            .putLong(timestampUs).put(codec.toByte()).put(camera.toByte())
+            .putShort(width.toShort()).putShort(height.toShort())
+            .array()
+        val size = header.size + payload.size
+        val count = (size + UDP_FRAGMENT_SIZE - 1) / UDP_FRAGMENT_SIZE
+        val datagram = ByteBuffer.wrap(udpDatagram)
+        try {
+            for (index in 0 until count) {
+                val offset = index * UDP_FRAGMENT_SIZE
+                val end = minOf(size, offset + UDP_FRAGMENT_SIZE)
+                datagram.clear()
+                datagram.put(FRAGMENT_MAGIC).putInt(udpMessageId).putInt(offset).putInt(size)
+                    .putShort(index.toShort()).putShort(count.toShort())
+                // Фрагмент может захватывать конец заголовка кадра и начало данных
+                if (offset < header.size) {
+                    datagram.put(header, offset, minOf(end, header.size) - offset)
+                }
+                if (end > header.size) {
+                    val start = maxOf(offset, header.size) - header.size
+                    datagram.put(payload, start, end - header.size - start)
+                }
+                socket.send(DatagramPacket(udpDatagram, datagram.position(), target))
+            }
+        } catch (e: IOException) {
+            // Как потеря в сети: клиент выбросит кадр, соединение (TCP) остается
+            Log.w(TAG, "Ошибка отправки датаграммы: ${e.message}")
+        }
+        udpMessageId++
+    }
+
+    // YUV_420_888 -> NV21 (vFirst: Y, затем чередующиеся V/U) или NV12 (U/V - вход кодера H.264)
+    // с учетом rowStride/pixelStride плоскостей: размер результата ровно width * height * 3 / 2
+    private fun toYuv420sp(image: Image, vFirst: Boolean): ByteArray {
+        val width = image.width
+        val height = image.height
+        val yuv = ByteArray(width * height * 3 / 2)
+        val yPlane = image.planes[0]
+        val yBuffer = yPlane.buffer
+        var offset = 0
+        for (row in 0 until height) {
+            yBuffer.position(row * yPlane.rowStride)
+            yBuffer.get(yuv, offset, width)
+            offset += width
+        }
+        val first = if (vFirst) image.planes[2] else image.planes[1]
+        val second = if (vFirst) image.planes[1] else image.planes[2]
+        val firstBuffer = first.buffer
+        val secondBuffer = second.buffer
+        for (row in 0 until height / 2) {
+            for (col in 0 until width / 2) {
+                yuv[offset++] = firstBuffer.get(row * first.rowStride + col * first.pixelStride)
+                yuv[offset++] = secondBuffer.get(row * second.rowStride + col * second.pixelStride)
+            }
+        }
+        return yuv
+    }
+
+    // Есть ли на телефоне кодер H.264 (без него команда CMD:CODEC=H264 отклоняется)
+    private fun hasH264Encoder(): Boolean =
+        MediaCodecList(MediaCodecList.REGULAR_CODECS).codecInfos.any { info ->
+            info.isEncoder && info.supportedTypes.any { it.equals(MediaFormat.MIMETYPE_VIDEO_AVC, ignoreCase = true) }
+        }
+
+    private fun startEncoder(size: Size) {
+        stopEncoder()
+        val format = MediaFormat.createVideoFormat(MediaFormat.MIMETYPE_VIDEO_AVC, size.width, size.height).apply {
+            setInteger(MediaFormat.KEY_COLOR_FORMAT, MediaCodecInfo.CodecCapabilities.COLOR_FormatYUV420SemiPlanar)
+            setInteger(MediaFormat.KEY_BIT_RATE, (size.width * size.height * H264_FRAME_RATE * H264_BITS_PER_PIXEL).toInt())
+            setInteger(MediaFormat.KEY_FRAME_RATE, H264_FRAME_RATE)
+            setInteger(MediaFormat.KEY_I_FRAME_INTERVAL, H264_KEYFRAME_INTERVAL_S)
+            // Кодирование в реальном времени и без накопления кадров в кодере
+            setInteger(MediaFormat.KEY_PRIORITY, 0)
+            if (Build.VERSION.SDK_INT >= Build.VERSION_CODES.R) {
+                setInteger(MediaFormat.KEY_LATENCY, 1)
+            }
+        }
+        val codec = MediaCodec.createEncoderByType(MediaFormat.MIMETYPE_VIDEO_AVC)
+        try {
+            codec.configure(format, null, null, MediaCodec.CONFIGURE_FLAG_ENCODE)
+            codec.start()
+        } catch (e: Exception) {
+            codec.release()
+            throw e
+        }
+        encoder = codec
+        encoderSize = size
+        codecConfig = ByteArray(0)
+        Log.d(TAG, "Кодер H.264 запущен: ${size.width}x${size.height}")
+    }
+
+    private fun stopEncoder() {
+        val codec = encoder ?: return
+        encoder = null
+        encoderSize = null
+        try {
+            codec.stop()
+        } catch (e: IllegalStateException) {
+            Log.w(TAG, "Ошибка остановки кодера: ${e.message}")
+        }
+        codec.release()
+        Log.d(TAG, "Кодер H.264 остановлен")
+    }
+
+    // Передает кадр кодеру и забирает все готовые закодированные кадры: (access unit Annex-B, время съемки в мкс).
+    // Если кодер не запускается, телефон возвращается к JPEG.
+    private fun encodeH264(image: Image, timestampUs: Long): List<Pair<ByteArray, Long>> {
+        val size = Size(image.width, image.height)
+        if (encoder == null || encoderSize != size) {
+            try {
+                startEncoder(size)
+            } catch (e: Exception) {
+                Log.e(TAG, "Не удалось запустить кодер H.264, переход на JPEG: ${e.message}")
+                transportCodec = CODEC_JPEG
+                return emptyList()
+            }
+        }
+        val codec = encoder ?: return emptyList()
+        val inputIndex = codec.dequeueInputBuffer(ENCODER_TIMEOUT_US)
+        if (inputIndex >= 0) {
+            val nv12 = toYuv420sp(image, false)
+            codec.getInputBuffer(inputIndex)?.apply {
+                clear()
+                put(nv12)
+            }
+            codec.queueInputBuffer(inputIndex, 0, nv12.size, timestampUs, 0)
+        } else {
+            Log.w(TAG, "Кодер H.264 занят, кадр пропущен")
+        }
+        val encoded = mutableListOf<Pair<ByteArray, Long>>()
+        while (true) {
+            val index = codec.dequeueOutputBuffer(encoderInfo, 0)
+            if (index == MediaCodec.INFO_TRY_AGAIN_LATER) break
+            if (index < 0) continue // INFO_OUTPUT_FORMAT_CHANGED
+            val buffer = codec.getOutputBuffer(index)
+            val data = ByteArray(encoderInfo.size)
+            buffer?.position(encoderInfo.offset)
+            buffer?.get(data)
+            codec.releaseOutputBuffer(index, false)
+            if (encoderInfo.flags and MediaCodec.BUFFER_FLAG_CODEC_CONFIG != 0) {
+                codecConfig = data
+            } else if (encoderInfo.flags and MediaCodec.BUFFER_FLAG_KEY_FRAME != 0) {
+                encoded.add((codecConfig + data) to encoderInfo.presentationTimeUs)
+            } else {
+                encoded.add(data to encoderInfo.presentationTimeUs)
+            }
+        }
+        return encoded
+    }
+
     private fun switchCamera() {
         // Добавим проверку, что мы не в процессе стриминга (хотя команду должны получать только во время)
         // и что мы в главном потоке (хотя withContext(Dispatchers.Main) это обеспечивает)
@@ -219,17 +439,17 @@ class MainActivity : AppCompatActivity() {
         }
 
         serverJob = CoroutineScope(Dispatchers.IO).launch {
-            var serverSocket: ServerSocket? = null
             var reader: BufferedReader? = null // <-- Добавили переменную для чтения
 
             try {
-                serverSocket = if (isUsbMode) {
+                val socket = if (isUsbMode) {
                     Log.d(TAG, "Запуск сервера в режиме USB на localhost:$serverPort")
                     ServerSocket(serverPort, 1, InetAddress.getByName("127.0.0.1"))
                 } else {
                     Log.d(TAG, "Запуск сервера в режиме Wi-Fi на порту $serverPort")
                     ServerSocket(serverPort, 1)
                 }
+                serverSocket = socket
 
                 Log.d(TAG, "Сервер запущен. Ожидание клиента...")
                 withContext(Dispatchers.Main) {
@@ -238,14 +458,23 @@ class MainActivity : AppCompatActivity() {
                     viewBinding.connectionModeSwitch.isEnabled = false
                 }
 
-                clientSocket = serverSocket.accept() // Ждем подключения
+                clientSocket = socket.accept() // Ждем подключения
                 Log.d(TAG, "Клиент подключен: ${clientSocket?.inetAddress?.hostAddress}")
 
                 // --- ИЗМЕНЕНИЯ ЗДЕСЬ ---
-                // Получаем потоки для записи (как раньше) и для чтения
-                outputStream = DataOutputStream(clientSocket?.getOutputStream())
+                // Получаем потоки для записи (буфер - чтобы заголовок и кадр уходили одним блоком) и для чтения
+                val output = DataOutputStream(BufferedOutputStream(clientSocket?.getOutputStream(), OUTPUT_BUFFER_SIZE))
                 // Создаем BufferedReader для удобного чтения строк текста
                 reader = BufferedReader(InputStreamReader(clientSocket?.getInputStream()))
+                // Согласуем версию протокола до отправки первого кадра
+                protocolVersion = negotiateProtocol(clientSocket!!, reader!!, output)
+                frameSequence = 0
+                jpegQuality = DEFAULT_JPEG_QUALITY
+                transportCodec = CODEC_JPEG
+                udpTarget = null
+                udpMessageId = 0
+                encoderResetRequested = true
+                outputStream = output
                 // --- /ИЗМЕНЕНИЯ ЗДЕСЬ ---
 
                 isStreaming = true
@@ -254,49 +483,30 @@ class MainActivity : AppCompatActivity() {
                     updateStatusText()
                 }
 
-                // --- МОДИФИКАЦИЯ ЦИКЛА ---
+                // Команды читаются блокирующим readLine: каждая выполняется сразу по приходу,
+                // а stopStreaming() закрывает сокет, чтобы прервать ожидание.
                 while (isActive && isStreaming) {
-                    // Проверяем, есть ли входящие данные от клиента БЕЗ блокировки
-                    if (reader?.ready() == true) {
-                        try {
-                            val command = reader.readLine() // Читаем строку команды
-                            if (command != null) {
-                                Log.d(TAG, "Получена команда: '$command'")
-                                // Обрабатываем команду
-                                if (command == "CMD:SWITCH_CAM") {
-                                    Log.d(TAG, "Получена команда на переключение камеры")
-                                    // Переключаем камеру в главном потоке
-                                    withContext(Dispatchers.Main) {
-                                        switchCamera()
-                                        // Можно отправить ответ обратно, если нужно
-                                        // outputStream?.writeUTF("STATUS:CAM_SWITCHED\n")
-                                        // outputStream?.flush()
-                                    }
-                                } else {
-                                    Log.w(TAG, "Неизвестная команда: $command")
-                                }
-                            } else {
-                                // readLine() вернул null, возможно, поток закрылся
-                                Log.d(TAG, "readLine вернул null, вероятно, клиент отключился.")
-                                // isStreaming = false // Можно остановить стриминг здесь
-                                break // Выходим из цикла while
-                            }
-                        } catch (e: IOException) {
-                            Log.e(TAG, "Ошибка чтения команды: ${e.message}")
-                            // Ошибка чтения часто означает разрыв соединения
-                            // isStreaming = false // Можно остановить стриминг здесь
-                            break // Выходим из цикла while
-                        }
+                    val line = try {
+                        reader?.readLine()
+                    } catch (e: IOException) {
+                        // Ошибка чтения часто означает разрыв соединения
+                        Log.e(TAG, "Ошибка чтения команды: ${e.message}")
+                        null
+                    }
+                    if (line == null) {
+                        Log.d(TAG, "Поток команд закрыт, вероятно, клиент отключился.")
+                        break
+                    }
+                    Log.d(TAG, "Получена команда: '$line'")
+                    // С протокола v3 команда несет номер ("<команда>@<номер>") и подтверждается
+                    val separator = line.lastIndexOf('@')
+                    val commandId = if (protocolVersion >= 3 && separator > 0) line.substring(separator + 1).toIntOrNull() else null
+                    val command = if (commandId != null) line.substring(0, separator) else line
+                    val result = handleCommand(command)
+                    if (commandId != null) {
+                        sendReply(if (result != null) "ACK:$commandId:$result" else "NAK:$commandId:UNKNOWN")
                     }
-
-                    // Небольшая пауза, чтобы не загружать CPU проверкой reader.ready()
-                    // Можно объединить с delay в конце, но так нагляднее
-                    delay(50) // Проверяем команды каждые 50 мс
-
-                    // Отправка видеокадра идет из ImageAnalyzer, этот цикл только для команд и поддержания активности
-                    // delay(1000) // Убираем или уменьшаем основной delay, т.к. есть delay(50)
                 }
-                // --- /МОДИФИКАЦИЯ ЦИКЛА ---
 
             } catch (e: IOException) {
                 if (isActive) {
@@ -316,6 +526,9 @@ class MainActivity : AppCompatActivity() {
             } finally {
                 Log.d(TAG, "Остановка сервера и стриминга (блок finally)...")
                 isStreaming = false
+                udpTarget = null
+                udpSocket?.close()
+                udpSocket = null
                 try {
                     // Закрываем все ресурсы
                     reader?.close() // <-- Закрываем reader
@@ -329,6 +542,7 @@ class MainActivity : AppCompatActivity() {
                 reader = null // <-- Сбрасываем reader
                 outputStream = null
                 clientSocket = null
+                serverSocket = null
 
                 withContext(Dispatchers.Main) {
                     updateStatusText()
@@ -340,11 +554,133 @@ class MainActivity : AppCompatActivity() {
         }
     }
 
+    // Выполняет команду клиента; возвращает результат для подтверждения или null, если команда неизвестна
+    private suspend fun handleCommand(command: String): String? {
+        if (command == CMD_SWITCH_CAM) {
+            Log.d(TAG, "Получена команда на переключение камеры")
+            // Переключаем камеру в главном потоке
+            withContext(Dispatchers.Main) { switchCamera() }
+            return if (cameraSelector == CameraSelector.DEFAULT_FRONT_CAMERA) "FRONT" else "BACK"
+        } else if (command.startsWith(CMD_QUALITY)) {
+            val quality = command.removePrefix(CMD_QUALITY).toIntOrNull() ?: return null
+            jpegQuality = quality.coerceIn(1, 100)
+            Log.d(TAG, "Качество JPEG: $jpegQuality")
+            return jpegQuality.toString()
+        } else if (command.startsWith(CMD_CODEC)) {
+            transportCodec = when (command.removePrefix(CMD_CODEC)) {
+                "NV21" -> CODEC_NV21
+                "JPEG" -> CODEC_JPEG
+                "H264" -> if (hasH264Encoder()) CODEC_H264 else return null
+                else -> return null
+            }
+            Log.d(TAG, "Кодек кадров: $transportCodec")
+            return command.removePrefix(CMD_CODEC)
+        } else if (command.startsWith(CMD_TRANSPORT)) {
+            val value = command.removePrefix(CMD_TRANSPORT)
+            if (value == TRANSPORT_TCP) {
+                udpTarget = null
+                Log.d(TAG, "Кадры по TCP")
+                return TRANSPORT_TCP
+            }
+            // По USB (adb forward) клиент доступен только через TCP
+            val port = value.removePrefix("$TRANSPORT_UDP:").toIntOrNull()
+            val address = clientSocket?.inetAddress
+            if (isUsbMode || !value.startsWith("$TRANSPORT_UDP:") || port == null || port !in 1..65535 || address == null) {
+                return null
+            }
+            if (udpSocket == null) {
+                udpSocket = DatagramSocket().apply { sendBufferSize = UDP_SEND_BUFFER_SIZE }
+            }
+            udpTarget = InetSocketAddress(address, port)
+            Log.d(TAG, "Кадры по UDP на ${address.hostAddress}:$port")
+            return TRANSPORT_UDP
+        } else if (command == CMD_KEYFRAME) {
+            // Клиент потерял кадр H.264: следующий кадр - ключевой (setParameters можно вызывать из любого потока)
+            try {
+                encoder?.setParameters(Bundle().apply { putInt(MediaCodec.PARAMETER_KEY_REQUEST_SYNC_FRAME, 0) })
+            } catch (e: IllegalStateException) {
+                Log.w(TAG, "Кодер недоступен для запроса ключевого кадра: ${e.message}")
+            }
+            return "OK"
+        } else if (command.startsWith(CMD_MAX_RES)) {
+            val size = command.removePrefix(CMD_MAX_RES).split('x').mapNotNull { it.toIntOrNull() }
+            if (size.size != 2) return null
+            if (Size(size[0], size[1]) != analysisResolution) {
+                Log.d(TAG, "Разрешение анализа: ${size[0]}x${size[1]}")
+                // Перепривязываем камеру с новым разрешением в главном потоке
+                withContext(Dispatchers.Main) {
+                    analysisResolution = Size(size[0], size[1])
+                    startCamera()
+                }
+            }
+            return "${size[0]}x${size[1]}"
+        }
+        Log.w(TAG, "Неизвестная команда: $command")
+        return null
+    }
+
+    // Ответ на команду (протокол v3): служебное сообщение в потоке кадров, номер кадра не расходуется
+    private fun sendReply(text: String) {
+        val data = text.toByteArray(Charsets.UTF_8)
+        try {
+            val stream = outputStream ?: return
+            synchronized(outputLock) {
+                stream.writeShort(FRAME_HEADER_V2_SIZE)
+                stream.writeInt(data.size)
+                stream.writeInt(0)
+                stream.writeLong(SystemClock.elapsedRealtimeNanos() / 1000)
+                stream.writeByte(CODEC_CONTROL)
+                stream.writeByte(CAMERA_BACK)
+                stream.writeShort(0)
+                stream.writeShort(0)
+                stream.write(data)
+                stream.flush()
+            }
+        } catch (e: IOException) {
+            Log.e(TAG, "Ошибка отправки ответа: ${e.message}")
+        }
+    }
+
+    // Ждет от клиента приветствие "HELLO:<версия>". Новый клиент шлет его сразу после подключения,
+    // старый - молчит, и тогда через HELLO_TIMEOUT_MS работаем по протоколу v1.
+    private fun negotiateProtocol(socket: Socket, reader: BufferedReader, output: DataOutputStream): Int {
+        socket.soTimeout = HELLO_TIMEOUT_MS
+        try {
+            val line = reader.readLine() ?: return 1
+            if (!line.startsWith(HELLO_PREFIX)) {
+                Log.w(TAG, "Ожидалось приветствие, получено: '$line'")
+                return 1
+            }
+            val requested = line.removePrefix(HELLO_PREFIX).trim().toIntOrNull() ?: 1
+            val version = minOf(requested, PROTOCOL_VERSION)
+            if (version >= 2) {
+                output.write(HANDSHAKE_MAGIC)
+                output.writeShort(version)
+                output.writeLong(SystemClock.elapsedRealtimeNanos() / 1000) // мкс, те же часы, что у кадров
+                output.flush()
+            }
+            Log.d(TAG, "Протокол v$version")
+            return version
+        } catch (e: SocketTimeoutException) {
+            Log.d(TAG, "Клиент не прислал приветствие - протокол v1")
+            return 1
+        } finally {
+            socket.soTimeout = 0
+        }
+    }
+
     private fun stopStreaming() {
         if (serverJob?.isActive == true) { // Проверяем Job, а не isStreaming, чтобы точно отменить
             Log.d(TAG, "Запрос на остановку стриминга и сервера...")
             isStreaming = false // Сбрасываем флаг немедленно
             serverJob?.cancel() // Отменяем корутину сервера (запустит finally)
+            // Закрытие сокетов прерывает блокирующие accept() и readLine() - иначе отмена ждала бы их
+            try {
+                clientSocket?.close()
+                serverSocket?.close()
+            } catch (e: IOException) {
+                Log.e(TAG, "Ошибка при закрытии сокета: ${e.message}")
+            }
             // UI обновится в блоке finally корутины startServer
         } else {
             Log.d(TAG, "Сервер уже был остановлен или не запущен.")
@@ -418,6 +754,7 @@ class MainActivity : AppCompatActivity() {
         super.onDestroy()
         Log.d(TAG, "onDestroy вызван")
         stopStreaming() // Останавливаем сервер и стриминг
+        cameraExecutor.execute { stopEncoder() } // Кодер принадлежит потоку анализатора
         cameraExecutor.shutdown() // Останавливаем исполнителя камеры
         Log.d(TAG, "Активити уничтожено")
     }
@@ -425,6 +762,42 @@ class MainActivity : AppCompatActivity() {
     companion object {
         private const val TAG = "PhoneAsWebcam"
         private const val REQUEST_CODE_PERMISSIONS = 10
+
+        // Протокол передачи кадров (см. PhoneAsCamera_Server/protocol.py)
+        private const val PROTOCOL_VERSION = 3
+        private const val HELLO_PREFIX = "HELLO:"
+        private const val HELLO_TIMEOUT_MS = 1000
+        private val HANDSHAKE_MAGIC = "PACV".toByteArray(Charsets.US_ASCII)
+        private const val FRAME_HEADER_V2_SIZE = 24
+        private const val CODEC_CONTROL = 0
+        private const val CODEC_JPEG = 1
+        private const val CODEC_NV21 = 2
+        private const val CODEC_H264 = 3
+        private const val CMD_CODEC = "CMD:CODEC="
+        private const val CMD_KEYFRAME = "CMD:KEYFRAME"
+        // Кодер H.264: ~2.8 Мбит/с для 720p30, ключевой кадр раз в 2 с (и по CMD:KEYFRAME)
+        private const val H264_FRAME_RATE = 30
+        private const val H264_BITS_PER_PIXEL = 0.1
+        private const val H264_KEYFRAME_INTERVAL_S = 2
+        private const val ENCODER_TIMEOUT_US = 10_000L
+        private const val CAMERA_BACK = 0
+        private const val CAMERA_FRONT = 1
+        private const val OUTPUT_BUFFER_SIZE = 64 * 1024
+        // Транспорт UDP: фрагменты кадра по UDP_FRAGMENT_SIZE байт (датаграмма помещается в MTU 1500)
+        private const val CMD_TRANSPORT = "CMD:TRANSPORT="
+        private const val TRANSPORT_TCP = "TCP"
+        private const val TRANSPORT_UDP = "UDP"
+        private val FRAGMENT_MAGIC = "PF".toByteArray(Charsets.US_ASCII)
+        private const val FRAGMENT_HEADER_SIZE = 18
+        private const val UDP_FRAGMENT_SIZE = 1400
+        private const val UDP_SEND_BUFFER_SIZE = 1024 * 1024
+
+        // Адаптация качества по командам клиента (см. PhoneAsCamera_Server/quality_controller.py)
+        private const val CMD_SWITCH_CAM = "CMD:SWITCH_CAM"
+        private const val CMD_QUALITY = "CMD:QUALITY="
+        private const val CMD_MAX_RES = "CMD:MAX_RES="
+        private const val DEFAULT_JPEG_QUALITY = 50
+        private val DEFAULT_RESOLUTION = Size(1280, 720)
         // Добавляем ACCESS_WIFI_STATE в список обязательных разрешений
         private val REQUIRED_PERMISSIONS =
             mutableListOf(